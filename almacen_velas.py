@@ -0,0 +1,241 @@
+# almacen_velas.py
+import asyncio
+import time
+import threading
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config import INTERVALO_SEGUNDOS
+from indicadores import MotorIndicadores
+
+COLUMNAS_OHLCV = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+class BufferVelas:
+    """
+    Buffer circular de tamaño fijo con las últimas velas de un símbolo/intervalo.
+    Cada fila es [timestamp, open, high, low, close, volume].
+    """
+
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.datos = np.zeros((capacidad, len(COLUMNAS_OHLCV)), dtype=np.float64)
+        self.inicio = 0   # Índice de la vela más antigua
+        self.n = 0        # Velas almacenadas
+
+    def vaciar(self):
+        self.inicio = 0
+        self.n = 0
+
+    def ultimo_timestamp(self):
+        if self.n == 0:
+            return None
+        return int(self.datos[(self.inicio + self.n - 1) % self.capacidad, 0])
+
+    def ultimo_cierre(self):
+        return float(self.datos[(self.inicio + self.n - 1) % self.capacidad, 4])
+
+    def ultima(self):
+        """Última vela (la que está en formación) como [timestamp, open, high, low, close, volume]"""
+        return self.datos[(self.inicio + self.n - 1) % self.capacidad]
+
+    def agregar(self, fila):
+        """Añade una vela al final (sobrescribe la más antigua si está lleno)"""
+        if self.n < self.capacidad:
+            self.datos[(self.inicio + self.n) % self.capacidad] = fila
+            self.n += 1
+        else:
+            self.datos[self.inicio] = fila
+            self.inicio = (self.inicio + 1) % self.capacidad
+
+    def reemplazar_ultima(self, fila):
+        """Actualiza la vela en formación"""
+        self.datos[(self.inicio + self.n - 1) % self.capacidad] = fila
+
+    def como_array(self, limit=None):
+        """Devuelve una copia en orden cronológico de las últimas 'limit' velas"""
+        n = self.n if limit is None else min(limit, self.n)
+        indices = (self.inicio + self.n - n + np.arange(n)) % self.capacidad
+        return self.datos[indices]
+
+
+class AlmacenVelas:
+    """
+    Almacén incremental de velas OHLCV por símbolo/intervalo.
+
+    La primera consulta descarga 'capacidad' velas; las siguientes solo piden
+    las velas desde el último timestamp almacenado (que incluye la vela en
+    formación) y rellenan los huecos que detectan.
+
+    Cada buffer lleva un MotorIndicadores al que se entrega cada vela en cuanto
+    se cierra (al llegar la siguiente): 'indicadores' da los de la vela en
+    formación en tiempo constante y los oyentes de cierre se avisan tras cada
+    actualización que cerró alguna vela.
+    """
+
+    def __init__(self, client, capacidad=100):
+        self.client = client
+        self.capacidad = capacidad
+        self._buffers = {}
+        self._motores = {}
+        self._locks = {}
+        self._lock_global = threading.Lock()
+        self._oyentes_cierre = []
+
+    def _lock_para(self, clave):
+        with self._lock_global:
+            if clave not in self._locks:
+                self._locks[clave] = threading.Lock()
+                self._buffers[clave] = BufferVelas(self.capacidad)
+                self._motores[clave] = MotorIndicadores()
+            return self._locks[clave]
+
+    def agregar_oyente_cierre(self, funcion):
+        """Registra funcion(symbol, interval), llamada cuando una actualización cierra velas del símbolo"""
+        self._oyentes_cierre.append(funcion)
+
+    def _avisar_cierre(self, symbol, interval):
+        for funcion in self._oyentes_cierre:
+            try:
+                funcion(symbol, interval)
+            except Exception as e:
+                logging.error(f"Error en oyente de cierre de vela ({symbol}): {e}", exc_info=True)
+
+    def _peticion(self, buffer, interval):
+        """(limit, start_time) de la descarga necesaria para poner al día el buffer"""
+        paso_ms = INTERVALO_SEGUNDOS.get(interval, 60) * 1000
+        ultimo_ts = buffer.ultimo_timestamp()
+        ahora_ms = int(time.time() * 1000)
+        # Sin datos, o el hueco es mayor que el buffer: descarga completa
+        if ultimo_ts is None or ahora_ms - ultimo_ts >= self.capacidad * paso_ms:
+            return self.capacidad, None
+        # Incremental: desde la última vela almacenada (se re-descarga porque puede estar en formación)
+        return None, ultimo_ts
+
+    def _aplicar(self, clave, velas, completa):
+        """Incorpora las velas descargadas; devuelve (hay datos, se cerró alguna vela)"""
+        buffer, motor = self._buffers[clave], self._motores[clave]
+        cerradas = 0
+        if velas:
+            if completa:
+                buffer.vaciar()
+                motor.reiniciar()
+            cerradas = self._incorporar(buffer, motor, velas, INTERVALO_SEGUNDOS.get(clave[1], 60) * 1000)
+        return buffer.n > 0, cerradas > 0
+
+    def actualizar(self, symbol, interval='1m'):
+        """
+        Sincroniza el buffer del símbolo con el exchange
+        
+        Args:
+            symbol (str): Símbolo del activo
+            interval (str): Intervalo temporal ('1m', '5m', etc.)
+            
+        Returns:
+            bool: True si el buffer tiene datos tras la actualización
+        """
+        clave = (symbol, interval)
+        with self._lock_para(clave):
+            limit, start_time = self._peticion(self._buffers[clave], interval)
+            velas = self.client.get_ohlcv(symbol, interval, limit, start_time=start_time)
+            hay_datos, cerrada = self._aplicar(clave, velas, completa=start_time is None)
+        if cerrada:
+            self._avisar_cierre(symbol, interval)
+        return hay_datos
+
+    async def actualizar_lote(self, cliente_async, symbols, interval='1m'):
+        """
+        Sincroniza varios símbolos a la vez con un AsyncHyperliquidClient (asyncio.gather)
+        
+        Returns:
+            list: bool por símbolo, en el orden de 'symbols'
+        """
+        peticiones = []
+        for symbol in symbols:
+            clave = (symbol, interval)
+            with self._lock_para(clave):
+                peticiones.append(self._peticion(self._buffers[clave], interval))
+
+        descargas = await asyncio.gather(
+            *(cliente_async.get_ohlcv(symbol, interval, limit, start_time=start_time)
+              for symbol, (limit, start_time) in zip(symbols, peticiones)),
+            return_exceptions=True
+        )
+
+        resultados = []
+        for symbol, (_, start_time), velas in zip(symbols, peticiones, descargas):
+            if isinstance(velas, Exception):
+                logging.error(f"Error descargando velas de {symbol}: {velas}")
+                velas = None
+            clave = (symbol, interval)
+            with self._lock_para(clave):
+                hay_datos, cerrada = self._aplicar(clave, velas, completa=start_time is None)
+            resultados.append(hay_datos)
+            if cerrada:
+                self._avisar_cierre(symbol, interval)
+        return resultados
+
+    @staticmethod
+    def _agregar(buffer, motor, fila):
+        """Añade una vela nueva: la que estaba en formación queda cerrada y pasa al motor"""
+        if buffer.n:
+            ts, _, high, low, close, volume = buffer.ultima()
+            motor.cerrar_vela(ts, high, low, close, volume)
+        buffer.agregar(fila)
+
+    def _incorporar(self, buffer, motor, velas, paso_ms):
+        """Devuelve el número de velas cerradas por esta actualización"""
+        cerradas = 0
+        for vela in velas:
+            ts = int(vela['timestamp'])
+            fila = (ts, vela['open'], vela['high'], vela['low'], vela['close'], vela['volume'])
+            ultimo_ts = buffer.ultimo_timestamp()
+
+            if ultimo_ts is None or ts > ultimo_ts:
+                # Rellenar huecos (minutos sin velas) con velas planas al último cierre
+                if ultimo_ts is not None and ts - ultimo_ts > paso_ms:
+                    faltantes = (ts - ultimo_ts) // paso_ms - 1
+                    logging.info(f"Hueco de {faltantes} velas detectado antes de {ts}, se rellena")
+                    cierre = buffer.ultimo_cierre()
+                    for k in range(1, int(min(faltantes, buffer.capacidad)) + 1):
+                        self._agregar(buffer, motor, (ultimo_ts + k * paso_ms, cierre, cierre, cierre, cierre, 0.0))
+                        cerradas += 1
+                cerradas += buffer.n > 0
+                self._agregar(buffer, motor, fila)
+            elif ts == ultimo_ts:
+                buffer.reemplazar_ultima(fila)
+            # Velas anteriores a la última almacenada ya están en el buffer
+        return cerradas
+
+    def obtener_array(self, symbol, interval='1m', limit=None):
+        """Devuelve las velas como array (n, 6) en orden cronológico, o None si no hay datos"""
+        clave = (symbol, interval)
+        with self._lock_para(clave):
+            buffer = self._buffers[clave]
+            if buffer.n == 0:
+                return None
+            return buffer.como_array(limit)
+
+    def indicadores(self, symbol, interval='1m', vol_mult=1.0):
+        """
+        Indicadores de la vela en formación (ver MotorIndicadores.valores) sin recorrer
+        el histórico, o None si no hay datos
+        """
+        clave = (symbol, interval)
+        with self._lock_para(clave):
+            buffer = self._buffers[clave]
+            if buffer.n == 0:
+                return None
+            _, _, high, low, close, volume = buffer.ultima()
+            return self._motores[clave].valores(high, low, close, volume, vol_mult)
+
+    def obtener_dataframe(self, symbol, interval='1m', limit=None):
+        """Devuelve las velas como DataFrame con las columnas de get_ohlcv, o None si no hay datos"""
+        datos = self.obtener_array(symbol, interval, limit)
+        if datos is None:
+            return None
+        df = pd.DataFrame(datos, columns=COLUMNAS_OHLCV)
+        df['timestamp'] = df['timestamp'].astype(np.int64)
+        return df
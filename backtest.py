@@ -0,0 +1,309 @@
+# backtest.py
+"""
+Backtest de la estrategia microestructura v2 sobre velas de 1m almacenadas.
+
+Reproduce las mismas reglas que el bot en vivo:
+  - Señal de entrada de senales.calcular_senales (ruptura + EMA30 + spike de volumen)
+    y filtro de volatilidad extrema de estrategia.py.
+  - TP de calcular_tp_atr sobre el precio de entrada (o el promedio tras cada DCA).
+  - DCA de evaluar_dca/ejecutar_dca: pérdida fija DCA_MAX_LOSS_PCT sobre el precio
+    medio, tamaño = tamaño original * DCA_SIZE_MULTIPLIER, separación mínima
+    DCA_MIN_TIME_BETWEEN y máximo DCA_MAX_ENTRIES.
+
+Las señales se calculan de una vez para todos los símbolos y velas (con --incremental
+los indicadores salen de MotorIndicadores vela a vela, como en vivo). El seguimiento
+de posiciones salta de evento en evento (entrada, DCA, TP) buscando sobre los
+arrays, sin recorrer las velas una a una en Python. Cada símbolo se simula de
+forma independiente: el cooldown global y la regla de una apertura por ciclo
+del bot no se modelan.
+
+Uso:
+    python backtest.py --datos historico_1m.npz --salida backtest_pnl.csv
+    python backtest.py --descargar BTC,ETH,SOL --datos historico_1m.npz
+    python backtest.py --datos historico_1m.npz --incremental
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import config
+import estrategia
+from indicadores import COL_OPEN, COL_HIGH, COL_LOW, COL_CLOSE, calcular_indicadores_incrementales
+from senales import calcular_senales, vector_parametros, SIN_SENAL, LONG
+
+# Mismas columnas que pnl_history.csv (más el número de DCA de cada operación)
+COLUMNAS_HISTORIAL = [
+    "timestamp", "symbol", "direccion", "precio_entrada", "precio_salida",
+    "tp", "pnl_real", "tiempo_abierto", "razon_cierre"
+]
+
+PARAMETROS_DEFECTO = {
+    "atr_tp_mult": config.ATR_TP_MULT,
+    "max_tp_pct": config.MAX_TP_PCT,
+    "dca_enabled": config.DCA_ENABLED,
+    "dca_max_loss_pct": config.DCA_MAX_LOSS_PCT,
+    "dca_max_entries": config.DCA_MAX_ENTRIES,
+    "dca_size_multiplier": config.DCA_SIZE_MULTIPLIER,
+    "dca_min_time_between": config.DCA_MIN_TIME_BETWEEN,
+    "volatility_window": estrategia.VOLATILITY_WINDOW,
+    "volatility_umbral": estrategia.VOLATILITY_UMBRAL,
+    "breakout_mult": estrategia.BREAKOUT_ATR_MULT_POR_SIMBOLO,
+    "vol_mult": estrategia.MULTIPLICADOR_VOL_POR_SIMBOLO,
+    "leverage": config.LEVERAGE,
+    "margin_per_trade": config.MARGIN_PER_TRADE,
+    "comision": 0.0,   # Por lado sobre el nocional (el PnL del bot en vivo es el unrealizedPnl, sin comisiones)
+}
+
+
+# ----------------------------------------------------------------------
+# Datos
+# ----------------------------------------------------------------------
+def guardar_historico(ruta, simbolos, timestamps, velas):
+    """Guarda una matriz de velas alineadas (símbolos, velas, 5) en formato .npz"""
+    np.savez(ruta, simbolos=np.array(simbolos), timestamps=timestamps, velas=velas)
+
+
+def cargar_historico(ruta):
+    """
+    Carga un histórico guardado con guardar_historico
+
+    Returns:
+        tuple: (simbolos, timestamps, velas) con velas de forma (símbolos, velas, 5)
+    """
+    with np.load(ruta) as datos:
+        return [str(s) for s in datos["simbolos"]], datos["timestamps"], datos["velas"]
+
+
+def alinear_velas(velas_por_simbolo, interval="1m"):
+    """
+    Alinea listas de velas (formato get_ohlcv) de varios símbolos en una sola rejilla temporal.
+
+    Se usa el tramo común a todos los símbolos; los minutos sin vela se rellenan
+    con una vela plana al último cierre y volumen 0 (igual que AlmacenVelas),
+    también al principio del tramo si un símbolo no tiene vela justo en el inicio.
+
+    Returns:
+        tuple: (simbolos, timestamps, velas)
+    """
+    paso = config.INTERVALO_SEGUNDOS.get(interval, 60) * 1000
+    simbolos = [s for s, velas in velas_por_simbolo.items() if velas]
+    inicio = max(int(velas_por_simbolo[s][0]["timestamp"]) for s in simbolos)
+    fin = min(int(velas_por_simbolo[s][-1]["timestamp"]) for s in simbolos)
+    timestamps = np.arange(inicio, fin + paso, paso, dtype=np.int64)
+
+    matriz = np.full((len(simbolos), len(timestamps), 5), np.nan)
+    for i, symbol in enumerate(simbolos):
+        filas = np.array([(v["timestamp"], v["open"], v["high"], v["low"], v["close"], v["volume"])
+                          for v in velas_por_simbolo[symbol]], dtype=np.float64)
+        j = ((filas[:, 0] - inicio) // paso).astype(np.int64)
+        validas = (j >= 0) & (j < len(timestamps))
+        matriz[i, j[validas]] = filas[validas, 1:]
+        # Rellenar huecos hacia delante; un hueco inicial (sin vela justo en 'inicio') se
+        # rellena con el último cierre anterior a 'inicio' de ese símbolo
+        falta = np.isnan(matriz[i, :, COL_CLOSE])
+        if falta.any():
+            previas = filas[j < 0]
+            semilla = previas[-1, 4] if len(previas) else np.nan
+            cierre = pd.Series(matriz[i, :, COL_CLOSE]).ffill().fillna(semilla).to_numpy()
+            matriz[i, falta, :4] = cierre[falta, None]
+            matriz[i, falta, 4] = 0.0
+    return simbolos, timestamps, matriz
+
+
+def descargar_historico(client, simbolos, interval="1m", limit=5000):
+    """Descarga las últimas 'limit' velas de cada símbolo y las alinea (el exchange solo sirve las 5000 más recientes)"""
+    velas_por_simbolo = {}
+    for symbol in simbolos:
+        velas = client.get_ohlcv(symbol, interval, limit)
+        if velas:
+            velas_por_simbolo[symbol] = velas
+            print(f"[{symbol}] {len(velas)} velas descargadas")
+        else:
+            print(f"[{symbol}] Sin datos históricos")
+    return alinear_velas(velas_por_simbolo, interval)
+
+
+# ----------------------------------------------------------------------
+# Simulación
+# ----------------------------------------------------------------------
+def _primer_indice(serie, desde, umbral, mayor_igual):
+    """Primer índice >= desde en el que la serie cruza el umbral, o None (búsqueda por bloques crecientes)"""
+    n = len(serie)
+    bloque = 256
+    while desde < n:
+        hasta = min(n, desde + bloque)
+        trozo = serie[desde:hasta]
+        cruces = trozo >= umbral if mayor_igual else trozo <= umbral
+        if cruces.any():
+            return desde + int(cruces.argmax())
+        desde = hasta
+        bloque *= 4
+    return None
+
+
+def _formatear_duracion(ms):
+    return str(timedelta(milliseconds=int(ms))).split('.')[0]
+
+
+def _simular_simbolo(symbol, velas, timestamps, accion, atr, p, paso_ms):
+    apertura, high, low, close = velas[:, COL_OPEN], velas[:, COL_HIGH], velas[:, COL_LOW], velas[:, COL_CLOSE]
+    n = len(close)
+    indices_senal = np.flatnonzero(accion != SIN_SENAL)
+    separacion_dca = int(np.ceil(p["dca_min_time_between"] * 60000 / paso_ms))
+    nocional = p["leverage"] * p["margin_per_trade"]
+    operaciones = []
+
+    desde = 0
+    while True:
+        k = np.searchsorted(indices_senal, desde)
+        if k >= len(indices_senal) or indices_senal[k] >= n - 1:
+            break
+        t = int(indices_senal[k])
+        es_long = accion[t] == LONG
+        direccion = "BUY" if es_long else "SELL"
+
+        entrada = close[t]
+        tamano_original = nocional / entrada
+        tamano_total = tamano_original
+        precio_promedio = entrada
+        nocional_operado = nocional
+        tp = estrategia.calcular_tp_atr(precio_promedio, atr[t], direccion,
+                                        atr_tp_mult=p["atr_tp_mult"], max_tp_pct=p["max_tp_pct"])
+        num_dca = 0
+        ultimo_dca = None
+        cursor = t + 1
+
+        while True:
+            i_tp = _primer_indice(high if es_long else low, cursor, tp, es_long)
+
+            i_dca = None
+            if p["dca_enabled"] and num_dca < p["dca_max_entries"]:
+                umbral_dca = precio_promedio * (1 - p["dca_max_loss_pct"] if es_long else 1 + p["dca_max_loss_pct"])
+                desde_dca = cursor if ultimo_dca is None else max(cursor, ultimo_dca + separacion_dca)
+                i_dca = _primer_indice(low if es_long else high, desde_dca, umbral_dca, not es_long)
+
+            # Si DCA y TP caen en la misma vela se asume primero el movimiento adverso
+            if i_dca is not None and (i_tp is None or i_dca <= i_tp):
+                precio_dca = min(apertura[i_dca], umbral_dca) if es_long else max(apertura[i_dca], umbral_dca)
+                tamano_dca = tamano_original * p["dca_size_multiplier"]
+                precio_promedio = (precio_promedio * tamano_total + precio_dca * tamano_dca) / (tamano_total + tamano_dca)
+                tamano_total += tamano_dca
+                nocional_operado += precio_dca * tamano_dca
+                tp = estrategia.calcular_tp_atr(precio_promedio, atr[i_dca], direccion,
+                                                atr_tp_mult=p["atr_tp_mult"], max_tp_pct=p["max_tp_pct"])
+                num_dca += 1
+                ultimo_dca = i_dca
+                cursor = i_dca + 1
+                continue
+
+            if i_tp is not None:
+                # La orden límite se ejecuta al TP, o mejor si la vela abre más allá
+                salida = max(apertura[i_tp], tp) if es_long else min(apertura[i_tp], tp)
+                i_salida, razon = i_tp, "tp_alcanzado"
+            else:
+                salida = close[n - 1]
+                i_salida, razon = n - 1, "fin_datos"
+
+            signo = 1 if es_long else -1
+            pnl = (salida - precio_promedio) * tamano_total * signo
+            pnl -= p["comision"] * (nocional_operado + salida * tamano_total)
+            operaciones.append((
+                datetime.fromtimestamp(timestamps[i_salida] / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+                symbol, direccion, precio_promedio, salida, tp, pnl,
+                _formatear_duracion(timestamps[i_salida] - timestamps[t]), razon, num_dca
+            ))
+            desde = i_salida + 1
+            break
+
+    return operaciones
+
+
+def ejecutar_backtest(velas, timestamps, simbolos, parametros=None, senales=None, incremental=False):
+    """
+    Ejecuta el backtest sobre una matriz de velas alineadas
+
+    Args:
+        velas (np.ndarray): Matriz (símbolos, velas, 5) con open, high, low, close, volume
+        timestamps (np.ndarray): Timestamps en ms de cada vela
+        simbolos (list): Símbolos en el orden de las filas de 'velas'
+        parametros (dict, optional): Sobrescribe valores de PARAMETROS_DEFECTO
+        senales (dict, optional): Resultado de calcular_senales ya calculado con los mismos multiplicadores
+        incremental (bool): Indicadores de MotorIndicadores (el motor del bot en vivo) en lugar
+                            del cálculo matricial; el resultado es el mismo, más lento
+
+    Returns:
+        pd.DataFrame: Operaciones con las columnas de pnl_history.csv más 'num_dca'
+    """
+    p = dict(PARAMETROS_DEFECTO)
+    p.update(parametros or {})
+
+    if senales is None:
+        senales = calcular_senales(
+            velas,
+            vector_parametros(simbolos, p["breakout_mult"], 0.1),
+            vector_parametros(simbolos, p["vol_mult"], 1.0),
+            indicadores=calcular_indicadores_incrementales(velas) if incremental else None
+        )
+    accion = senales["accion"].copy()
+
+    # Filtro de volatilidad extrema (detectar_volatilidad_extrema) para todas las velas a la vez
+    close = velas[:, :, COL_CLOSE]
+    ventana = p["volatility_window"]
+    movimiento = np.zeros_like(close)
+    movimiento[:, ventana:] = np.abs(close[:, ventana:] - close[:, :-ventana]) / close[:, :-ventana]
+    accion[movimiento > p["volatility_umbral"]] = SIN_SENAL
+
+    paso_ms = int(timestamps[1] - timestamps[0]) if len(timestamps) > 1 else 60000
+    operaciones = []
+    for i, symbol in enumerate(simbolos):
+        operaciones.extend(_simular_simbolo(symbol, velas[i], timestamps, accion[i], senales["atr"][i], p, paso_ms))
+
+    return pd.DataFrame(operaciones, columns=COLUMNAS_HISTORIAL + ["num_dca"])
+
+
+def resumir_resultados(operaciones):
+    """PnL total, tasa de acierto, tiempo medio abierto y número de DCA de un backtest"""
+    if operaciones.empty:
+        return {"operaciones": 0, "pnl_total": 0.0, "win_rate": 0.0,
+                "tiempo_medio_min": 0.0, "num_dca": 0, "max_dca": 0}
+    duraciones = pd.to_timedelta(operaciones["tiempo_abierto"])
+    return {
+        "operaciones": int(len(operaciones)),
+        "pnl_total": float(operaciones["pnl_real"].sum()),
+        "win_rate": float((operaciones["pnl_real"] > 0).mean()),
+        "tiempo_medio_min": float(duraciones.dt.total_seconds().mean() / 60),
+        "num_dca": int(operaciones["num_dca"].sum()),
+        "max_dca": int(operaciones["num_dca"].max()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest de la estrategia microestructura v2")
+    parser.add_argument("--datos", default="historico_1m.npz", help="Archivo .npz con las velas")
+    parser.add_argument("--descargar", help="Símbolos separados por comas a descargar antes del backtest")
+    parser.add_argument("--salida", default="backtest_pnl.csv", help="CSV de operaciones (formato pnl_history.csv)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Indicadores vela a vela con MotorIndicadores (el motor del bot en vivo)")
+    args = parser.parse_args()
+
+    if args.descargar:
+        from hyperliquid_client import HyperliquidClient
+        simbolos, timestamps, velas = descargar_historico(HyperliquidClient(), args.descargar.split(","))
+        guardar_historico(args.datos, simbolos, timestamps, velas)
+
+    simbolos, timestamps, velas = cargar_historico(args.datos)
+    print(f"Backtest sobre {len(simbolos)} símbolos x {len(timestamps)} velas")
+
+    inicio = time.perf_counter()
+    operaciones = ejecutar_backtest(velas, timestamps, simbolos, incremental=args.incremental)
+    duracion = time.perf_counter() - inicio
+
+    operaciones.to_csv(args.salida, index=False)
+    resumen = resumir_resultados(operaciones)
+    print(f"Operaciones: {resumen['operaciones']} | PnL total: {resumen['pnl_total']:.2f} USDT | "
+          f"Win rate: {resumen['win_rate']*100:.1f}% | Tiempo medio: {resumen['tiempo_medio_min']:.1f} min | "
+          f"DCA: {resumen['num_dca']} (máx {resumen['max_dca']} por operación)")
+    print(f"Backtest completado en {duracion:.2f} s. Operaciones guardadas en {args.salida}")
@@ -23,3 +23,79 @@ DCA_MAX_ENTRIES = 999        # Sin límite práctico de entradas DCA
 DCA_SIZE_MULTIPLIER = 1.0    # Mismo tamaño que la entrada original
 DCA_MIN_TIME_BETWEEN = 1440  # 24 horas (1440 minutos) entre entradas DCA
 DCA_MAX_TOTAL_SIZE_MULT = 999.0  # Sin límite efectivo
+
+# Streaming de datos de mercado por WebSocket (l2Book / allMids)
+WS_ENABLED = True
+WS_URL = "ws" + API_URL[len("http"):] + "/ws"
+WS_MAX_STALENESS_SEC = 5     # Antigüedad máxima del libro en memoria antes de recurrir a REST
+
+# Grabación y reproducción de sesiones (peticiones REST y mensajes WebSocket)
+SESION_MODO = None                 # None, "grabar" o "reproducir" (sin red)
+SESION_ARCHIVO = "sesion.jsonl.gz"
+SESION_VELOCIDAD = None            # Al reproducir: 1.0 = ritmo real, 10 = 10x, None = sin esperas
+
+# Antigüedad máxima (segundos) del snapshot de cuenta compartido (user_state)
+ACCOUNT_SNAPSHOT_TTL_SEC = 8
+
+# Cierre de posiciones: la respuesta de la orden IOC confirma el llenado; si es ambigua
+# se esperan los fills del WebSocket (o orderStatus) como mucho CIERRE_PLAZO_SEC
+CIERRE_PLAZO_SEC = 5
+CIERRE_REINTENTOS = 3
+
+# Estado del bot en memoria: cada cuánto se vuelcan a estado_bot.db los símbolos modificados
+ESTADO_VOLCADO_SEC = 1.0
+
+# Diario de eventos (aperturas, TP, DCA, cierres, saldo): pnl_history.csv, dca_history.csv
+# y ultimo_saldo.txt se derivan de él. Snapshot del estado cada DIARIO_SNAPSHOT_EVENTOS eventos
+DIARIO_ARCHIVO = "eventos.journal"
+DIARIO_SNAPSHOT_EVENTOS = 500
+DIARIO_FSYNC = False               # True: fsync por evento (más seguro ante cortes de luz, más lento)
+
+# Historial en Parquet particionado por día (requiere pyarrow; sin él el panel lee los CSV)
+HISTORIAL_DIRECTORIO = "historial"
+HISTORIAL_SINCRONIZAR_SEC = 60     # Eventos nuevos del diario -> partes Parquet del día
+HISTORIAL_COMPACTAR_SEC = 3600     # Une las partes de los días cerrados en un solo archivo
+
+# Duración de cada intervalo de vela en segundos
+INTERVALO_SEGUNDOS = {
+    "1m": 60, "5m": 300, "15m": 900, "30m": 1800,
+    "1h": 3600, "4h": 14400, "1d": 86400
+}
+
+# Velas que se mantienen en memoria por símbolo/intervalo (almacén incremental)
+VELAS_CAPACIDAD = 100
+
+# Planificador de tareas (segundos)
+ENTRADAS_ADELANTO_CIERRE_SEC = 3   # Evaluar entradas justo antes del cierre de cada vela de 1m
+ENTRADAS_INTERVALO_MIN_SEC = 5     # Separación mínima entre escaneos completos disparados fuera del cierre de vela
+UMBRALES_RETRASO_CIERRE_SEC = 1    # Tras cada cierre de vela de 1m, recalcular los umbrales de ruptura de la nueva vela
+MANTENIMIENTO_TP_SEC = 10          # Órdenes TP pendientes y cierre local de respaldo
+MANTENIMIENTO_DCA_SEC = 60
+MANTENIMIENTO_HUERFANAS_SEC = 3600
+SALDO_SEC = 30
+REEVALUACION_CHEQUEO_SEC = 60      # Cada cuánto se comprueba si toca reevaluar símbolos
+ESTADISTICAS_HTTP_SEC = 600        # Resumen de reutilización de conexiones HTTP
+
+# Hilos para la I/O concurrente por símbolo en el escaneo de entradas
+# (no superar HTTP_POOL_SIZE, el tamaño del pool de conexiones por host)
+MAX_WORKERS_ESCANEO = 8
+
+# Universo de perpetuos (metaAndAssetCtxs), ordenado por volumen diario
+MAX_SIMBOLOS = 20               # None = todos los perpetuos listados
+MIN_VOLUMEN_24H_USD = 100000    # Volumen nocional mínimo en 24 h para operar un símbolo
+
+# Cliente asyncio (aiohttp): conexiones simultáneas y timeout por petición
+ASYNC_POOL_SIZE = 32
+ASYNC_TIMEOUT_SEC = 10
+
+# Transporte HTTP compartido (requests): conexiones keep-alive por host y timeouts
+HTTP_POOL_SIZE = 16            # Conexiones simultáneas por host
+HTTP_POOL_HOSTS = 4            # Hosts con pool propio (API de Hyperliquid, Telegram...)
+HTTP_TIMEOUT_CONEXION = 3.05
+HTTP_TIMEOUT_LECTURA = 10
+
+# Límite de peso REST de Hyperliquid (por IP) y limitador del cliente
+RATE_LIMIT_PESO_MINUTO = 1200
+RATE_LIMIT_MARGEN = 0.9               # Se usa el 90% del límite para no rozarlo
+RATE_LIMIT_RESERVA_ORDENES = 0.1      # Fracción del cubo que las lecturas no pueden consumir
+RATE_LIMIT_RECUPERACION_SEC = 300     # Tiempo para recuperar el ritmo completo tras un 429
@@ -0,0 +1,331 @@
+# diario.py
+import atexit
+import csv
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+import logging
+from datetime import datetime
+
+ARCHIVO_DIARIO = "eventos.journal"
+
+# Trama: firma, versión, código de tipo, longitud del contenido, CRC32 del contenido, instante (epoch)
+FIRMA = b"EV"
+VERSION = 1
+CABECERA = struct.Struct("<2sBBIId")
+
+TIPOS = {"abierta": 1, "tp_colocado": 2, "dca": 3, "cerrada": 4, "saldo": 5}
+NOMBRES_TIPO = {codigo: nombre for nombre, codigo in TIPOS.items()}
+
+
+def estado_inicial():
+    return {"secuencia": 0, "abiertas": {}, "saldo": None, "trades_cerrados": 0, "pnl_total": 0.0, "filas": {}}
+
+
+def aplicar(estado, evento):
+    """Reductor: incorpora un evento al estado derivado (posiciones abiertas, saldo, totales)"""
+    tipo, datos = evento["tipo"], evento["datos"]
+    estado["secuencia"] += 1
+    symbol = datos.get("symbol")
+    if tipo == "abierta":
+        estado["abiertas"][symbol] = {"direccion": datos.get("direccion"), "precio": datos.get("precio"),
+                                      "tamano": datos.get("tamano"), "tp": datos.get("tp"),
+                                      "apertura": evento["ts"], "num_dca": 0}
+    elif tipo == "tp_colocado" and symbol in estado["abiertas"]:
+        estado["abiertas"][symbol].update(tp=datos.get("precio"), tp_order_id=datos.get("order_id"))
+    elif tipo == "dca" and symbol in estado["abiertas"]:
+        estado["abiertas"][symbol].update(precio=datos.get("precio_promedio"), tp=datos.get("nuevo_tp"),
+                                          num_dca=datos.get("num_dca"))
+    elif tipo == "cerrada":
+        estado["abiertas"].pop(symbol, None)
+        estado["trades_cerrados"] += 1
+        estado["pnl_total"] += float(datos.get("pnl_real") or 0)
+    elif tipo == "saldo":
+        estado["saldo"] = datos.get("saldo")
+    return estado
+
+
+class VistaCSV:
+    """Archivo CSV derivado del diario: una fila por cada evento de un tipo"""
+
+    def __init__(self, ruta, tipo, columnas, por_defecto=None):
+        self.ruta = ruta
+        self.tipo = tipo
+        self.columnas = columnas          # "timestamp" + un campo del evento por columna
+        self.por_defecto = por_defecto or {}
+
+    def _linea(self, evento):
+        datos = evento["datos"]
+        valores = [_fecha(evento)]
+        for campo in self.columnas[1:]:
+            valor = datos.get(campo)
+            valores.append(valor if valor not in (None, "") else self.por_defecto.get(campo, valor))
+        return ",".join(str(valor) for valor in valores) + "\n"
+
+    def aplicar(self, evento):
+        nuevo = not os.path.exists(self.ruta)
+        with open(self.ruta, "a") as f:
+            if nuevo:
+                f.write(",".join(self.columnas) + "\n")
+            f.write(self._linea(evento))
+
+    def contar_filas(self):
+        if not os.path.exists(self.ruta):
+            return 0
+        with open(self.ruta, "rb") as f:
+            return max(sum(bloque.count(b"\n") for bloque in iter(lambda: f.read(1 << 20), b"")) - 1, 0)
+
+    def reescribir(self, eventos):
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w") as f:
+            f.write(",".join(self.columnas) + "\n")
+            for evento in eventos:
+                f.write(self._linea(evento))
+        os.replace(temporal, self.ruta)
+
+    def importar(self):
+        """
+        Convierte las filas de un CSV anterior al diario en eventos (los valores se
+        conservan como texto para reescribirlos idénticos)
+
+        Yields:
+            tuple: (instante epoch, datos del evento)
+        """
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "r", newline="") as f:
+            for fila in csv.DictReader(f):
+                try:
+                    ts = datetime.strptime(fila["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                yield ts, {campo: fila.get(campo) for campo in self.columnas[1:]}
+
+
+class VistaSaldo:
+    """ultimo_saldo.txt: último saldo muestreado (lo lee el panel)"""
+
+    tipo = "saldo"
+
+    def __init__(self, ruta="ultimo_saldo.txt"):
+        self.ruta = ruta
+
+    def aplicar(self, evento):
+        with open(self.ruta, "w") as f:
+            f.write(f"{evento['datos']['saldo']}")
+
+
+def _fecha(evento):
+    return datetime.fromtimestamp(evento["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def vistas_por_defecto():
+    """pnl_history.csv, dca_history.csv y ultimo_saldo.txt con el formato que espera el panel"""
+    return [
+        VistaCSV("pnl_history.csv", "cerrada",
+                 ["timestamp", "symbol", "direccion", "precio_entrada", "precio_salida", "tp", "pnl_real",
+                  "tiempo_abierto", "razon_cierre"],
+                 por_defecto={"tp": 0, "tiempo_abierto": "N/A"}),
+        VistaCSV("dca_history.csv", "dca",
+                 ["timestamp", "symbol", "direccion", "entry_original", "precio_dca", "tamano_dca",
+                  "precio_promedio", "nuevo_tp", "num_dca"]),
+        VistaSaldo(),
+    ]
+
+
+class DiarioEventos:
+    """
+    Diario de solo añadido con el ciclo de vida de las operaciones (apertura, TP
+    colocado, DCA, cierre) y los saldos muestreados.
+
+    Cada evento es una trama binaria (cabecera con longitud y CRC32 + JSON) que
+    se añade al final del archivo: una escritura secuencial por evento. El estado
+    derivado se guarda cada 'cada_snapshot' eventos junto con el offset del
+    diario, así que al arrancar solo se reproduce la cola posterior. Los archivos
+    pnl_history.csv, dca_history.csv y ultimo_saldo.txt son vistas derivadas que
+    se pueden regenerar desde el diario.
+    """
+
+    def __init__(self, ruta=ARCHIVO_DIARIO, vistas=None, cada_snapshot=500, fsync=False):
+        self.ruta = ruta
+        self.ruta_snapshot = ruta + ".snapshot"
+        self.vistas = vistas if vistas is not None else vistas_por_defecto()
+        self.cada_snapshot = cada_snapshot
+        self.fsync = fsync
+        self.estado = estado_inicial()
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._desde_snapshot = 0
+
+    # ------------------------------------------------------------------
+    # Tramas
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _codificar(tipo, datos, ts):
+        contenido = json.dumps(datos, separators=(",", ":")).encode()
+        return CABECERA.pack(FIRMA, VERSION, TIPOS[tipo], len(contenido), zlib.crc32(contenido), ts) + contenido
+
+    def leer(self, desde=0):
+        """
+        Recorre las tramas válidas a partir del offset 'desde'
+
+        Yields:
+            tuple: (offset tras la trama, evento {'tipo', 'ts', 'datos'})
+        """
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, "rb") as f:
+            f.seek(desde)
+            while True:
+                cabecera = f.read(CABECERA.size)
+                if len(cabecera) < CABECERA.size:
+                    return
+                firma, _, codigo, longitud, crc, ts = CABECERA.unpack(cabecera)
+                contenido = f.read(longitud)
+                if firma != FIRMA or len(contenido) < longitud or zlib.crc32(contenido) != crc:
+                    # Trama a medio escribir (corte durante la escritura): fin del diario válido
+                    return
+                yield f.tell(), {"tipo": NOMBRES_TIPO.get(codigo), "ts": ts, "datos": json.loads(contenido)}
+
+    # ------------------------------------------------------------------
+    # Recuperación y snapshots
+    # ------------------------------------------------------------------
+    def recuperar(self):
+        """
+        Carga el último snapshot, reproduce la cola del diario y completa las vistas
+
+        Returns:
+            int: Eventos reproducidos desde el snapshot
+        """
+        if not os.path.exists(self.ruta):
+            self._importar_vistas()
+
+        offset = 0
+        if os.path.exists(self.ruta_snapshot):
+            try:
+                with open(self.ruta_snapshot, "r") as f:
+                    snapshot = json.load(f)
+                self.estado, offset = snapshot["estado"], snapshot["offset"]
+            except Exception as e:
+                print(f"Snapshot del diario no válido, se reproduce completo: {e}")
+                logging.error(f"Snapshot del diario no válido: {e}")
+                self.estado, offset = estado_inicial(), 0
+
+        cola = []
+        valido = offset
+        for valido, evento in self.leer(offset):
+            aplicar(self.estado, evento)
+            cola.append(evento)
+            self._contar_filas(evento)
+
+        # Se descarta una posible trama incompleta al final antes de seguir añadiendo
+        if os.path.exists(self.ruta) and os.path.getsize(self.ruta) > valido:
+            with open(self.ruta, "r+b") as f:
+                f.truncate(valido)
+            logging.error(f"Diario {self.ruta} truncado a {valido} bytes (trama incompleta)")
+
+        self._completar_vistas(cola)
+        self._archivo = open(self.ruta, "ab")
+        self._desde_snapshot = len(cola)
+        atexit.register(self.cerrar)
+        if cola:
+            print(f"Diario de eventos: {len(cola)} eventos reproducidos desde el snapshot")
+        return len(cola)
+
+    def _importar_vistas(self):
+        """Primer arranque: los CSV existentes pasan a ser el inicio del diario"""
+        eventos = []
+        for vista in self.vistas:
+            if isinstance(vista, VistaCSV):
+                eventos.extend((ts, vista.tipo, datos) for ts, datos in vista.importar())
+        if not eventos:
+            return
+        eventos.sort(key=lambda evento: evento[0])
+        with open(self.ruta, "wb") as f:
+            for ts, tipo, datos in eventos:
+                f.write(self._codificar(tipo, datos, ts))
+        print(f"Diario de eventos: {len(eventos)} filas históricas importadas a {self.ruta}")
+
+    def _contar_filas(self, evento):
+        for vista in self.vistas:
+            if isinstance(vista, VistaCSV) and vista.tipo == evento["tipo"]:
+                self.estado["filas"][vista.ruta] = self.estado["filas"].get(vista.ruta, 0) + 1
+
+    def _completar_vistas(self, cola):
+        """Añade a las vistas las filas de la cola que no llegaron a escribirse antes de un corte"""
+        for vista in self.vistas:
+            eventos = [e for e in cola if e["tipo"] == vista.tipo]
+            if isinstance(vista, VistaCSV):
+                esperadas = self.estado["filas"].get(vista.ruta, 0)
+                faltan = esperadas - vista.contar_filas()
+                if faltan < 0 or faltan > len(eventos):
+                    # La vista no cuadra con el diario: se regenera entera
+                    vista.reescribir(e for _, e in self.leer() if e["tipo"] == vista.tipo)
+                elif faltan:
+                    for evento in eventos[-faltan:]:
+                        vista.aplicar(evento)
+            elif eventos:
+                vista.aplicar(eventos[-1])
+
+    def snapshot(self):
+        """Guarda el estado derivado y el offset actual del diario (escritura atómica)"""
+        with self._lock:
+            if self._archivo is None:
+                return
+            self._archivo.flush()
+            datos = {"offset": self._archivo.tell(), "estado": self.estado}
+            temporal = self.ruta_snapshot + ".tmp"
+            with open(temporal, "w") as f:
+                json.dump(datos, f)
+            os.replace(temporal, self.ruta_snapshot)
+            self._desde_snapshot = 0
+
+    def reconstruir_vistas(self):
+        """Regenera todas las vistas desde el diario completo"""
+        for vista in self.vistas:
+            eventos = (e for _, e in self.leer() if e["tipo"] == vista.tipo)
+            if isinstance(vista, VistaCSV):
+                vista.reescribir(eventos)
+            else:
+                ultimo = None
+                for ultimo in eventos:
+                    pass
+                if ultimo is not None:
+                    vista.aplicar(ultimo)
+
+    def cerrar(self):
+        if self._archivo is not None and not self._archivo.closed:
+            self.snapshot()
+            with self._lock:
+                self._archivo.close()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def registrar(self, tipo, **datos):
+        """Añade un evento al diario y lo aplica al estado y a las vistas"""
+        evento = {"tipo": tipo, "ts": time.time(), "datos": datos}
+        trama = self._codificar(tipo, datos, evento["ts"])
+        with self._lock:
+            self._archivo.write(trama)
+            self._archivo.flush()
+            if self.fsync:
+                os.fsync(self._archivo.fileno())
+            aplicar(self.estado, evento)
+            self._contar_filas(evento)
+            self._desde_snapshot += 1
+            snapshot_pendiente = self._desde_snapshot >= self.cada_snapshot
+
+        for vista in self.vistas:
+            if vista.tipo == tipo:
+                try:
+                    vista.aplicar(evento)
+                except Exception as e:
+                    print(f"Error actualizando la vista {vista.ruta}: {e}")
+                    logging.error(f"Error actualizando la vista {vista.ruta}: {e}", exc_info=True)
+        if snapshot_pendiente:
+            self.snapshot()
+        return evento
@@ -0,0 +1,431 @@
+# estado_bot.py
+import atexit
+import copy
+import json
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+ARCHIVO_ESTADO = "estado_bot.db"
+ARCHIVO_NIVELES_JSON = "trade_levels_atr.json"
+ARCHIVO_ORDENES_TP_JSON = "tp_orders.json"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS niveles_tp (
+    symbol TEXT PRIMARY KEY,
+    tp_fijo REAL
+);
+CREATE TABLE IF NOT EXISTS dca (
+    symbol TEXT PRIMARY KEY,
+    num_entradas INTEGER NOT NULL DEFAULT 0,
+    ultima_entrada TEXT,
+    precio_promedio REAL,
+    total_size REAL,
+    original_size REAL
+);
+CREATE TABLE IF NOT EXISTS dca_entradas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    precio REAL,
+    tamano REAL,
+    fecha TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_dca_entradas_symbol ON dca_entradas (symbol);
+CREATE TABLE IF NOT EXISTS ordenes_tp (
+    symbol TEXT PRIMARY KEY,
+    order_id TEXT,
+    entry_order_id TEXT,
+    price REAL,
+    size REAL,
+    side TEXT,
+    created_at TEXT,
+    tiempo_apertura TEXT,
+    ultimo_dca TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS meta_estado (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+COLUMNAS_DCA = ("num_entradas", "ultima_entrada", "precio_promedio", "total_size", "original_size")
+COLUMNAS_ORDEN_TP = ("order_id", "entry_order_id", "price", "size", "side", "created_at",
+                     "tiempo_apertura", "ultimo_dca")
+
+
+class AlmacenEstado:
+    """
+    Estado persistente del bot (niveles TP, DCA y órdenes TP) en SQLite con WAL.
+
+    Cada cambio es un upsert o borrado de la fila del símbolo, no una reescritura
+    del archivo completo, y un corte a mitad de escritura no corrompe el estado:
+    SQLite deshace la transacción incompleta. 'transaccion' agrupa varios cambios
+    (p.ej. la entrada DCA y la sustitución de su TP) en una sola operación atómica.
+
+    Las lecturas devuelven los mismos diccionarios que los antiguos JSON
+    ({symbol: {"tp_fijo", "dca_info"}} y {symbol: {"order_id", ...}}).
+    """
+
+    def __init__(self, ruta=ARCHIVO_ESTADO, solo_lectura=False):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self._profundidad = 0
+        if solo_lectura:
+            # p.ej. el panel: lee sin bloquear al bot (WAL admite lectores concurrentes)
+            self._conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True, check_same_thread=False,
+                                             isolation_level=None)
+            return
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(ESQUEMA)
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    @contextmanager
+    def transaccion(self):
+        """Agrupa los cambios del bloque en una transacción (admite anidamiento)"""
+        with self._lock:
+            if self._profundidad == 0:
+                self._conexion.execute("BEGIN IMMEDIATE")
+            self._profundidad += 1
+            try:
+                yield self
+            except Exception:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._conexion.execute("ROLLBACK")
+                raise
+            self._profundidad -= 1
+            if self._profundidad == 0:
+                self._conexion.execute("COMMIT")
+
+    def _consultar(self, sql, parametros=()):
+        with self._lock:
+            return self._conexion.execute(sql, parametros).fetchall()
+
+    # ------------------------------------------------------------------
+    # Niveles TP y DCA
+    # ------------------------------------------------------------------
+    def niveles(self, symbol=None):
+        """
+        Niveles de TP con su información DCA
+
+        Returns:
+            dict: {symbol: {"tp_fijo": float, "dca_info": {...}}} ("dca_info" solo si hubo DCA)
+        """
+        filtro, parametros = (" WHERE n.symbol = ?", (symbol,)) if symbol else ("", ())
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT n.symbol, n.tp_fijo, d.num_entradas, d.ultima_entrada, d.precio_promedio, d.total_size, "
+                "d.original_size FROM niveles_tp n LEFT JOIN dca d ON d.symbol = n.symbol" + filtro,
+                parametros).fetchall()
+            entradas = self._conexion.execute(
+                "SELECT symbol, precio, tamano, fecha FROM dca_entradas" + filtro.replace("n.symbol", "symbol") +
+                " ORDER BY id", parametros).fetchall()
+
+        resultado = {}
+        for fila in filas:
+            nivel = {"tp_fijo": fila[1]}
+            if fila[2] is not None:
+                nivel["dca_info"] = dict(zip(COLUMNAS_DCA, fila[2:]), entradas=[])
+            resultado[fila[0]] = nivel
+        for symbol_entrada, precio, tamano, fecha in entradas:
+            dca_info = resultado.get(symbol_entrada, {}).get("dca_info")
+            if dca_info is not None:
+                dca_info["entradas"].append({"precio": precio, "tamano": tamano, "fecha": fecha})
+        return resultado
+
+    def nivel(self, symbol):
+        return self.niveles(symbol).get(symbol)
+
+    def guardar_nivel(self, symbol, tp_fijo, dca_info=None):
+        """
+        Guarda el TP del símbolo. Sin 'dca_info' se borra cualquier DCA anterior
+        (posición nueva); con él se actualiza el resumen DCA (las entradas se añaden
+        con 'agregar_entrada_dca')
+        """
+        with self.transaccion():
+            self._conexion.execute(
+                "INSERT INTO niveles_tp (symbol, tp_fijo) VALUES (?, ?) "
+                "ON CONFLICT(symbol) DO UPDATE SET tp_fijo = excluded.tp_fijo", (symbol, tp_fijo))
+            if dca_info is None:
+                self._conexion.execute("DELETE FROM dca WHERE symbol = ?", (symbol,))
+                self._conexion.execute("DELETE FROM dca_entradas WHERE symbol = ?", (symbol,))
+            else:
+                valores = [dca_info.get(columna) for columna in COLUMNAS_DCA]
+                self._conexion.execute(
+                    f"INSERT OR REPLACE INTO dca (symbol, {', '.join(COLUMNAS_DCA)}) VALUES (?, ?, ?, ?, ?, ?)",
+                    [symbol] + valores)
+
+    def agregar_entrada_dca(self, symbol, precio, tamano, fecha):
+        with self._lock:
+            self._conexion.execute("INSERT INTO dca_entradas (symbol, precio, tamano, fecha) VALUES (?, ?, ?, ?)",
+                                   (symbol, precio, tamano, fecha))
+
+    def borrar_nivel(self, symbol):
+        with self.transaccion():
+            for tabla in ("niveles_tp", "dca", "dca_entradas"):
+                self._conexion.execute(f"DELETE FROM {tabla} WHERE symbol = ?", (symbol,))
+
+    # ------------------------------------------------------------------
+    # Órdenes TP
+    # ------------------------------------------------------------------
+    def ordenes_tp(self, symbol=None):
+        """
+        Returns:
+            dict: {symbol: {"order_id", "price", "size", "side", "created_at", "tiempo_apertura", ...}}
+        """
+        filtro, parametros = (" WHERE symbol = ?", (symbol,)) if symbol else ("", ())
+        filas = self._consultar(f"SELECT symbol, {', '.join(COLUMNAS_ORDEN_TP)}, extra FROM ordenes_tp" + filtro,
+                                parametros)
+        resultado = {}
+        for fila in filas:
+            orden = {columna: valor for columna, valor in zip(COLUMNAS_ORDEN_TP, fila[1:-1]) if valor is not None}
+            if fila[-1]:
+                orden.update(json.loads(fila[-1]))
+            resultado[fila[0]] = orden
+        return resultado
+
+    def orden_tp(self, symbol):
+        return self.ordenes_tp(symbol).get(symbol)
+
+    def guardar_orden_tp(self, symbol, datos):
+        """Inserta o sustituye la orden TP del símbolo (las claves desconocidas van a 'extra')"""
+        extra = {clave: valor for clave, valor in datos.items() if clave not in COLUMNAS_ORDEN_TP}
+        valores = [datos.get(columna) for columna in COLUMNAS_ORDEN_TP]
+        # Los identificadores de orden se guardan como texto (el exchange los da como enteros)
+        for indice in (0, 1):
+            if valores[indice] is not None:
+                valores[indice] = str(valores[indice])
+        with self._lock:
+            self._conexion.execute(
+                f"INSERT OR REPLACE INTO ordenes_tp (symbol, {', '.join(COLUMNAS_ORDEN_TP)}, extra) "
+                f"VALUES ({', '.join('?' * (len(COLUMNAS_ORDEN_TP) + 2))})",
+                [symbol] + valores + [json.dumps(extra) if extra else None])
+
+    def borrar_orden_tp(self, symbol):
+        with self._lock:
+            self._conexion.execute("DELETE FROM ordenes_tp WHERE symbol = ?", (symbol,))
+
+    # ------------------------------------------------------------------
+    # Migración desde los JSON
+    # ------------------------------------------------------------------
+    def migrar_json(self, ruta_niveles=ARCHIVO_NIVELES_JSON, ruta_ordenes=ARCHIVO_ORDENES_TP_JSON, avisar=None):
+        """
+        Importa una única vez trade_levels_atr.json y tp_orders.json (en una sola
+        transacción) y los renombra a '.migrado'
+
+        Un JSON que no se puede leer se renombra a '.corrupto' para revisarlo a
+        mano. Mientras exista algún '<ruta>.corrupto' la migración no se marca como
+        hecha y se avisa en cada arranque: al repararlo (devolviéndole su nombre) se
+        importa en el siguiente, y al borrarlo se da por terminada.
+
+        Args:
+            avisar (callable, optional): Recibe el mensaje de alerta si hay un archivo corrupto
+
+        Returns:
+            bool: True si se migró algo en esta llamada
+        """
+        if self._consultar("SELECT valor FROM meta_estado WHERE clave = 'migrado_json'"):
+            return False
+        datos = {}
+        corruptos = []
+        for ruta in (ruta_niveles, ruta_ordenes):
+            if os.path.exists(ruta):
+                try:
+                    with open(ruta, "r") as f:
+                        datos[ruta] = json.load(f)
+                except Exception as e:
+                    # JSON corrupto (p.ej. cortado a mitad de json.dump): se aparta sin darlo por migrado
+                    mensaje = f"No se pudo leer {ruta} para migrarlo ({e}); se guarda como {ruta}.corrupto"
+                    print(mensaje)
+                    logging.error(mensaje)
+                    os.replace(ruta, ruta + ".corrupto")
+                    if avisar:
+                        avisar(f"⚠️ {mensaje}")
+                    corruptos.append(ruta)
+                    continue
+            if ruta not in corruptos and os.path.exists(ruta + ".corrupto"):
+                mensaje = (f"Migración de {ruta} pendiente: repara {ruta}.corrupto y devuélvele su nombre, "
+                           f"o bórralo para descartarlo")
+                print(mensaje)
+                logging.error(mensaje)
+                if avisar:
+                    avisar(f"⚠️ {mensaje}")
+                corruptos.append(ruta)
+
+        with self.transaccion():
+            for symbol, nivel in (datos.get(ruta_niveles) or {}).items():
+                dca_info = nivel.get("dca_info")
+                self.guardar_nivel(symbol, nivel.get("tp_fijo"), dca_info)
+                for entrada in (dca_info or {}).get("entradas", []):
+                    self.agregar_entrada_dca(symbol, entrada.get("precio"), entrada.get("tamano"), entrada.get("fecha"))
+            for symbol, orden in (datos.get(ruta_ordenes) or {}).items():
+                self.guardar_orden_tp(symbol, orden)
+            if not corruptos:
+                self._conexion.execute("INSERT OR REPLACE INTO meta_estado (clave, valor) VALUES ('migrado_json', '1')")
+
+        for ruta in datos:
+            os.replace(ruta, ruta + ".migrado")
+        if datos:
+            print(f"Estado migrado a {self.ruta}: {', '.join(datos)}")
+        return bool(datos)
+
+
+class EstadoMemoria:
+    """
+    Estado del bot en memoria como fuente de verdad, con escritura diferida a un AlmacenEstado.
+
+    Misma interfaz que AlmacenEstado: las lecturas y cambios del ciclo de trading
+    no tocan disco. Los símbolos modificados se marcan como sucios y un hilo los
+    vuelca a SQLite cada 'intervalo' segundos en una sola transacción (y al
+    detener el proceso). Los cambios hechos dentro de 'transaccion' se vuelcan
+    siempre en el mismo lote, así que se conservan juntos o no se conserva ninguno.
+    """
+
+    def __init__(self, almacen, intervalo=1.0):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self._lock = threading.RLock()
+        self._niveles = almacen.niveles()
+        self._ordenes = almacen.ordenes_tp()
+        self._niveles_sucios = set()
+        self._ordenes_sucias = set()
+        self._lock_volcado = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        """Arranca el hilo de volcado y registra el volcado final al salir"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="estado-volcado", daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def detener(self):
+        """Para el hilo de volcado y hace el último volcado cuando ya no puede haber otro en curso"""
+        self._detener.set()
+        hilo = self._hilo
+        if hilo and hilo.is_alive() and hilo is not threading.current_thread():
+            hilo.join()
+        self.volcar()
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            self.volcar()
+
+    def volcar(self):
+        """Escribe en disco los símbolos modificados desde el último volcado"""
+        # Un volcado completo cada vez: otro no puede escribir un estado anterior encima de este
+        with self._lock_volcado:
+            self._volcar()
+
+    def _volcar(self):
+        with self._lock:
+            if not self._niveles_sucios and not self._ordenes_sucias:
+                return
+            niveles = {symbol: copy.deepcopy(self._niveles.get(symbol)) for symbol in self._niveles_sucios}
+            ordenes = {symbol: copy.deepcopy(self._ordenes.get(symbol)) for symbol in self._ordenes_sucias}
+            self._niveles_sucios.clear()
+            self._ordenes_sucias.clear()
+        try:
+            with self.almacen.transaccion():
+                for symbol, nivel in niveles.items():
+                    # Se rehace la fila del símbolo completa (resumen DCA y sus entradas)
+                    self.almacen.borrar_nivel(symbol)
+                    if nivel is None:
+                        continue
+                    dca_info = nivel.get("dca_info")
+                    self.almacen.guardar_nivel(symbol, nivel.get("tp_fijo"), dca_info)
+                    for entrada in (dca_info or {}).get("entradas", []):
+                        self.almacen.agregar_entrada_dca(symbol, entrada.get("precio"), entrada.get("tamano"),
+                                                         entrada.get("fecha"))
+                for symbol, orden in ordenes.items():
+                    if orden is None:
+                        self.almacen.borrar_orden_tp(symbol)
+                    else:
+                        self.almacen.guardar_orden_tp(symbol, orden)
+        except Exception as e:
+            # Se reintentan en el siguiente volcado
+            print(f"Error volcando el estado a disco: {e}")
+            logging.error(f"Error volcando el estado a disco: {e}", exc_info=True)
+            with self._lock:
+                self._niveles_sucios.update(niveles)
+                self._ordenes_sucias.update(ordenes)
+
+    @contextmanager
+    def transaccion(self):
+        """Los cambios del bloque no se vuelcan por separado (el volcado espera a que termine)"""
+        with self._lock:
+            yield self
+
+    # ------------------------------------------------------------------
+    # Niveles TP y DCA
+    # ------------------------------------------------------------------
+    def niveles(self, symbol=None):
+        with self._lock:
+            if symbol:
+                return {symbol: copy.deepcopy(self._niveles[symbol])} if symbol in self._niveles else {}
+            return copy.deepcopy(self._niveles)
+
+    def nivel(self, symbol):
+        with self._lock:
+            return copy.deepcopy(self._niveles.get(symbol))
+
+    def guardar_nivel(self, symbol, tp_fijo, dca_info=None):
+        with self._lock:
+            nivel = {"tp_fijo": tp_fijo}
+            if dca_info is not None:
+                # Como en AlmacenEstado: las entradas se añaden con agregar_entrada_dca
+                anteriores = self._niveles.get(symbol, {}).get("dca_info", {}).get("entradas", [])
+                nivel["dca_info"] = {columna: dca_info.get(columna) for columna in COLUMNAS_DCA}
+                nivel["dca_info"]["entradas"] = anteriores
+            self._niveles[symbol] = nivel
+            self._niveles_sucios.add(symbol)
+
+    def agregar_entrada_dca(self, symbol, precio, tamano, fecha):
+        with self._lock:
+            dca_info = self._niveles.get(symbol, {}).get("dca_info")
+            if dca_info is not None:
+                dca_info["entradas"].append({"precio": precio, "tamano": tamano, "fecha": fecha})
+                self._niveles_sucios.add(symbol)
+
+    def borrar_nivel(self, symbol):
+        with self._lock:
+            self._niveles.pop(symbol, None)
+            self._niveles_sucios.add(symbol)
+
+    # ------------------------------------------------------------------
+    # Órdenes TP
+    # ------------------------------------------------------------------
+    def ordenes_tp(self, symbol=None):
+        with self._lock:
+            if symbol:
+                return {symbol: dict(self._ordenes[symbol])} if symbol in self._ordenes else {}
+            return copy.deepcopy(self._ordenes)
+
+    def orden_tp(self, symbol):
+        with self._lock:
+            orden = self._ordenes.get(symbol)
+            return dict(orden) if orden is not None else None
+
+    def guardar_orden_tp(self, symbol, datos):
+        with self._lock:
+            self._ordenes[symbol] = dict(datos)
+            self._ordenes_sucias.add(symbol)
+
+    def borrar_orden_tp(self, symbol):
+        with self._lock:
+            if self._ordenes.pop(symbol, None) is not None:
+                self._ordenes_sucias.add(symbol)
@@ -0,0 +1,73 @@
+# estrategia.py
+# Parámetros y reglas de la estrategia microestructura v2 sin dependencias del cliente,
+# para poder usarlas tanto en el bot (main.py) como en los backtests.
+from config import ATR_TP_MULT, MAX_TP_PCT
+
+MULTIPLICADOR_VOL_POR_SIMBOLO = {
+    "BTC": 1.5, "ETH": 1.5, "BNB": 1.5, "SOL": 1.2, "XRP": 1.2,
+    "ADA": 1.2, "AVAX": 1.2, "LINK": 1.2, "MATIC": 1.2
+}
+BREAKOUT_ATR_MULT_POR_SIMBOLO = {
+    "BTC": 0.15, "ETH": 0.15, "BNB": 0.15, "SOL": 0.1, "XRP": 0.1,
+    "ADA": 0.1, "AVAX": 0.1, "LINK": 0.1, "MATIC": 0.1
+}
+
+VOLATILITY_WINDOW = 10
+VOLATILITY_UMBRAL = 0.015
+
+def detectar_volatilidad_extrema(df):
+    if len(df) < VOLATILITY_WINDOW + 1:
+        return False
+    precio_ini = df['close'].iloc[-VOLATILITY_WINDOW-1]
+    precio_fin = df['close'].iloc[-1]
+    move_pct = abs(precio_fin - precio_ini) / precio_ini
+    if move_pct > VOLATILITY_UMBRAL:
+        return True
+    return False
+
+def calcular_tp_atr(entry_price, atr, direction, fee_rate=0.001, atr_tp_mult=None, max_tp_pct=None):
+    """
+    Calcula el precio de Take Profit basado en ATR con validación de dirección mejorada.
+    atr_tp_mult y max_tp_pct permiten sobrescribir ATR_TP_MULT y MAX_TP_PCT (backtests).
+    """
+    atr_tp_mult = ATR_TP_MULT if atr_tp_mult is None else atr_tp_mult
+    max_tp_pct = MAX_TP_PCT if max_tp_pct is None else max_tp_pct
+    max_tp_move = entry_price * max_tp_pct
+    
+    # Normalizar la dirección para asegurar que solo sea "BUY" o "SELL"
+    direction_normalizada = direction.upper().strip()
+    if "BUY" in direction_normalizada:
+        direction_normalizada = "BUY"
+    elif "SELL" in direction_normalizada:
+        direction_normalizada = "SELL"
+    else:
+        # Si no podemos determinar la dirección, usar un valor seguro
+        print(f"ERROR: Dirección no reconocida '{direction}'. Se usará 'SELL' por defecto.")
+        direction_normalizada = "SELL"
+    
+    if direction_normalizada == "BUY":
+        # Para operaciones LONG
+        tp = entry_price + atr_tp_mult * atr
+        # No permitir que exceda el porcentaje máximo
+        tp = min(tp, entry_price * (1 + max_tp_pct))
+        # Asegurar ganancia mínima para cubrir comisiones
+        tp = max(tp, entry_price * (1 + fee_rate * 3))
+    else:
+        # Para operaciones SHORT
+        tp = entry_price - atr_tp_mult * atr
+        # No permitir que exceda el porcentaje máximo (en SHORT es precio menor)
+        tp = max(tp, entry_price * (1 - max_tp_pct))
+        # Asegurar ganancia mínima para cubrir comisiones (pero sin subir sobre el precio de entrada)
+        tp = min(tp, entry_price * (1 - fee_rate * 3))
+    
+    # Validación final para detectar valores desorbitados
+    pct_change = abs(tp - entry_price) / entry_price
+    if pct_change > max_tp_pct + 1e-12:  # Tolerancia de redondeo en coma flotante
+        print(f"ADVERTENCIA: TP calculado ({tp:.4f}) excede el límite máximo permitido ({max_tp_pct*100}%)")
+        # Corregir el TP para que respete el límite máximo
+        if direction_normalizada == "BUY":
+            tp = entry_price * (1 + max_tp_pct)
+        else:
+            tp = entry_price * (1 - max_tp_pct)
+    
+    return tp
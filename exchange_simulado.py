@@ -0,0 +1,674 @@
+# exchange_simulado.py
+"""
+Exchange Hyperliquid simulado en localhost para pruebas de carga y latencia.
+
+Sirve /info (meta, spotMeta, metaAndAssetCtxs, allMids, l2Book, candleSnapshot,
+clearinghouseState, orderStatus, openOrders, userFills), /exchange (order,
+cancel, cancelByCloid, updateLeverage) y un WebSocket mínimo en /ws (allMids,
+l2Book, userFills) sobre N símbolos sintéticos con precios en paseo aleatorio.
+Las órdenes se cruzan contra el libro simulado y se mantienen posiciones y PnL
+de una única cuenta (las firmas no se verifican).
+
+Uso:
+    python exchange_simulado.py --simbolos 200 --puerto 8899 --latencia-ms 20 --prob-error 0.01
+y en config.py: API_URL = "http://127.0.0.1:8899" (WS_URL se deriva de API_URL).
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metadatos import ReglasActivo
+
+GUID_WEBSOCKET = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+INTERVALOS_MS = {"1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000,
+                 "1h": 3600000, "2h": 7200000, "4h": 14400000, "8h": 28800000, "12h": 43200000,
+                 "1d": 86400000}
+ESTADOS_ABIERTOS = ("open", "triggerPending")
+
+
+def _ahora_ms():
+    return int(time.time() * 1000)
+
+
+def _num(valor):
+    """Número en el formato de texto de la API (sin ceros ni notación científica sobrantes)"""
+    texto = f"{valor:.8f}".rstrip("0").rstrip(".")
+    return texto if texto not in ("", "-0") else "0"
+
+
+class MercadoSimulado:
+    """Precios en paseo aleatorio geométrico con velas de 1 minuto y libro sintético alrededor del mid"""
+
+    def __init__(self, num_simbolos, semilla=None, volatilidad=0.0005, spread_bps=2.0, niveles=10,
+                 historia_minutos=1500):
+        self.azar = random.Random(semilla)
+        self.volatilidad = volatilidad      # Desviación del log-retorno por segundo
+        self.spread = spread_bps / 10000
+        self.niveles = niveles
+        self.reglas = {}
+        self.precios = {}
+        self.velas = {}                     # coin -> deque de [t, o, h, l, c, v] de 1 minuto
+        self.simbolos = [f"SIM{i:03d}" for i in range(num_simbolos)]
+        self.indices = {coin: i for i, coin in enumerate(self.simbolos)}
+
+        ahora = _ahora_ms() // 60000 * 60000
+        for coin in self.simbolos:
+            precio = 10 ** self.azar.uniform(-2, 4.5)
+            sz_decimals = max(0, min(5, int(math.log10(precio)) + 1))
+            self.reglas[coin] = ReglasActivo(coin, sz_decimals, self.azar.choice([10, 20, 25, 40, 50]))
+            velas = deque(maxlen=historia_minutos)
+            # Historia previa: un paseo de 60 pasos de un segundo por minuto
+            for minuto in range(historia_minutos, 0, -1):
+                apertura = precio
+                maximo = minimo = precio
+                for _ in range(60):
+                    precio *= math.exp(self.azar.gauss(0, self.volatilidad))
+                    maximo, minimo = max(maximo, precio), min(minimo, precio)
+                velas.append([ahora - minuto * 60000, apertura, maximo, minimo, precio,
+                              self.azar.uniform(10, 1000)])
+            velas.append([ahora, precio, precio, precio, precio, 0.0])
+            self.precios[coin] = precio
+            self.velas[coin] = velas
+
+    def avanzar(self, segundos):
+        """Mueve todos los precios 'segundos' y actualiza la vela en curso"""
+        ahora = _ahora_ms() // 60000 * 60000
+        sigma = self.volatilidad * math.sqrt(segundos)
+        for coin in self.simbolos:
+            precio = self.precios[coin] * math.exp(self.azar.gauss(0, sigma))
+            self.precios[coin] = precio
+            velas = self.velas[coin]
+            if velas[-1][0] < ahora:
+                velas.append([ahora, velas[-1][4], precio, precio, precio, 0.0])
+            vela = velas[-1]
+            vela[2], vela[3], vela[4] = max(vela[2], precio), min(vela[3], precio), precio
+            vela[5] += self.azar.uniform(0, 10) * segundos
+
+    def mejor_bid_ask(self, coin):
+        mid = self.precios[coin]
+        return mid * (1 - self.spread / 2), mid * (1 + self.spread / 2)
+
+    def libro(self, coin):
+        bid, ask = self.mejor_bid_ask(coin)
+        paso = self.precios[coin] * self.spread / 2
+        reglas = self.reglas[coin]
+        tamano = max(round(100000 / self.precios[coin], reglas.sz_decimals), reglas.tamano_minimo)
+        return [
+            [{"px": _num(reglas.redondear_precio(bid - i * paso)), "sz": _num(tamano * (i + 1)), "n": i + 1}
+             for i in range(self.niveles)],
+            [{"px": _num(reglas.redondear_precio(ask + i * paso)), "sz": _num(tamano * (i + 1)), "n": i + 1}
+             for i in range(self.niveles)],
+        ]
+
+    def velas_intervalo(self, coin, intervalo, inicio, fin):
+        """Velas del intervalo pedido agregando las de 1 minuto"""
+        paso = INTERVALOS_MS.get(intervalo, 60000)
+        agregadas = {}
+        for t, o, h, l, c, v in self.velas[coin]:
+            clave = t // paso * paso
+            if clave + paso <= inicio or clave > fin:
+                continue
+            vela = agregadas.get(clave)
+            if vela is None:
+                agregadas[clave] = [clave, o, h, l, c, v, 1]
+            else:
+                vela[2], vela[3], vela[4] = max(vela[2], h), min(vela[3], l), c
+                vela[5] += v
+                vela[6] += 1
+        return [{"t": t, "T": t + paso - 1, "s": coin, "i": intervalo, "o": _num(o), "c": _num(c),
+                 "h": _num(h), "l": _num(l), "v": _num(v), "n": n}
+                for t, o, h, l, c, v, n in sorted(agregadas.values())]
+
+
+class ExchangeSimulado:
+    """
+    Cuenta única con posiciones, órdenes en libro, órdenes trigger (TP) y fills.
+
+    Todas las operaciones se serializan con un único lock: el objetivo es medir
+    al bot, no al simulador.
+    """
+
+    def __init__(self, mercado, saldo_inicial=10000.0, comision=0.00035, paso=1.0):
+        self.mercado = mercado
+        self.saldo = saldo_inicial          # USDC realizado (sin PnL abierto)
+        self.comision = comision
+        self.paso = paso
+        self.posiciones = {}                # coin -> {'szi', 'entry_px'}
+        self.apalancamientos = {}
+        self.ordenes = {}                   # oid -> orden
+        self.cloids = {}
+        self.fills = deque(maxlen=2000)
+        self._oid = 1000
+        self._tid = 1
+        self._lock = threading.RLock()
+        self._oyentes_fills = []
+        self._detener = threading.Event()
+        self.contadores = defaultdict(int)
+
+    # ------------------------------------------------------------------
+    # Simulación
+    # ------------------------------------------------------------------
+    def iniciar(self, al_avanzar=None):
+        """Hilo que mueve el mercado cada 'paso' segundos y procesa órdenes en libro y triggers"""
+        def bucle():
+            while not self._detener.wait(self.paso):
+                with self._lock:
+                    self.mercado.avanzar(self.paso)
+                    self._procesar_ordenes()
+                if al_avanzar:
+                    al_avanzar()
+        threading.Thread(target=bucle, name="exchange-simulado", daemon=True).start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _procesar_ordenes(self):
+        for orden in list(self.ordenes.values()):
+            if orden["estado"] == "triggerPending":
+                mid = self.mercado.precios[orden["coin"]]
+                # TP de un largo (venta) salta al subir; TP de un corto (compra) al bajar
+                if (not orden["is_buy"] and mid >= orden["trigger_px"]) or (orden["is_buy"] and mid <= orden["trigger_px"]):
+                    orden["estado"] = "open"
+            if orden["estado"] == "open":
+                self._cruzar(orden, reposar=True)
+
+    def _nuevo_oid(self):
+        self._oid += 1
+        return self._oid
+
+    def _cruzar(self, orden, reposar):
+        """Cruza la orden contra el mejor precio; devuelve el estado para la respuesta de /exchange"""
+        coin = orden["coin"]
+        bid, ask = self.mercado.mejor_bid_ask(coin)
+        precio = ask if orden["is_buy"] else bid
+        cruza = orden["limit_px"] >= ask if orden["is_buy"] else orden["limit_px"] <= bid
+
+        if orden["reduce_only"]:
+            szi = self.posiciones.get(coin, {}).get("szi", 0.0)
+            if szi == 0 or (szi > 0) == orden["is_buy"]:
+                orden["estado"] = "reduceOnlyCanceled"
+                return {"error": "Reduce only order would increase position."}
+            orden["sz"] = min(orden["sz"], abs(szi))
+
+        if not cruza:
+            if reposar:
+                orden["estado"] = "open"
+                return {"resting": {"oid": orden["oid"]}}
+            orden["estado"] = "canceled"
+            return {"error": f"Order could not immediately match against any resting orders. asset={self.mercado.indices[coin]}"}
+
+        tamano = orden["sz"]
+        self._llenar(orden, precio, tamano)
+        orden["sz"] = 0.0
+        orden["estado"] = "filled"
+        return {"filled": {"totalSz": _num(tamano), "avgPx": _num(precio), "oid": orden["oid"]}}
+
+    def _llenar(self, orden, precio, tamano):
+        coin = orden["coin"]
+        posicion = self.posiciones.setdefault(coin, {"szi": 0.0, "entry_px": 0.0})
+        inicial = posicion["szi"]
+        delta = tamano if orden["is_buy"] else -tamano
+        pnl_cerrado = 0.0
+        if inicial == 0 or (inicial > 0) == (delta > 0):
+            posicion["entry_px"] = (abs(inicial) * posicion["entry_px"] + tamano * precio) / (abs(inicial) + tamano)
+        else:
+            cerrado = min(abs(inicial), tamano)
+            pnl_cerrado = cerrado * (precio - posicion["entry_px"]) * (1 if inicial > 0 else -1)
+            if tamano > abs(inicial):
+                posicion["entry_px"] = precio
+        posicion["szi"] = round(inicial + delta, 8)
+        if posicion["szi"] == 0:
+            del self.posiciones[coin]
+
+        comision = tamano * precio * self.comision
+        self.saldo += pnl_cerrado - comision
+        self._tid += 1
+        fill = {"coin": coin, "px": _num(precio), "sz": _num(tamano), "side": "B" if orden["is_buy"] else "A",
+                "time": _ahora_ms(), "startPosition": _num(inicial),
+                "dir": ("Open " if pnl_cerrado == 0 else "Close ") + ("Long" if (inicial or delta) > 0 else "Short"),
+                "closedPnl": _num(pnl_cerrado), "hash": f"0x{self._tid:064x}", "oid": orden["oid"],
+                "crossed": True, "fee": _num(comision), "tid": self._tid, "feeToken": "USDC"}
+        self.fills.appendleft(fill)
+        self.contadores["fills"] += 1
+        for oyente in list(self._oyentes_fills):
+            oyente([fill])
+
+    def agregar_oyente_fills(self, funcion):
+        self._oyentes_fills.append(funcion)
+
+    # ------------------------------------------------------------------
+    # /info
+    # ------------------------------------------------------------------
+    def meta(self):
+        return {"universe": [{"name": coin, "szDecimals": self.mercado.reglas[coin].sz_decimals,
+                              "maxLeverage": self.mercado.reglas[coin].max_leverage}
+                             for coin in self.mercado.simbolos]}
+
+    def mids(self):
+        with self._lock:
+            return {coin: _num(precio) for coin, precio in self.mercado.precios.items()}
+
+    def libro(self, coin):
+        with self._lock:
+            if coin not in self.mercado.precios:
+                return None
+            return {"coin": coin, "time": _ahora_ms(), "levels": self.mercado.libro(coin)}
+
+    def estado_cuenta(self):
+        posiciones = []
+        no_realizado = ntl_total = margen_total = 0.0
+        for coin, posicion in self.posiciones.items():
+            mid = self.mercado.precios[coin]
+            apalancamiento = self.apalancamientos.get(coin, 20)
+            upnl = posicion["szi"] * (mid - posicion["entry_px"])
+            valor = abs(posicion["szi"]) * mid
+            margen = valor / apalancamiento
+            no_realizado += upnl
+            ntl_total += valor
+            margen_total += margen
+            posiciones.append({"type": "oneWay", "position": {
+                "coin": coin, "szi": _num(posicion["szi"]), "entryPx": _num(posicion["entry_px"]),
+                "positionValue": _num(valor), "unrealizedPnl": _num(upnl),
+                "returnOnEquity": _num(upnl / margen if margen else 0.0),
+                "leverage": {"type": "cross", "value": apalancamiento}, "liquidationPx": None,
+                "marginUsed": _num(margen), "maxLeverage": self.mercado.reglas[coin].max_leverage}})
+        valor_cuenta = self.saldo + no_realizado
+        resumen = {"accountValue": _num(valor_cuenta), "totalNtlPos": _num(ntl_total),
+                   "totalRawUsd": _num(self.saldo), "totalMarginUsed": _num(margen_total)}
+        return {"assetPositions": posiciones, "marginSummary": resumen, "crossMarginSummary": resumen,
+                "crossMaintenanceMarginUsed": _num(margen_total / 2),
+                "withdrawable": _num(max(valor_cuenta - margen_total, 0.0)), "time": _ahora_ms()}
+
+    def _orden_publica(self, orden):
+        return {"coin": orden["coin"], "side": "B" if orden["is_buy"] else "A", "limitPx": _num(orden["limit_px"]),
+                "sz": _num(orden["sz"]), "oid": orden["oid"], "timestamp": orden["timestamp"],
+                "origSz": _num(orden["orig_sz"]), "cloid": orden["cloid"], "reduceOnly": orden["reduce_only"],
+                "isTrigger": orden["trigger_px"] is not None,
+                "triggerPx": _num(orden["trigger_px"] or 0.0), "orderType": orden["tipo"]}
+
+    def info(self, payload):
+        tipo = payload.get("type")
+        with self._lock:
+            self.contadores[f"info.{tipo}"] += 1
+            if tipo == "meta":
+                return self.meta()
+            if tipo == "spotMeta":
+                return {"tokens": [], "universe": []}
+            if tipo == "metaAndAssetCtxs":
+                contextos = []
+                for coin in self.mercado.simbolos:
+                    mid = self.mercado.precios[coin]
+                    velas = self.mercado.velas[coin]
+                    previo = velas[-min(len(velas), 1440)][1]
+                    contextos.append({"dayNtlVlm": _num(sum(v[5] for v in list(velas)[-1440:]) * mid),
+                                      "openInterest": _num(1e6 / mid), "markPx": _num(mid), "midPx": _num(mid),
+                                      "oraclePx": _num(mid), "prevDayPx": _num(previo), "funding": "0.0000125",
+                                      "premium": "0.0", "impactPxs": [_num(p) for p in self.mercado.mejor_bid_ask(coin)]})
+                return [self.meta(), contextos]
+            if tipo == "allMids":
+                return self.mids()
+            if tipo == "l2Book":
+                return self.libro(payload.get("coin"))
+            if tipo == "candleSnapshot":
+                req = payload.get("req") or {}
+                if req.get("coin") not in self.mercado.velas:
+                    return []
+                return self.mercado.velas_intervalo(req["coin"], req.get("interval"),
+                                                    req.get("startTime", 0), req.get("endTime", _ahora_ms()))
+            if tipo == "clearinghouseState":
+                return self.estado_cuenta()
+            if tipo in ("openOrders", "frontendOpenOrders"):
+                return [self._orden_publica(o) for o in self.ordenes.values() if o["estado"] in ESTADOS_ABIERTOS]
+            if tipo == "userFills":
+                return list(self.fills)
+            if tipo == "orderStatus":
+                identificador = payload.get("oid")
+                oid = self.cloids.get(identificador) if isinstance(identificador, str) else identificador
+                orden = self.ordenes.get(oid)
+                if orden is None:
+                    return {"status": "unknownOid"}
+                return {"status": "order", "order": {"order": self._orden_publica(orden), "status": orden["estado"],
+                                                     "statusTimestamp": _ahora_ms()}}
+        raise ValueError(f"Tipo de consulta no soportado: {tipo}")
+
+    # ------------------------------------------------------------------
+    # /exchange
+    # ------------------------------------------------------------------
+    def exchange(self, payload):
+        accion = payload.get("action") or {}
+        tipo = accion.get("type")
+        with self._lock:
+            self.contadores[f"exchange.{tipo}"] += 1
+            if tipo == "order":
+                return self._ordenes(accion)
+            if tipo in ("cancel", "cancelByCloid"):
+                estados = []
+                for cancelacion in accion.get("cancels", []):
+                    oid = cancelacion.get("o") if tipo == "cancel" else self.cloids.get(cancelacion.get("cloid"))
+                    orden = self.ordenes.get(oid)
+                    if orden is None or orden["estado"] not in ESTADOS_ABIERTOS:
+                        estados.append({"error": "Order was never placed, already canceled, or filled."})
+                    else:
+                        orden["estado"] = "canceled"
+                        estados.append("success")
+                return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": estados}}}
+            if tipo == "updateLeverage":
+                coin = self.mercado.simbolos[accion["asset"]]
+                if accion["leverage"] > self.mercado.reglas[coin].max_leverage:
+                    return {"status": "err", "response": "Invalid leverage value"}
+                self.apalancamientos[coin] = accion["leverage"]
+                return {"status": "ok", "response": {"type": "default"}}
+        return {"status": "err", "response": f"Acción no soportada: {tipo}"}
+
+    def _ordenes(self, accion):
+        estados = []
+        padre_llenado = None
+        for wire in accion.get("orders", []):
+            coin = self.mercado.simbolos[wire["a"]]
+            trigger = (wire.get("t") or {}).get("trigger")
+            orden = {"oid": self._nuevo_oid(), "coin": coin, "is_buy": wire["b"], "limit_px": float(wire["p"]),
+                     "sz": float(wire["s"]), "orig_sz": float(wire["s"]), "reduce_only": wire.get("r", False),
+                     "cloid": wire.get("c"), "timestamp": _ahora_ms(), "estado": "open",
+                     "trigger_px": float(trigger["triggerPx"]) if trigger else None,
+                     "tipo": "Take Profit Limit" if trigger else "Limit"}
+            self.ordenes[orden["oid"]] = orden
+            if orden["cloid"]:
+                self.cloids[orden["cloid"]] = orden["oid"]
+
+            if trigger:
+                # En normalTpsl el TP solo se activa si la orden principal se llenó y, como en
+                # el exchange real, su estado es un texto sin oid (solo se localiza por cloid)
+                if accion.get("grouping") == "normalTpsl" and padre_llenado is False:
+                    orden["estado"] = "canceled"
+                    estados.append({"error": "Main order failed, TP/SL canceled."})
+                elif accion.get("grouping") == "normalTpsl":
+                    orden["estado"] = "triggerPending"
+                    estados.append("waitingForTrigger" if padre_llenado else "waitingForFill")
+                else:
+                    orden["estado"] = "triggerPending"
+                    estados.append({"resting": {"oid": orden["oid"]}})
+                continue
+
+            tif = (wire.get("t") or {}).get("limit", {}).get("tif", "Gtc")
+            estado = self._cruzar(orden, reposar=tif != "Ioc")
+            if padre_llenado is None:
+                padre_llenado = "filled" in estado
+            estados.append(estado)
+        self.contadores["ordenes"] += len(estados)
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": estados}}}
+
+
+class ServidorSimulado(ThreadingHTTPServer):
+    """Servidor HTTP/WebSocket del exchange simulado con latencia y errores inyectables"""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, exchange, latencia_ms=0.0, jitter_ms=0.0, prob_error=0.0, prob_429=0.0):
+        super().__init__(direccion, ManejadorSimulado)
+        self.exchange = exchange
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.prob_error = prob_error
+        self.prob_429 = prob_429
+        self.azar = random.Random()
+        self.conexiones_ws = []
+        self._lock_ws = threading.Lock()
+        self._tiempos = defaultdict(lambda: [0, 0.0, 0.0])   # ruta -> [peticiones, segundos, máximo]
+        exchange.agregar_oyente_fills(self._difundir_fills)
+
+    def latencia(self):
+        if not self.latencia_ms and not self.jitter_ms:
+            return 0.0
+        return max(self.azar.gauss(self.latencia_ms, self.jitter_ms), 0.0) / 1000
+
+    def registrar(self, ruta, segundos):
+        registro = self._tiempos[ruta]
+        registro[0] += 1
+        registro[1] += segundos
+        registro[2] = max(registro[2], segundos)
+
+    def estadisticas(self):
+        return {"rutas": {ruta: {"peticiones": n, "media_ms": 1000 * s / n if n else 0.0, "max_ms": 1000 * m}
+                          for ruta, (n, s, m) in list(self._tiempos.items())},
+                "contadores": dict(self.exchange.contadores),
+                "posiciones": len(self.exchange.posiciones),
+                "conexiones_ws": len(self.conexiones_ws)}
+
+    # WebSocket: difusión desde el hilo del mercado
+    def agregar_ws(self, conexion):
+        with self._lock_ws:
+            self.conexiones_ws.append(conexion)
+
+    def quitar_ws(self, conexion):
+        with self._lock_ws:
+            if conexion in self.conexiones_ws:
+                self.conexiones_ws.remove(conexion)
+
+    def difundir_mercado(self):
+        with self._lock_ws:
+            conexiones = list(self.conexiones_ws)
+        if not conexiones:
+            return
+        mids = self.exchange.mids()
+        for conexion in conexiones:
+            if conexion.all_mids:
+                conexion.enviar({"channel": "allMids", "data": {"mids": mids}})
+            for coin in list(conexion.monedas_l2):
+                conexion.enviar({"channel": "l2Book", "data": self.exchange.libro(coin)})
+
+    def _difundir_fills(self, fills):
+        with self._lock_ws:
+            conexiones = [c for c in self.conexiones_ws if c.usuario_fills]
+        for conexion in conexiones:
+            conexion.enviar({"channel": "userFills", "data": {"user": conexion.usuario_fills, "fills": fills}})
+
+
+class ConexionWS:
+    """Conexión WebSocket de un cliente: suscripciones y envío de tramas de texto"""
+
+    def __init__(self, archivo_escritura):
+        self.archivo = archivo_escritura
+        self.all_mids = False
+        self.monedas_l2 = set()
+        self.usuario_fills = None
+        self._lock = threading.Lock()
+        self.abierta = True
+
+    def enviar_trama(self, opcode, datos):
+        longitud = len(datos)
+        if longitud < 126:
+            cabecera = struct.pack("!BB", 0x80 | opcode, longitud)
+        elif longitud < 65536:
+            cabecera = struct.pack("!BBH", 0x80 | opcode, 126, longitud)
+        else:
+            cabecera = struct.pack("!BBQ", 0x80 | opcode, 127, longitud)
+        with self._lock:
+            if not self.abierta:
+                return
+            try:
+                self.archivo.write(cabecera + datos)
+                self.archivo.flush()
+            except OSError:
+                self.abierta = False
+
+    def enviar(self, mensaje):
+        self.enviar_trama(0x1, json.dumps(mensaje).encode())
+
+
+class ManejadorSimulado(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, como el exchange real
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        inicio = time.perf_counter()
+        servidor = self.server
+        longitud = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(longitud) or b"{}")
+        except ValueError:
+            self._responder(400, {"error": "JSON no válido"})
+            return
+
+        espera = servidor.latencia()
+        if espera:
+            time.sleep(espera)
+        azar = servidor.azar.random()
+        if azar < servidor.prob_429:
+            self._responder(429, None)
+        elif azar < servidor.prob_429 + servidor.prob_error:
+            self._responder(500, {"error": "error simulado"})
+        elif self.path == "/info":
+            try:
+                self._responder(200, servidor.exchange.info(payload))
+            except (ValueError, KeyError) as e:
+                self._responder(422, {"code": 422, "msg": str(e), "data": None})
+        elif self.path == "/exchange":
+            self._responder(200, servidor.exchange.exchange(payload))
+        else:
+            self._responder(404, {"code": 404, "msg": f"Ruta desconocida {self.path}", "data": None})
+        servidor.registrar(self.path, time.perf_counter() - inicio)
+
+    def do_GET(self):
+        if self.path == "/estadisticas":
+            self._responder(200, self.server.estadisticas())
+            return
+        if self.path != "/ws" or self.headers.get("Upgrade", "").lower() != "websocket":
+            self._responder(404, {"error": "no encontrado"})
+            return
+
+        clave = self.headers.get("Sec-WebSocket-Key", "")
+        aceptar = base64.b64encode(hashlib.sha1((clave + GUID_WEBSOCKET).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", aceptar)
+        self.end_headers()
+        self.wfile.flush()
+
+        conexion = ConexionWS(self.wfile)
+        self.server.agregar_ws(conexion)
+        conexion.enviar_trama(0x1, b"Websocket connection established.")
+        try:
+            self._bucle_ws(conexion)
+        except (OSError, ConnectionError, struct.error):
+            pass
+        finally:
+            conexion.abierta = False
+            self.server.quitar_ws(conexion)
+            self.close_connection = True
+
+    def _leer(self, n):
+        datos = self.rfile.read(n)
+        if len(datos) < n:
+            raise ConnectionError("WebSocket cerrado")
+        return datos
+
+    def _bucle_ws(self, conexion):
+        while conexion.abierta:
+            primero, segundo = self._leer(2)
+            opcode = primero & 0x0F
+            longitud = segundo & 0x7F
+            if longitud == 126:
+                longitud = struct.unpack("!H", self._leer(2))[0]
+            elif longitud == 127:
+                longitud = struct.unpack("!Q", self._leer(8))[0]
+            mascara = self._leer(4) if segundo & 0x80 else b"\0\0\0\0"
+            datos = bytes(b ^ mascara[i % 4] for i, b in enumerate(self._leer(longitud)))
+
+            if opcode == 0x8:
+                conexion.enviar_trama(0x8, b"")
+                return
+            if opcode == 0x9:
+                conexion.enviar_trama(0xA, datos)
+                continue
+            if opcode != 0x1:
+                continue
+            try:
+                mensaje = json.loads(datos)
+            except ValueError:
+                continue
+            self._mensaje_ws(conexion, mensaje)
+
+    def _mensaje_ws(self, conexion, mensaje):
+        if mensaje.get("method") == "ping":
+            conexion.enviar({"channel": "pong"})
+            return
+        if mensaje.get("method") != "subscribe":
+            return
+        suscripcion = mensaje.get("subscription") or {}
+        tipo = suscripcion.get("type")
+        if tipo == "allMids":
+            conexion.all_mids = True
+        elif tipo == "l2Book" and suscripcion.get("coin"):
+            conexion.monedas_l2.add(suscripcion["coin"])
+        elif tipo == "userFills":
+            conexion.usuario_fills = suscripcion.get("user")
+            conexion.enviar({"channel": "userFills", "data": {"isSnapshot": True, "user": conexion.usuario_fills,
+                                                              "fills": list(self.server.exchange.fills)[:100]}})
+        conexion.enviar({"channel": "subscriptionResponse", "data": mensaje})
+
+
+def arrancar(num_simbolos=50, puerto=8899, host="127.0.0.1", paso=1.0, latencia_ms=0.0, jitter_ms=0.0,
+             prob_error=0.0, prob_429=0.0, saldo_inicial=10000.0, semilla=None):
+    """
+    Arranca el exchange simulado en segundo plano (útil también dentro de un proceso de pruebas)
+
+    Returns:
+        ServidorSimulado: servidor en marcha; su URL es f"http://{host}:{puerto}"
+    """
+    mercado = MercadoSimulado(num_simbolos, semilla=semilla)
+    exchange = ExchangeSimulado(mercado, saldo_inicial=saldo_inicial, paso=paso)
+    servidor = ServidorSimulado((host, puerto), exchange, latencia_ms, jitter_ms, prob_error, prob_429)
+    exchange.iniciar(al_avanzar=servidor.difundir_mercado)
+    threading.Thread(target=servidor.serve_forever, name="servidor-simulado", daemon=True).start()
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exchange Hyperliquid simulado en localhost")
+    parser.add_argument("--simbolos", type=int, default=200)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8899)
+    parser.add_argument("--paso", type=float, default=1.0, help="Segundos entre movimientos del mercado")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia media añadida a cada petición")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--prob-error", type=float, default=0.0, help="Probabilidad de responder 500")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="Probabilidad de responder 429")
+    parser.add_argument("--saldo", type=float, default=10000.0)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--estadisticas-sec", type=float, default=30, help="Cada cuánto imprimir estadísticas")
+    args = parser.parse_args()
+
+    servidor = arrancar(args.simbolos, args.puerto, args.host, args.paso, args.latencia_ms, args.jitter_ms,
+                        args.prob_error, args.prob_429, args.saldo, args.semilla)
+    print(f"Exchange simulado con {args.simbolos} símbolos en http://{args.host}:{args.puerto} "
+          f"(WebSocket en ws://{args.host}:{args.puerto}/ws)")
+    try:
+        while True:
+            time.sleep(args.estadisticas_sec)
+            estadisticas = servidor.estadisticas()
+            for ruta, datos in estadisticas["rutas"].items():
+                print(f"[SIM] {ruta}: {datos['peticiones']} peticiones | media {datos['media_ms']:.1f} ms | "
+                      f"máx {datos['max_ms']:.1f} ms")
+            print(f"[SIM] {estadisticas['contadores']} | posiciones abiertas: {estadisticas['posiciones']} | "
+                  f"WebSocket: {estadisticas['conexiones_ws']}")
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,253 @@
+# feed_mercado.py
+import json
+import threading
+import time
+import logging
+
+import websocket
+
+
+class FeedMercadoWS:
+    """
+    Mantiene en memoria el mejor bid/ask y el libro L2 de cada moneda
+    a partir de las suscripciones WebSocket 'l2Book' y 'allMids' de Hyperliquid.
+    Opcionalmente reenvía los llenados de la cuenta ('userFills') a sus oyentes.
+
+    La URL es configurable para poder apuntar a un servidor WebSocket local
+    de pruebas en lugar del de Hyperliquid. Con una sesión de grabacion.py los
+    mensajes recibidos se graban, o se reproducen los grabados sin conectarse.
+    """
+
+    def __init__(self, ws_url, intervalo_ping=50, espera_reconexion=2, sesion=None):
+        self.ws_url = ws_url
+        self.sesion = sesion
+        self.intervalo_ping = intervalo_ping
+        self.espera_reconexion = espera_reconexion
+
+        self._lock = threading.Lock()
+        self._libros = {}        # coin -> {'bids': [[px, sz], ...], 'asks': [...], 'ts': monotonic}
+        self._mids = {}          # coin -> (mid, monotonic)
+        self._monedas_l2 = set()
+        self._all_mids = False
+        self._oyentes_mids = []  # Funciones llamadas con {coin: mid} en cada actualización de allMids
+        self._usuario_fills = None
+        self._oyentes_fills = [] # Funciones llamadas con la lista de fills nuevos de la cuenta
+
+        self._ws = None
+        self._conectado = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._hilo_ping = None
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def iniciar(self):
+        """Arranca el hilo de conexión (idempotente)"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        if self.sesion is not None and self.sesion.reproduciendo:
+            self._hilo = threading.Thread(target=self._bucle_reproduccion, name="feed-mercado-replay", daemon=True)
+            self._hilo.start()
+            return
+        self._hilo = threading.Thread(target=self._bucle_conexion, name="feed-mercado-ws", daemon=True)
+        self._hilo.start()
+        self._hilo_ping = threading.Thread(target=self._bucle_ping, name="feed-mercado-ping", daemon=True)
+        self._hilo_ping.start()
+
+    def detener(self):
+        """Cierra la conexión y detiene los hilos"""
+        self._detener.set()
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+    def esperar_conexion(self, timeout=None):
+        """Bloquea hasta que el WebSocket esté conectado o venza el timeout"""
+        return self._conectado.wait(timeout)
+
+    @property
+    def conectado(self):
+        return self._conectado.is_set()
+
+    def _bucle_conexion(self):
+        # run_forever vuelve al perder la conexión: reconectamos y re-suscribimos
+        while not self._detener.is_set():
+            try:
+                self._ws = websocket.WebSocketApp(
+                    self.ws_url,
+                    on_open=self._on_open,
+                    on_message=self._on_message,
+                    on_error=self._on_error,
+                    on_close=self._on_close
+                )
+                self._ws.run_forever()
+            except Exception as e:
+                logging.error(f"Error en la conexión WebSocket de mercado: {e}", exc_info=True)
+            self._conectado.clear()
+            if not self._detener.is_set():
+                time.sleep(self.espera_reconexion)
+
+    def _bucle_reproduccion(self):
+        self._conectado.set()
+        self.sesion.reproducir_ws(lambda mensaje: self._on_message(None, mensaje), self._detener)
+
+    def _bucle_ping(self):
+        while not self._detener.wait(self.intervalo_ping):
+            if self._conectado.is_set():
+                self._enviar({"method": "ping"})
+
+    # ------------------------------------------------------------------
+    # Suscripciones
+    # ------------------------------------------------------------------
+    def suscribir_l2(self, monedas):
+        """Suscribe el libro L2 de cada moneda (las ya suscritas se ignoran)"""
+        nuevas = []
+        with self._lock:
+            for coin in monedas:
+                if coin not in self._monedas_l2:
+                    self._monedas_l2.add(coin)
+                    nuevas.append(coin)
+        if self._conectado.is_set():
+            for coin in nuevas:
+                self._enviar({"method": "subscribe", "subscription": {"type": "l2Book", "coin": coin}})
+
+    def suscribir_all_mids(self):
+        """Suscribe los precios medios de todas las monedas"""
+        with self._lock:
+            ya_suscrito = self._all_mids
+            self._all_mids = True
+        if not ya_suscrito and self._conectado.is_set():
+            self._enviar({"method": "subscribe", "subscription": {"type": "allMids"}})
+
+    def agregar_oyente_mids(self, funcion):
+        """Registra una función que recibe {coin: mid} en cada actualización de allMids (hilo del WebSocket)"""
+        with self._lock:
+            if funcion not in self._oyentes_mids:
+                self._oyentes_mids.append(funcion)
+
+    def suscribir_fills(self, usuario, funcion):
+        """Suscribe los llenados de la cuenta y registra la función que los recibe (hilo del WebSocket)"""
+        with self._lock:
+            ya_suscrito = self._usuario_fills is not None
+            self._usuario_fills = usuario
+            if funcion not in self._oyentes_fills:
+                self._oyentes_fills.append(funcion)
+        if not ya_suscrito and self._conectado.is_set():
+            self._enviar({"method": "subscribe", "subscription": {"type": "userFills", "user": usuario}})
+
+    def _enviar(self, mensaje):
+        if self._ws is None:
+            return
+        try:
+            self._ws.send(json.dumps(mensaje))
+        except Exception as e:
+            logging.error(f"Error enviando mensaje WebSocket {mensaje}: {e}")
+
+    # ------------------------------------------------------------------
+    # Callbacks de websocket-client
+    # ------------------------------------------------------------------
+    def _on_open(self, _ws):
+        self._conectado.set()
+        with self._lock:
+            monedas = list(self._monedas_l2)
+            all_mids = self._all_mids
+            usuario_fills = self._usuario_fills
+        if usuario_fills:
+            self._enviar({"method": "subscribe", "subscription": {"type": "userFills", "user": usuario_fills}})
+        if all_mids:
+            self._enviar({"method": "subscribe", "subscription": {"type": "allMids"}})
+        for coin in monedas:
+            self._enviar({"method": "subscribe", "subscription": {"type": "l2Book", "coin": coin}})
+
+    def _on_close(self, _ws, *args):
+        self._conectado.clear()
+
+    def _on_error(self, _ws, error):
+        logging.error(f"Error en WebSocket de mercado: {error}")
+
+    def _on_message(self, _ws, mensaje):
+        if self.sesion is not None and self.sesion.grabando:
+            self.sesion.registrar_ws(mensaje)
+        try:
+            msg = json.loads(mensaje)
+        except ValueError:
+            # p.ej. "Websocket connection established."
+            return
+
+        canal = msg.get("channel")
+        if canal == "l2Book":
+            self._procesar_l2(msg.get("data") or {})
+        elif canal == "allMids":
+            self._procesar_mids(msg.get("data") or {})
+        elif canal == "userFills":
+            self._procesar_fills(msg.get("data") or {})
+
+    def _procesar_l2(self, data):
+        coin = data.get("coin")
+        levels = data.get("levels") or []
+        if not coin:
+            return
+        # levels[0] son bids (compras), levels[1] son asks (ventas)
+        bids = [[nivel['px'], nivel['sz']] for nivel in levels[0]] if len(levels) > 0 else []
+        asks = [[nivel['px'], nivel['sz']] for nivel in levels[1]] if len(levels) > 1 else []
+        with self._lock:
+            self._libros[coin] = {'bids': bids, 'asks': asks, 'ts': time.monotonic()}
+
+    def _procesar_mids(self, data):
+        mids = data.get("mids") or {}
+        ahora = time.monotonic()
+        actualizados = {}
+        with self._lock:
+            for coin, mid in mids.items():
+                try:
+                    actualizados[coin] = float(mid)
+                except (ValueError, TypeError):
+                    continue
+                self._mids[coin] = (actualizados[coin], ahora)
+            oyentes = list(self._oyentes_mids)
+        for oyente in oyentes:
+            try:
+                oyente(actualizados)
+            except Exception as e:
+                logging.error(f"Error en oyente de allMids: {e}", exc_info=True)
+
+    def _procesar_fills(self, data):
+        # El primer mensaje tras suscribir es el histórico reciente: no son llenados nuevos
+        if data.get("isSnapshot"):
+            return
+        fills = data.get("fills") or []
+        with self._lock:
+            oyentes = list(self._oyentes_fills)
+        for oyente in oyentes:
+            try:
+                oyente(fills)
+            except Exception as e:
+                logging.error(f"Error en oyente de userFills: {e}", exc_info=True)
+
+    # ------------------------------------------------------------------
+    # Consultas (sin I/O)
+    # ------------------------------------------------------------------
+    def obtener_libro(self, coin, max_antiguedad):
+        """
+        Devuelve el último libro recibido para la moneda
+
+        Returns:
+            dict: {'bids': [...], 'asks': [...]} o None si no hay datos o están obsoletos
+        """
+        with self._lock:
+            libro = self._libros.get(coin)
+            if libro is None or time.monotonic() - libro['ts'] > max_antiguedad:
+                return None
+            return {'bids': libro['bids'], 'asks': libro['asks']}
+
+    def obtener_mid(self, coin, max_antiguedad):
+        """Devuelve el último precio medio de allMids o None si no hay dato fresco"""
+        with self._lock:
+            dato = self._mids.get(coin)
+        if dato is None or time.monotonic() - dato[1] > max_antiguedad:
+            return None
+        return dato[0]
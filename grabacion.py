@@ -0,0 +1,284 @@
+# grabacion.py
+import asyncio
+import atexit
+import gzip
+import json
+import threading
+import time
+import zlib
+import logging
+from collections import deque
+
+import requests
+from hyperliquid.api import API
+from hyperliquid.utils.error import ClientError, ServerError
+
+import config
+from transporte import obtener_transporte
+
+CANAL_HTTP = "http"
+CANAL_WS = "ws"
+
+
+def _abrir(ruta):
+    # .gz: un flujo gzip por grabación (varios seguidos si se añadió a un archivo existente)
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, "rt", encoding="utf-8")
+    return open(ruta, "r", encoding="utf-8")
+
+
+def _normalizar(url_path, payload):
+    """Parte determinista de una petición: sin nonce ni firma en /exchange"""
+    payload = payload or {}
+    if url_path == "/exchange":
+        return {"action": payload.get("action")}
+    return payload
+
+
+def _clave_exacta(url_path, payload):
+    return json.dumps([url_path, payload], sort_keys=True, separators=(",", ":"))
+
+
+def _clave_relajada(url_path, payload):
+    """Tipo de petición y moneda/usuario, sin ventanas de tiempo (candleSnapshot) ni precios"""
+    payload = payload or {}
+    if url_path == "/exchange":
+        return f"{url_path}|{(payload.get('action') or {}).get('type')}"
+    req = payload.get("req") or {}
+    return "|".join(str(v) for v in (url_path, payload.get("type"), payload.get("coin"), payload.get("user"),
+                                     req.get("coin"), req.get("interval")))
+
+
+class GrabadorSesion:
+    """
+    Graba en un archivo JSONL de solo añadido cada petición/respuesta de la API
+    (/info y /exchange) y cada mensaje del WebSocket, con su instante relativo.
+
+    Cada línea es {"t": segundos, "c": "http"|"ws", "p": ruta, "q": petición,
+    "r": respuesta} o, si la petición falló, "e": {"s": código HTTP, "m": mensaje}.
+    De las acciones /exchange solo se guarda la acción (sin nonce ni firma).
+    """
+
+    grabando = True
+    reproduciendo = False
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._inicio = time.monotonic()
+        self._lock = threading.Lock()
+        self._comprimido = ruta.endswith(".gz")
+        # Un solo flujo gzip para todo el archivo: las líneas se comprimen con el contexto de las anteriores
+        self._compresor = zlib.compressobj(wbits=31) if self._comprimido else None
+        self._archivo = open(ruta, "ab")
+        # Sin cerrar() explícito la sesión también queda cerrada al salir
+        atexit.register(self.cerrar)
+
+    def _escribir(self, entrada):
+        entrada["t"] = round(time.monotonic() - self._inicio, 4)
+        linea = (json.dumps(entrada, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._archivo.closed:
+                return
+            if self._comprimido:
+                # Z_SYNC_FLUSH: si el proceso muere sin cerrar el flujo, lo ya escrito se puede leer
+                linea = self._compresor.compress(linea) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+            self._archivo.write(linea)
+            self._archivo.flush()
+
+    def registrar_http(self, url_path, payload, respuesta=None, error=None):
+        entrada = {"c": CANAL_HTTP, "p": url_path, "q": _normalizar(url_path, payload)}
+        if error is not None:
+            entrada["e"] = {"s": getattr(error, "status_code", None), "m": str(error)}
+        else:
+            entrada["r"] = respuesta
+        self._escribir(entrada)
+
+    def registrar_ws(self, mensaje):
+        self._escribir({"c": CANAL_WS, "r": mensaje})
+
+    def envolver_api(self, api):
+        """Graba todas las llamadas a api.post de un objeto API del SDK (Info, Exchange)"""
+        post_original = api.post
+
+        def post(url_path, payload=None):
+            try:
+                respuesta = post_original(url_path, payload)
+            except Exception as e:
+                self.registrar_http(url_path, payload, error=e)
+                raise
+            self.registrar_http(url_path, payload, respuesta)
+            return respuesta
+
+        api.post = post
+        return api
+
+    def metadatos_sdk(self):
+        """
+        Descarga (y graba) meta y spotMeta para construir Info/Exchange sin que
+        el SDK haga esas consultas por su cuenta, fuera de la grabación
+
+        Returns:
+            tuple: (meta, spot_meta)
+        """
+        api = self.envolver_api(obtener_transporte().adoptar(API(config.API_URL)))
+        return api.post("/info", {"type": "meta"}), api.post("/info", {"type": "spotMeta"})
+
+    def cerrar(self):
+        with self._lock:
+            if not self._archivo.closed:
+                if self._comprimido:
+                    self._archivo.write(self._compresor.flush(zlib.Z_FINISH))
+                self._archivo.close()
+
+
+class ReproductorSesion:
+    """
+    Sirve una sesión grabada por GrabadorSesion sin red.
+
+    Cada petición recibe la siguiente respuesta grabada con la misma petición
+    exacta o, si no existe (p.ej. ventanas de tiempo de candleSnapshot), con el
+    mismo tipo y moneda. Agotadas, se repite la última: el resultado es
+    determinista. Con 'velocidad' las respuestas y los mensajes del WebSocket se
+    entregan al ritmo grabado dividido por ese factor; con None, sin esperas.
+    """
+
+    grabando = False
+    reproduciendo = True
+
+    def __init__(self, ruta, velocidad=None):
+        self.ruta = ruta
+        self.velocidad = velocidad
+        self._lock = threading.Lock()
+        self._inicio = None
+        self._http = []
+        self._ws = []
+        self._exactas = {}
+        self._relajadas = {}
+        self._ultimas = {}
+        self._cargar()
+
+    def _cargar(self):
+        with _abrir(self.ruta) as f:
+            try:
+                for numero, linea in enumerate(f, 1):
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        # Última línea a medio escribir si la grabación se interrumpió
+                        logging.error(f"Línea {numero} no válida en {self.ruta}")
+                        continue
+                    self._anadir(entrada)
+            except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+                # Flujo gzip sin terminar (grabación interrumpida): se conserva lo leído hasta ahí
+                print(f"Sesión {self.ruta} truncada: se reproduce hasta el último registro completo ({e})")
+                logging.error(f"Sesión {self.ruta} truncada: {e}")
+        self._usadas = [False] * len(self._http)
+        print(f"Sesión {self.ruta}: {len(self._http)} respuestas HTTP y {len(self._ws)} mensajes WebSocket")
+
+    def _anadir(self, entrada):
+        if entrada.get("c") == CANAL_WS:
+            self._ws.append(entrada)
+            return
+        indice = len(self._http)
+        self._http.append(entrada)
+        self._exactas.setdefault(_clave_exacta(entrada["p"], entrada.get("q")), deque()).append(indice)
+        self._relajadas.setdefault(_clave_relajada(entrada["p"], entrada.get("q")), deque()).append(indice)
+
+    def _marcar_inicio(self):
+        with self._lock:
+            if self._inicio is None:
+                self._inicio = time.monotonic()
+            return self._inicio
+
+    def _espera(self, entrada):
+        """Segundos hasta el instante grabado de la entrada (escalado por la velocidad)"""
+        if not self.velocidad:
+            return 0.0
+        return self._marcar_inicio() + entrada.get("t", 0) / self.velocidad - time.monotonic()
+
+    def _siguiente(self, url_path, payload):
+        normalizado = _normalizar(url_path, payload)
+        claves = (_clave_exacta(url_path, normalizado), _clave_relajada(url_path, normalizado))
+        with self._lock:
+            for indices, clave in ((self._exactas.get(claves[0]), claves[0]),
+                                   (self._relajadas.get(claves[1]), claves[1])):
+                while indices:
+                    indice = indices.popleft()
+                    if not self._usadas[indice]:
+                        self._usadas[indice] = True
+                        self._ultimas[claves[0]] = self._ultimas[claves[1]] = indice
+                        return self._http[indice]
+            for clave in claves:
+                if clave in self._ultimas:
+                    return self._http[self._ultimas[clave]]
+        raise LookupError(f"Sin respuesta grabada para {url_path} {normalizado}")
+
+    @staticmethod
+    def _resultado(entrada):
+        error = entrada.get("e")
+        if error is None:
+            return entrada.get("r")
+        estado = error.get("s")
+        if estado is None:
+            raise requests.exceptions.ConnectionError(error.get("m"))
+        if estado < 500:
+            raise ClientError(estado, None, error.get("m"), None)
+        raise ServerError(estado, error.get("m"))
+
+    def responder(self, url_path, payload=None):
+        entrada = self._siguiente(url_path, payload)
+        espera = self._espera(entrada)
+        if espera > 0:
+            time.sleep(espera)
+        return self._resultado(entrada)
+
+    async def responder_async(self, url_path, payload=None):
+        entrada = self._siguiente(url_path, payload)
+        espera = self._espera(entrada)
+        if espera > 0:
+            await asyncio.sleep(espera)
+        return self._resultado(entrada)
+
+    def envolver_api(self, api):
+        """Sustituye api.post por la respuesta grabada (sin red ni limitador)"""
+        api.post = self.responder
+        return api
+
+    def metadatos_sdk(self):
+        return self.responder("/info", {"type": "meta"}), self.responder("/info", {"type": "spotMeta"})
+
+    def reproducir_ws(self, al_recibir, detener):
+        """Entrega los mensajes WebSocket grabados a 'al_recibir' hasta agotarlos o 'detener'"""
+        for entrada in self._ws:
+            espera = self._espera(entrada)
+            if espera > 0 and detener.wait(espera):
+                return
+            if detener.is_set():
+                return
+            al_recibir(entrada["r"])
+
+    def cerrar(self):
+        pass
+
+
+_sesion = None
+_sesion_creada = False
+_lock_sesion = threading.Lock()
+
+
+def obtener_sesion():
+    """
+    Grabación o reproducción activa según config.SESION_MODO ("grabar" / "reproducir")
+
+    Returns:
+        GrabadorSesion, ReproductorSesion o None si no hay ninguna activa
+    """
+    global _sesion, _sesion_creada
+    with _lock_sesion:
+        if not _sesion_creada:
+            _sesion_creada = True
+            if config.SESION_MODO == "grabar":
+                _sesion = GrabadorSesion(config.SESION_ARCHIVO)
+            elif config.SESION_MODO == "reproducir":
+                _sesion = ReproductorSesion(config.SESION_ARCHIVO, config.SESION_VELOCIDAD)
+        return _sesion
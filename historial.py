@@ -0,0 +1,359 @@
+# historial.py
+import io
+import json
+import os
+import threading
+import logging
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Sin pyarrow el panel sigue leyendo los CSV
+    pa = pq = None
+
+import pandas as pd
+
+DIRECTORIO_HISTORIAL = "historial"
+
+# Tabla de historial para cada tipo de evento del diario
+TABLAS = {"cerrada": "pnl", "dca": "dca"}
+
+COLUMNAS = {
+    "pnl": [("symbol", "texto"), ("direccion", "texto"), ("precio_entrada", "real"), ("precio_salida", "real"),
+            ("tp", "real"), ("pnl_real", "real"), ("tiempo_abierto", "texto"), ("tiempo_abierto_seg", "real"),
+            ("razon_cierre", "texto")],
+    "dca": [("symbol", "texto"), ("direccion", "texto"), ("entry_original", "real"), ("precio_dca", "real"),
+            ("tamano_dca", "real"), ("precio_promedio", "real"), ("nuevo_tp", "real"), ("num_dca", "entero")],
+}
+
+
+def disponible():
+    return pq is not None
+
+
+def _esquema(tabla):
+    tipos = {"texto": pa.string(), "real": pa.float64(), "entero": pa.int64()}
+    return pa.schema([("timestamp", pa.timestamp("s"))] + [(nombre, tipos[tipo]) for nombre, tipo in COLUMNAS[tabla]])
+
+
+def _convertir(valor, tipo):
+    if valor in (None, "", "N/A"):
+        return None
+    if tipo == "texto":
+        return str(valor)
+    try:
+        return int(float(valor)) if tipo == "entero" else float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def segundos_tiempo_abierto(texto):
+    """'H:MM:SS' (o 'N days, H:MM:SS' de str(timedelta)) a segundos; None si no se puede interpretar"""
+    if texto in (None, "", "N/A"):
+        return None
+    try:
+        dias = 0
+        if "day" in texto:
+            parte_dias, texto = texto.split(",")
+            dias = int(parte_dias.split()[0])
+        h, m, s = texto.strip().split(":")
+        return dias * 86400 + int(h) * 3600 + int(m) * 60 + float(s)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fila(tabla, evento):
+    datos = evento["datos"]
+    fila = {"timestamp": datetime.fromtimestamp(evento["ts"]).replace(microsecond=0)}
+    for nombre, tipo in COLUMNAS[tabla]:
+        fila[nombre] = _convertir(datos.get(nombre), tipo)
+    if tabla == "pnl":
+        fila["tiempo_abierto"] = fila["tiempo_abierto"] or "N/A"
+        fila["tiempo_abierto_seg"] = segundos_tiempo_abierto(datos.get("tiempo_abierto"))
+    return fila
+
+
+class HistorialColumnar:
+    """
+    Historial de trades (pnl) y DCA en Parquet, particionado por día:
+
+        historial/<tabla>/fecha=AAAA-MM-DD/parte-<offset>.parquet
+
+    'sincronizar' lleva al almacén los eventos nuevos del diario (cada lote es un
+    archivo 'parte' por día, con el offset del diario donde empieza) y
+    'compactar' junta las partes de los días cerrados en un único archivo
+    'compacto-<offset>.parquet'. 'leer' solo abre las particiones del rango de
+    fechas pedido y filtra por símbolo dentro de los archivos.
+    """
+
+    def __init__(self, ruta=DIRECTORIO_HISTORIAL):
+        self.ruta = ruta
+        self.ruta_marca = os.path.join(ruta, "_marca.json")
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def _offset(self):
+        try:
+            with open(self.ruta_marca, "r") as f:
+                return json.load(f)["offset"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _guardar_offset(self, offset):
+        os.makedirs(self.ruta, exist_ok=True)
+        temporal = self.ruta_marca + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump({"offset": offset}, f)
+        os.replace(temporal, self.ruta_marca)
+
+    @staticmethod
+    def _escribir(ruta, datos):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = ruta + ".tmp"
+        pq.write_table(datos, temporal)
+        os.replace(temporal, ruta)
+
+    def sincronizar(self, diario):
+        """
+        Escribe en Parquet los eventos del diario posteriores a la última sincronización
+
+        Args:
+            diario (DiarioEventos): Diario de eventos del bot
+
+        Returns:
+            int: Filas añadidas al historial
+        """
+        desde = self._offset()
+        hasta = desde
+        grupos = {}   # (tabla, fecha) -> filas
+        for hasta, evento in diario.leer(desde):
+            tabla = TABLAS.get(evento["tipo"])
+            if tabla is None:
+                continue
+            fila = _fila(tabla, evento)
+            grupos.setdefault((tabla, fila["timestamp"].date().isoformat()), []).append(fila)
+
+        # Las partes se nombran por el offset inicial: un reintento tras un corte sobrescribe la misma parte
+        for (tabla, fecha), filas in grupos.items():
+            self._escribir(os.path.join(self.ruta, tabla, f"fecha={fecha}", f"parte-{desde:012d}.parquet"),
+                           pa.Table.from_pylist(filas, schema=_esquema(tabla)))
+        if hasta != desde:
+            self._guardar_offset(hasta)
+        return sum(len(filas) for filas in grupos.values())
+
+    def compactar(self, dias_abiertos=1):
+        """
+        Junta en un solo archivo las partes de cada día cerrado (excepto los
+        'dias_abiertos' más recientes, que aún reciben partes nuevas)
+
+        Returns:
+            int: Particiones compactadas
+        """
+        limite = (datetime.now().date() - timedelta(days=dias_abiertos - 1)).isoformat()
+        compactadas = 0
+        for tabla in COLUMNAS:
+            for fecha, directorio in self._particiones(tabla):
+                if fecha >= limite:
+                    continue
+                archivos = self._archivos(directorio)
+                if len(archivos) < 2:
+                    continue
+                ultimo = max(self._offset_archivo(archivo) for archivo in archivos)
+                datos = pa.concat_tables([pq.read_table(archivo, schema=_esquema(tabla)) for archivo in archivos])
+                self._escribir(os.path.join(directorio, f"compacto-{ultimo:012d}.parquet"), datos)
+                # Hasta borrar las partes, los lectores ya ignoran las cubiertas por el compacto
+                for archivo in archivos:
+                    if os.path.basename(archivo) != f"compacto-{ultimo:012d}.parquet":
+                        os.remove(archivo)
+                compactadas += 1
+        return compactadas
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _offset_archivo(archivo):
+        return int(os.path.basename(archivo).split("-", 1)[1].split(".")[0])
+
+    def _particiones(self, tabla):
+        base = os.path.join(self.ruta, tabla)
+        if not os.path.isdir(base):
+            return []
+        return sorted((nombre.split("=", 1)[1], os.path.join(base, nombre))
+                      for nombre in os.listdir(base) if nombre.startswith("fecha="))
+
+    def _archivos(self, directorio):
+        """Archivos vigentes de una partición: el compacto más reciente y las partes posteriores a él"""
+        nombres = [n for n in os.listdir(directorio) if n.endswith(".parquet")]
+        compactos = [n for n in nombres if n.startswith("compacto-")]
+        cubierto = max((self._offset_archivo(n) for n in compactos), default=-1)
+        vigentes = [max(compactos)] if compactos else []
+        vigentes += sorted(n for n in nombres if n.startswith("parte-") and self._offset_archivo(n) > cubierto)
+        return [os.path.join(directorio, n) for n in vigentes]
+
+    @staticmethod
+    def _leer_archivo(tabla, archivo, columnas=None, filtros=None):
+        return pq.read_table(archivo, columns=columnas, filters=filtros, schema=_esquema(tabla))
+
+    def fechas(self, tabla):
+        """(primera, última) fecha con datos, solo a partir de los nombres de partición"""
+        particiones = self._particiones(tabla)
+        if not particiones:
+            return None, None
+        return (datetime.fromisoformat(particiones[0][0]).date(),
+                datetime.fromisoformat(particiones[-1][0]).date())
+
+    def leer(self, tabla, desde=None, hasta=None, simbolos=None, columnas=None):
+        """
+        Lee el historial de una tabla abriendo solo las particiones necesarias
+
+        Args:
+            tabla (str): "pnl" o "dca"
+            desde, hasta (date, optional): Rango de fechas incluido
+            simbolos (list, optional): Solo estos símbolos (filtro dentro de cada archivo)
+            columnas (list, optional): Solo estas columnas
+
+        Returns:
+            DataFrame: Filas ordenadas por timestamp
+        """
+        archivos = []
+        for fecha, directorio in self._particiones(tabla):
+            if (desde and fecha < desde.isoformat()) or (hasta and fecha > hasta.isoformat()):
+                continue
+            archivos.extend(self._archivos(directorio))
+        esquema = _esquema(tabla)
+        if not archivos:
+            return esquema.empty_table().to_pandas()
+        filtros = [("symbol", "in", list(simbolos))] if simbolos else None
+        tablas = []
+        for archivo in archivos:
+            try:
+                tablas.append(self._leer_archivo(tabla, archivo, columnas, filtros))
+            except Exception as e:
+                print(f"Error leyendo {archivo}: {e}")
+                logging.error(f"Error leyendo {archivo}: {e}")
+        if not tablas:
+            return esquema.empty_table().to_pandas()
+        df = pa.concat_tables(tablas).to_pandas()
+        return df.sort_values("timestamp", ignore_index=True) if "timestamp" in df.columns else df
+
+
+class LectorCSVIncremental:
+    """
+    Lee un CSV de solo añadido parseando únicamente las filas nuevas desde la
+    lectura anterior: guarda el offset en bytes y el DataFrame ya parseado.
+
+    Si el archivo se trunca o se sustituye (otro inodo, p.ej. al regenerar la
+    vista desde el diario de eventos) se vuelve a leer desde el principio. Una
+    última línea sin salto de línea (escritura en curso) queda para la siguiente.
+    """
+
+    def __init__(self, ruta, preparar=None):
+        self.ruta = ruta
+        self.preparar = preparar   # DataFrame de filas nuevas -> DataFrame con tipos convertidos
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._identidad = None
+        self._offset = 0
+        self._columnas = None
+        self._df = pd.DataFrame()
+
+    def leer(self):
+        with self._lock:
+            try:
+                info = os.stat(self.ruta)
+            except FileNotFoundError:
+                self._reiniciar()
+                return self._df
+            
+            identidad = (info.st_dev, info.st_ino)
+            if identidad != self._identidad or info.st_size < self._offset:
+                # Archivo nuevo, rotado o truncado: lectura completa
+                self._reiniciar()
+                self._identidad = identidad
+            if info.st_size == self._offset:
+                return self._df
+            
+            with open(self.ruta, "rb") as f:
+                f.seek(self._offset)
+                bloque = f.read(info.st_size - self._offset)
+            fin = bloque.rfind(b"\n") + 1
+            if fin == 0:
+                return self._df
+            
+            if self._columnas is None:
+                nuevo = pd.read_csv(io.BytesIO(bloque[:fin]), on_bad_lines='skip', index_col=False)
+                self._columnas = list(nuevo.columns)
+            else:
+                nuevo = pd.read_csv(io.BytesIO(bloque[:fin]), header=None, names=self._columnas,
+                                    on_bad_lines='skip', index_col=False)
+            if self.preparar is not None:
+                nuevo = self.preparar(nuevo)
+            self._df = nuevo if len(self._df) == 0 else pd.concat([self._df, nuevo], ignore_index=True)
+            self._offset += fin
+            return self._df
+
+
+class LectorParquetIncremental:
+    """
+    Tabla completa del historial Parquet en memoria, leyendo solo lo nuevo en
+    cada llamada: de cada partición se guardan los archivos ya leídos y se
+    añaden únicamente los que aparecen después (las partes del día en curso).
+
+    Si desaparece algún archivo ya leído (la partición se ha compactado) esa
+    partición se vuelve a leer entera. Un archivo que no se puede leer deja su
+    partición como estaba para reintentarlo en la siguiente llamada.
+    """
+
+    def __init__(self, historial, tabla, preparar=None):
+        self.historial = historial
+        self.tabla = tabla
+        self.preparar = preparar   # DataFrame de filas nuevas -> DataFrame con columnas derivadas
+        self._lock = threading.Lock()
+        self._particiones = {}     # fecha -> (archivos leídos, DataFrame)
+        self._df = self._preparar(_esquema(tabla).empty_table().to_pandas())
+
+    def _preparar(self, df):
+        return self.preparar(df) if self.preparar is not None else df
+
+    def leer(self):
+        with self._lock:
+            particiones = dict(self.historial._particiones(self.tabla))
+            cambios = False
+            for fecha in list(self._particiones):
+                if fecha not in particiones:
+                    del self._particiones[fecha]
+                    cambios = True
+
+            for fecha, directorio in particiones.items():
+                archivos = self.historial._archivos(directorio)
+                leidos, df = self._particiones.get(fecha, ([], None))
+                if archivos == leidos:
+                    continue
+                nuevos = [archivo for archivo in archivos if archivo not in leidos]
+                if len(archivos) - len(nuevos) != len(leidos):
+                    # Partición compactada: el compacto sustituye a las partes ya leídas
+                    nuevos, df = archivos, None
+                try:
+                    tablas = [self.historial._leer_archivo(self.tabla, archivo) for archivo in nuevos]
+                except Exception as e:
+                    print(f"Error leyendo la partición {fecha} de {self.tabla}: {e}")
+                    logging.error(f"Error leyendo la partición {fecha} de {self.tabla}: {e}")
+                    continue
+                nuevo = self._preparar(pa.concat_tables(tablas).to_pandas())
+                df = nuevo if df is None else pd.concat([df, nuevo], ignore_index=True)
+                self._particiones[fecha] = (archivos, df)
+                cambios = True
+
+            if cambios:
+                marcos = [df for _, (_, df) in sorted(self._particiones.items()) if len(df)]
+                if marcos:
+                    self._df = pd.concat(marcos, ignore_index=True).sort_values(
+                        "timestamp", ignore_index=True, kind="stable")
+                else:
+                    self._df = self._preparar(_esquema(self.tabla).empty_table().to_pandas())
+            return self._df
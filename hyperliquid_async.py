@@ -0,0 +1,291 @@
+# hyperliquid_async.py
+import asyncio
+import functools
+import threading
+import time
+
+import aiohttp
+from eth_account import Account
+from hyperliquid.exchange import Exchange
+from hyperliquid.utils.types import Cloid
+
+from secret import WALLET_PRIVATE_KEY, WALLET_ADDRESS
+import config
+from transporte import obtener_transporte
+from limitador import obtener_limitador, peso_peticion, peso_respuesta
+from grabacion import obtener_sesion
+
+
+class AsyncHyperliquidClient:
+    """
+    Cliente asyncio de Hyperliquid con la misma interfaz que HyperliquidClient
+    (get_account, get_ohlcv, get_order_book, get_price, create_order, cancel_order).
+
+    Las consultas /info van por una sesión aiohttp con pool de conexiones y timeout
+    por petición, de modo que las descargas de todos los símbolos de un ciclo se
+    pueden lanzar a la vez con asyncio.gather. Las acciones de trading requieren la
+    firma del SDK, que es síncrona: se ejecutan en el executor del bucle.
+    """
+
+    def __init__(self, api_url=None, tamano_pool=None, timeout=None):
+        self.api_url = api_url or config.API_URL
+        self.tamano_pool = tamano_pool or config.ASYNC_POOL_SIZE
+        self.timeout = timeout or config.ASYNC_TIMEOUT_SEC
+
+        # Feed WebSocket opcional (el de HyperliquidClient) para libros y mids sin REST
+        self.feed = None
+
+        # Sesión grabada o en grabación (config.SESION_MODO)
+        self.sesion = obtener_sesion()
+
+        self._session = None
+        self._exchange = None
+        self._cuenta = None
+        self._cuenta_ts = 0.0
+        self._lock_cuenta = asyncio.Lock()
+        self.apalancamientos = {}
+
+    # ------------------------------------------------------------------
+    # Transporte
+    # ------------------------------------------------------------------
+    def _sesion(self):
+        # La sesión se crea dentro del bucle de eventos en el primer uso
+        if self._session is None or self._session.closed:
+            conector = aiohttp.TCPConnector(limit=self.tamano_pool, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=conector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def cerrar(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _info(self, payload, timeout=None):
+        """POST a /info y devuelve el JSON de la respuesta"""
+        if self.sesion is not None and self.sesion.reproduciendo:
+            return await self.sesion.responder_async("/info", payload)
+        limitador = obtener_limitador()
+        peso, prioridad = peso_peticion("/info", payload)
+        await limitador.adquirir_async(peso, prioridad)
+        opciones = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        try:
+            async with self._sesion().post(f"{self.api_url}/info", json=payload, **opciones) as respuesta:
+                if respuesta.status == 429:
+                    limitador.penalizar()
+                respuesta.raise_for_status()
+                datos = await respuesta.json()
+        except Exception as e:
+            if self.sesion is not None:
+                self.sesion.registrar_http("/info", payload, error=e)
+            raise
+        if self.sesion is not None:
+            self.sesion.registrar_http("/info", payload, datos)
+        limitador.cargar(peso_respuesta(payload, datos))
+        return datos
+
+    def _exchange_sdk(self):
+        # El Exchange del SDK consulta meta al construirse: solo se crea si se va a operar
+        if self._exchange is None:
+            meta, spot_meta = self.sesion.metadatos_sdk() if self.sesion else (None, None)
+            self._exchange = Exchange(Account.from_key(WALLET_PRIVATE_KEY), self.api_url,
+                                      meta=meta, spot_meta=spot_meta)
+            transporte = obtener_transporte()
+            limitador = obtener_limitador()
+            for api in (self._exchange, self._exchange.info):
+                transporte.adoptar(api)
+                limitador.limitar_api(api)
+                if self.sesion:
+                    self.sesion.envolver_api(api)
+        return self._exchange
+
+    async def _en_executor(self, funcion, *args, **kwargs):
+        bucle = asyncio.get_running_loop()
+        return await bucle.run_in_executor(None, functools.partial(funcion, *args, **kwargs))
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    async def get_account(self, max_age=None):
+        """
+        Estado de la cuenta (user_state), compartido mientras no supere el TTL
+
+        Args:
+            max_age (float, optional): Antigüedad máxima aceptada en segundos (0 fuerza consulta)
+        """
+        max_age = config.ACCOUNT_SNAPSHOT_TTL_SEC if max_age is None else max_age
+        async with self._lock_cuenta:
+            if self._cuenta is not None and time.monotonic() - self._cuenta_ts <= max_age:
+                return self._cuenta
+            self._cuenta = await self._info({"type": "clearinghouseState", "user": WALLET_ADDRESS})
+            self._cuenta_ts = time.monotonic()
+            return self._cuenta
+
+    def invalidar_cuenta(self):
+        self._cuenta = None
+
+    async def get_ohlcv(self, symbol, interval, limit, start_time=None):
+        """
+        Obtiene datos OHLCV para un símbolo
+
+        Returns:
+            list: Lista de diccionarios con datos OHLCV o None si hay error
+        """
+        try:
+            end_time = int(time.time() * 1000)
+            if start_time is None:
+                segundos = config.INTERVALO_SEGUNDOS.get(interval, 60) * limit
+                start_time = end_time - (segundos * 1000)
+
+            candles_data = await self._info({
+                "type": "candleSnapshot",
+                "req": {"coin": symbol, "interval": interval, "startTime": start_time, "endTime": end_time}
+            })
+            if not candles_data:
+                print(f"No hay datos OHLCV disponibles para {symbol}")
+                return None
+
+            return [{
+                'timestamp': candle['t'],
+                'open': float(candle['o']),
+                'high': float(candle['h']),
+                'low': float(candle['l']),
+                'close': float(candle['c']),
+                'volume': float(candle['v'])
+            } for candle in candles_data]
+        except Exception as e:
+            print(f"Error al obtener datos OHLCV para {symbol}: {str(e)}")
+            return None
+
+    async def get_order_book(self, symbol):
+        """Libro de órdenes {'bids': [[px, sz], ...], 'asks': [...]} (feed en memoria si es reciente)"""
+        if self.feed is not None:
+            order_book = self.feed.obtener_libro(symbol, config.WS_MAX_STALENESS_SEC)
+            if order_book is not None:
+                return order_book
+        try:
+            l2_snapshot = await self._info({"type": "l2Book", "coin": symbol})
+            levels = l2_snapshot.get("levels") or []
+            # Los niveles[0] son bids (compras), niveles[1] son asks (ventas)
+            return {
+                'bids': [[nivel['px'], nivel['sz']] for nivel in levels[0]] if len(levels) > 0 else [],
+                'asks': [[nivel['px'], nivel['sz']] for nivel in levels[1]] if len(levels) > 1 else [],
+            }
+        except Exception as e:
+            print(f"Error al obtener order book para {symbol}: {str(e)}")
+            return {'bids': [], 'asks': []}
+
+    async def get_price(self, symbol):
+        """Mejor bid, ask y precio medio"""
+        try:
+            if self.feed is not None and self.feed.obtener_libro(symbol, config.WS_MAX_STALENESS_SEC) is None:
+                mid = self.feed.obtener_mid(symbol, config.WS_MAX_STALENESS_SEC)
+                if mid is not None:
+                    return {"best_bid": None, "best_ask": None, "mid": mid}
+
+            order_book = await self.get_order_book(symbol)
+            best_ask = float(order_book['asks'][0][0]) if order_book['asks'] else None
+            best_bid = float(order_book['bids'][0][0]) if order_book['bids'] else None
+            mid = (best_ask + best_bid) / 2 if best_ask and best_bid else None
+            return {"best_bid": best_bid, "best_ask": best_ask, "mid": mid}
+        except Exception as e:
+            print(f"Error al obtener precio para {symbol}: {str(e)}")
+            return {"best_bid": None, "best_ask": None, "mid": None}
+
+    # ------------------------------------------------------------------
+    # Trading
+    # ------------------------------------------------------------------
+    async def set_leverage(self, symbol, leverage):
+        """Configura el apalancamiento (cross) si difiere del último confirmado"""
+        if self.apalancamientos.get(symbol) == leverage:
+            return {"status": "ok", "response": "sin cambios"}
+        try:
+            response = await self._en_executor(self._exchange_sdk().update_leverage, leverage, symbol)
+            if isinstance(response, dict) and response.get("status") == "ok":
+                self.apalancamientos[symbol] = leverage
+            return response
+        except Exception as e:
+            print(f"[{symbol}] Error al configurar apalancamiento: {e}")
+            return None
+
+    async def create_order(self, symbol, side, size, price=None, leverage=None, reduce_only=False, cloid=None):
+        """
+        Crea una orden de mercado (price=None) o límite GTC
+
+        Args:
+            reduce_only (bool): La orden límite solo puede reducir la posición (TP)
+            cloid (Cloid, optional): Identificador propio de la orden límite (permite cancelarla sin oid)
+
+        Returns:
+            dict: Respuesta de la orden
+        """
+        await self.set_leverage(symbol, leverage if leverage is not None else config.LEVERAGE)
+        is_buy = side.lower() == "buy"
+        self.invalidar_cuenta()
+        exchange = self._exchange_sdk()
+        if price is None:
+            print(f"[{symbol}] Creando orden de mercado: {side.upper()} {size}")
+            return await self._en_executor(exchange.market_open, symbol, is_buy, size)
+        print(f"[{symbol}] Creando orden límite: {side.upper()} {size} @ {price}")
+        return await self._en_executor(exchange.order, symbol, is_buy, size, price, {"limit": {"tif": "Gtc"}},
+                                       reduce_only=reduce_only, cloid=cloid)
+
+    async def cancel_order(self, symbol, order_id=None, cloid=None):
+        """Cancela una orden existente por su oid o, si no se conoce, por su cloid ("0x" + 32 hex)"""
+        self.invalidar_cuenta()
+        try:
+            if not order_id and cloid:
+                return await self._en_executor(self._exchange_sdk().cancel_by_cloid, symbol, Cloid(cloid))
+            return await self._en_executor(self._exchange_sdk().cancel, symbol, int(order_id))
+        except Exception as e:
+            print(f"Error al cancelar orden para {symbol}: {str(e)}")
+            return {"status": "error", "message": str(e)}
+
+
+class BucleAsync:
+    """Bucle de eventos en un hilo propio para lanzar corrutinas desde código síncrono"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self.loop.run_forever, name="bucle-async", daemon=True)
+        self._hilo.start()
+
+    def ejecutar(self, corrutina, timeout=None):
+        """Ejecuta la corrutina en el bucle y espera su resultado"""
+        return asyncio.run_coroutine_threadsafe(corrutina, self.loop).result(timeout)
+
+
+class ClienteSincrono:
+    """
+    Envoltorio síncrono de AsyncHyperliquidClient (p.ej. para el panel de Streamlit).
+    Todas las llamadas se ejecutan en un único bucle de eventos en segundo plano.
+    """
+
+    def __init__(self, cliente=None):
+        self.bucle = BucleAsync()
+        self.cliente = cliente or AsyncHyperliquidClient()
+
+    def ejecutar(self, corrutina, timeout=None):
+        return self.bucle.ejecutar(corrutina, timeout)
+
+    def get_account(self, max_age=None):
+        return self.ejecutar(self.cliente.get_account(max_age))
+
+    def invalidar_cuenta(self):
+        self.cliente.invalidar_cuenta()
+
+    def get_ohlcv(self, symbol, interval, limit, start_time=None):
+        return self.ejecutar(self.cliente.get_ohlcv(symbol, interval, limit, start_time))
+
+    def get_order_book(self, symbol):
+        return self.ejecutar(self.cliente.get_order_book(symbol))
+
+    def get_price(self, symbol):
+        return self.ejecutar(self.cliente.get_price(symbol))
+
+    def create_order(self, symbol, side, size, price=None, leverage=None, reduce_only=False, cloid=None):
+        return self.ejecutar(self.cliente.create_order(symbol, side, size, price, leverage, reduce_only, cloid))
+
+    def cancel_order(self, symbol, order_id=None, cloid=None):
+        return self.ejecutar(self.cliente.cancel_order(symbol, order_id, cloid))
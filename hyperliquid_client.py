@@ -1,44 +1,289 @@
 # hyperliquid_client.py
 from hyperliquid.exchange import Exchange
 from hyperliquid.info import Info
+from hyperliquid.utils.types import Cloid
 from eth_account import Account
 import time
+import secrets
+import threading
 from secret import WALLET_PRIVATE_KEY, WALLET_ADDRESS
 import config
+from feed_mercado import FeedMercadoWS
+from transporte import obtener_transporte
+from limitador import obtener_limitador
+from llenados import RegistroLlenados
+from grabacion import obtener_sesion
+from metadatos import ReglasActivo
+
+class AccountSnapshot:
+    """
+    Último estado de cuenta (user_state) compartido por todos los consumidores.
+    
+    Se considera válido mientras no supere el TTL y no haya sido invalidado.
+    Cada recarga incrementa 'generacion', de modo que quien lo necesite puede
+    saber si está viendo el mismo snapshot que en una lectura anterior.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.generacion = 0
+        self._datos = None
+        self._timestamp = 0.0
+        self._lock = threading.Lock()
+        
+    def obtener(self, cargar, max_age=None):
+        """
+        Devuelve el snapshot vigente o lo recarga con 'cargar' si ha caducado
+        
+        Args:
+            cargar (callable): Función que obtiene el estado de cuenta de la API
+            max_age (float, optional): Antigüedad máxima aceptada en segundos (por defecto el TTL)
+            
+        Returns:
+            dict: Estado de la cuenta
+        """
+        max_age = self.ttl if max_age is None else max_age
+        # El lock evita que varios consumidores recarguen a la vez el mismo snapshot
+        with self._lock:
+            if self._datos is not None and time.monotonic() - self._timestamp <= max_age:
+                return self._datos
+            datos = cargar()
+            self._datos = datos
+            self._timestamp = time.monotonic()
+            self.generacion += 1
+            return datos
+            
+    def invalidar(self):
+        """Fuerza que la siguiente lectura consulte la API"""
+        with self._lock:
+            self._datos = None
+
+class SnapshotMercado:
+    """
+    Datos de mercado de un ciclo del bot.
+    
+    Cada libro de órdenes se descarga como mucho una vez por ciclo y los precios
+    medios salen del feed WebSocket o de una única llamada allMids compartida por
+    todas las monedas. Se crea uno nuevo al inicio de cada ciclo (HyperliquidClient.snapshot_mercado).
+    """
+    def __init__(self, client):
+        self.client = client
+        self._libros = {}
+        self._mids = None
+        self._locks = {}
+        self._lock = threading.Lock()
+        
+    def _lock_para(self, clave):
+        with self._lock:
+            if clave not in self._locks:
+                self._locks[clave] = threading.Lock()
+            return self._locks[clave]
+        
+    def libro(self, symbol):
+        """Libro de órdenes del símbolo ({'bids': [...], 'asks': [...]}), descargado una vez por ciclo"""
+        with self._lock_para(symbol):
+            if symbol not in self._libros:
+                order_book = self.client.get_order_book(symbol)
+                # Un libro vacío (error) no se guarda para poder reintentar en el mismo ciclo
+                if not order_book or not order_book['bids'] or not order_book['asks']:
+                    return order_book
+                self._libros[symbol] = order_book
+            return self._libros[symbol]
+        
+    def precio(self, symbol):
+        """
+        Precio medio del símbolo
+        
+        Returns:
+            float: Mid del libro ya descargado, del feed o de allMids; None si no hay precio
+        """
+        order_book = self._libros.get(symbol)
+        if order_book is not None:
+            return (float(order_book['bids'][0][0]) + float(order_book['asks'][0][0])) / 2
+        
+        if self.client.feed is not None:
+            mid = self.client.feed.obtener_mid(symbol, config.WS_MAX_STALENESS_SEC)
+            if mid is not None:
+                return mid
+        
+        with self._lock_para("allMids"):
+            if self._mids is None:
+                self._mids = self.client.get_all_mids()
+        if symbol in self._mids:
+            return self._mids[symbol]
+        
+        # Último recurso: el libro del símbolo
+        order_book = self.libro(symbol)
+        if not order_book or not order_book['bids'] or not order_book['asks']:
+            return None
+        return (float(order_book['bids'][0][0]) + float(order_book['asks'][0][0])) / 2
+
+def nuevo_cloid():
+    return Cloid("0x" + secrets.token_hex(16))
+
+def _resumir_estado(estado):
+    """Resume el estado de una orden en la respuesta de /exchange ('filled', 'resting' o 'error')"""
+    if not isinstance(estado, dict):
+        # p.ej. "waitingForFill" / "waitingForTrigger" para el TP hijo: sin oid en la respuesta
+        return {"estado": estado}
+    if "filled" in estado:
+        return {"oid": estado["filled"].get("oid"), "estado": "filled",
+                "total_sz": float(estado["filled"].get("totalSz", 0)),
+                "avg_px": float(estado["filled"].get("avgPx", 0))}
+    if "resting" in estado:
+        return {"oid": estado["resting"].get("oid"), "estado": "resting"}
+    if "error" in estado:
+        return {"error": estado["error"]}
+    return {"estado": str(estado)}
+
+def resumir_respuesta(respuesta, indice=0):
+    """Estado resumido (ver _resumir_estado) de la orden 'indice' de una respuesta de /exchange"""
+    try:
+        return _resumir_estado(respuesta["response"]["data"]["statuses"][indice])
+    except (KeyError, IndexError, TypeError):
+        return {"error": str(respuesta)}
 
 class HyperliquidClient:
     def __init__(self):
         # Crear wallet desde la clave privada
         self.wallet = Account.from_key(WALLET_PRIVATE_KEY)
         
+        # Sesión grabada o en grabación (config.SESION_MODO): también sirve meta/spotMeta
+        # para que el SDK no los consulte por su cuenta al construirse
+        self.sesion = obtener_sesion()
+        meta, spot_meta = self.sesion.metadatos_sdk() if self.sesion else (None, None)
+        
         # Instancias para operar y consultar utilizando la API_URL de config.py
-        self.info = Info(config.API_URL)  # Para consultas
-        self.exchange = Exchange(self.wallet, config.API_URL)  # Para trading
+        # El WebSocket propio del SDK no se usa: el streaming lo gestiona FeedMercadoWS
+        self.info = Info(config.API_URL, skip_ws=True, meta=meta, spot_meta=spot_meta)  # Para consultas
+        self.exchange = Exchange(self.wallet, config.API_URL, meta=meta, spot_meta=spot_meta)  # Para trading
+        
+        # Conexiones keep-alive y timeouts compartidos (también los usa Telegram)
+        transporte = obtener_transporte()
+        # Presupuesto de peso por minuto compartido (prioridad para órdenes y cancelaciones)
+        limitador = obtener_limitador()
+        for api in (self.info, self.exchange, self.exchange.info):
+            transporte.adoptar(api)
+            limitador.limitar_api(api)
+            if self.sesion:
+                self.sesion.envolver_api(api)
         
         # Para mantener compatibilidad con la estructura que usas en tu bot
         # Creamos un atributo "order" que tiene un método "market"
-        self.order = self.OrderProxy(self.exchange)
+        self.order = self.OrderProxy(self.exchange, self.invalidar_cuenta)
+        
+        # Feed WebSocket de mercado (se activa con iniciar_streaming)
+        self.feed = None
+        
+        # Snapshot de cuenta compartido (una sola llamada a user_state por ciclo)
+        self.account_snapshot = AccountSnapshot(config.ACCOUNT_SNAPSHOT_TTL_SEC)
+        
+        # Último apalancamiento confirmado por símbolo (se sincroniza con user_state)
+        self.apalancamientos = {}
+        self._lock_apalancamiento = threading.Lock()
+        
+        # Llenados de la cuenta recibidos por WebSocket (confirmación de cierres sin sleeps)
+        self.llenados = RegistroLlenados()
+        try:
+            self.get_account()
+        except Exception as e:
+            print(f"No se pudo sincronizar el apalancamiento inicial: {e}")
         
     class OrderProxy:
-        def __init__(self, exchange):
+        def __init__(self, exchange, al_operar=None):
             self.exchange = exchange
+            self.al_operar = al_operar
             
         def market(self, symbol, size, is_buy=True):
             """Compatibilidad con la interfaz anterior"""
+            if self.al_operar:
+                self.al_operar()
             return self.exchange.market_open(symbol, is_buy, size)
         
-    def get_account(self):
-        # Devuelve el estado de la cuenta
-        return self.info.user_state(WALLET_ADDRESS)
+    def iniciar_streaming(self, symbols):
+        """
+        Activa el modo streaming: suscribe l2Book de los símbolos indicados y allMids.
+        Se puede llamar de nuevo para añadir símbolos.
+        
+        Args:
+            symbols (list): Símbolos cuyo libro se mantendrá en memoria
+        """
+        if not config.WS_ENABLED:
+            return
+        try:
+            if self.feed is None:
+                self.feed = FeedMercadoWS(config.WS_URL, sesion=self.sesion)
+                self.feed.suscribir_all_mids()
+                self.feed.suscribir_fills(WALLET_ADDRESS, self.llenados.registrar)
+                self.feed.iniciar()
+            self.feed.suscribir_l2(symbols)
+        except Exception as e:
+            print(f"Error iniciando streaming de mercado: {e}")
+        
+    def get_account(self, max_age=None):
+        """
+        Devuelve el estado de la cuenta desde el snapshot compartido
+        
+        Args:
+            max_age (float, optional): Antigüedad máxima aceptada en segundos (0 fuerza consulta)
+            
+        Returns:
+            dict: Estado de la cuenta (user_state)
+        """
+        # Cada recarga refresca también la caché de apalancamiento de las posiciones abiertas
+        return self.account_snapshot.obtener(
+            lambda: self._sincronizar_apalancamientos(self.info.user_state(WALLET_ADDRESS)), max_age)
+        
+    def invalidar_cuenta(self):
+        """Descarta el snapshot de cuenta (tras enviar o cancelar órdenes)"""
+        self.account_snapshot.invalidar()
+        
+    def snapshot_mercado(self):
+        """Crea el snapshot de mercado de un nuevo ciclo"""
+        return SnapshotMercado(self)
+        
+    def get_meta(self):
+        """Metadatos de todos los perpetuos (name, szDecimals, maxLeverage)"""
+        return self.info.meta()
+        
+    def get_meta_y_contextos(self):
+        """
+        Metadatos de todos los perpetuos y su contexto de mercado (volumen, open interest...)
+        en una sola llamada metaAndAssetCtxs
+        
+        Returns:
+            tuple: (meta, contextos) con meta['universe'][i] emparejado con contextos[i]
+        """
+        meta, contextos = self.info.meta_and_asset_ctxs()
+        return meta, contextos
+        
+    def get_all_mids(self):
+        """
+        Precios medios de todas las monedas en una sola llamada
+        
+        Returns:
+            dict: {coin: mid} (vacío si hay error)
+        """
+        try:
+            mids = {}
+            for coin, mid in self.info.all_mids().items():
+                try:
+                    mids[coin] = float(mid)
+                except (ValueError, TypeError):
+                    continue
+            return mids
+        except Exception as e:
+            print(f"Error al obtener allMids: {str(e)}")
+            return {}
 
-    def get_ohlcv(self, symbol, interval, limit):
+    def get_ohlcv(self, symbol, interval, limit, start_time=None):
         """
         Obtiene datos OHLCV para un símbolo
         
         Args:
             symbol (str): Símbolo del activo
             interval (str): Intervalo temporal ('1m', '5m', etc.)
-            limit (int): Cantidad de velas a obtener
+            limit (int): Cantidad de velas a obtener (se ignora si se indica start_time)
+            start_time (int, optional): Timestamp en ms desde el que pedir velas
         
         Returns:
             list: Lista de diccionarios con datos OHLCV o None si hay error
@@ -47,15 +292,10 @@ class HyperliquidClient:
             # Calcular timestamps (en milisegundos)
             end_time = int(time.time() * 1000)
             
-            # Mapea los intervalos a segundos
-            interval_segundos = {
-                "1m": 60, "5m": 300, "15m": 900, "30m": 1800,
-                "1h": 3600, "4h": 14400, "1d": 86400
-            }
-            
             # Calcula el tiempo de inicio basado en el intervalo y límite
-            segundos = interval_segundos.get(interval, 60) * limit
-            start_time = end_time - (segundos * 1000)
+            if start_time is None:
+                segundos = config.INTERVALO_SEGUNDOS.get(interval, 60) * limit
+                start_time = end_time - (segundos * 1000)
             
             # Obtiene los datos de velas
             candles_data = self.info.candles_snapshot(symbol, interval, start_time, end_time)
@@ -94,6 +334,12 @@ class HyperliquidClient:
         Returns:
             dict: Libro de órdenes con bids y asks
         """
+        # Si hay streaming activo y el libro en memoria es reciente, no hace falta REST
+        if self.feed is not None:
+            order_book = self.feed.obtener_libro(symbol, config.WS_MAX_STALENESS_SEC)
+            if order_book is not None:
+                return order_book
+        
         try:
             l2_snapshot = self.info.l2_snapshot(symbol)
             
@@ -103,14 +349,14 @@ class HyperliquidClient:
                 'asks': []
             }
             
-            # Los niveles[0] son asks (ventas), niveles[1] son bids (compras)
+            # Los niveles[0] son bids (compras), niveles[1] son asks (ventas)
             if len(l2_snapshot["levels"]) > 0 and l2_snapshot["levels"][0]:
                 for order in l2_snapshot["levels"][0]:
-                    order_book['asks'].append([order['px'], order['sz']])
+                    order_book['bids'].append([order['px'], order['sz']])
                     
             if len(l2_snapshot["levels"]) > 1 and l2_snapshot["levels"][1]:
                 for order in l2_snapshot["levels"][1]:
-                    order_book['bids'].append([order['px'], order['sz']])
+                    order_book['asks'].append([order['px'], order['sz']])
             
             return order_book
         except Exception as e:
@@ -128,7 +374,17 @@ class HyperliquidClient:
             dict: Mejor bid, ask y precio medio
         """
         try:
-            order_book = self.get_order_book(symbol)
+            order_book = None
+            if self.feed is not None:
+                order_book = self.feed.obtener_libro(symbol, config.WS_MAX_STALENESS_SEC)
+                if order_book is None:
+                    # Sin libro L2 en memoria pero con allMids reciente: basta el precio medio
+                    mid = self.feed.obtener_mid(symbol, config.WS_MAX_STALENESS_SEC)
+                    if mid is not None:
+                        return {"best_bid": None, "best_ask": None, "mid": mid}
+            
+            if order_book is None:
+                order_book = self.get_order_book(symbol)
             
             best_ask = float(order_book['asks'][0][0]) if order_book['asks'] else None
             best_bid = float(order_book['bids'][0][0]) if order_book['bids'] else None
@@ -139,53 +395,50 @@ class HyperliquidClient:
             print(f"Error al obtener precio para {symbol}: {str(e)}")
             return {"best_bid": None, "best_ask": None, "mid": None}
 
-    def set_leverage(self, symbol, leverage):
+    def set_leverage(self, symbol, leverage, forzar=False):
         """
-        Configura el apalancamiento para un símbolo específico
+        Configura el apalancamiento para un símbolo específico (cross).
+        Si el último apalancamiento confirmado ya es el pedido no se envía nada al exchange.
         
         Args:
             symbol (str): Símbolo del activo
             leverage (int): Valor del apalancamiento (ej: 5, 10, 20)
+            forzar (bool): Enviar la petición aunque el valor en caché coincida
             
         Returns:
             dict: Respuesta de la operación o None si hay error
         """
+        with self._lock_apalancamiento:
+            if not forzar and self.apalancamientos.get(symbol) == leverage:
+                return {"status": "ok", "response": "sin cambios"}
         try:
-            # Implementa la llamada a la API de Hyperliquid para configurar el apalancamiento
             print(f"[{symbol}] Configurando apalancamiento a {leverage}x")
-            
-            # Intento 1: Usar el método específico de la API si existe
-            try:
-                response = self.exchange.update_leverage(symbol, leverage)
+            response = self.exchange.update_leverage(leverage, symbol)
+            if isinstance(response, dict) and response.get("status") == "ok":
+                with self._lock_apalancamiento:
+                    self.apalancamientos[symbol] = leverage
                 print(f"[{symbol}] Apalancamiento configurado correctamente: {response}")
-                return response
-            except AttributeError:
-                # Si el método no existe, intentar con el enfoque alternativo
-                print(f"[{symbol}] Método update_leverage no disponible, intentando alternativa...")
-            
-            # Intento 2: Usar un enfoque personalizado si la API lo soporta
-            try:
-                # Este es un ejemplo hipotético, ajusta según la API real
-                response = self.exchange.post(
-                    endpoint='/derivative/v3/private/position/leverage/save',
-                    data={
-                        'symbol': symbol,
-                        'leverage': leverage
-                    }
-                )
-                print(f"[{symbol}] Apalancamiento configurado por método alternativo: {response}")
-                return response
-            except Exception as e:
-                print(f"[{symbol}] Error en método alternativo: {e}")
-            
-            # Si no funciona ninguno de los métodos anteriores, devolver un diccionario vacío
-            return {"status": "not_supported", "message": "La configuración de apalancamiento no está soportada por la API"}
-            
+            else:
+                print(f"[{symbol}] El exchange no confirmó el apalancamiento: {response}")
+            return response
         except Exception as e:
             print(f"[{symbol}] Error al configurar apalancamiento: {e}")
             return None
+            
+    def _sincronizar_apalancamientos(self, estado):
+        """Actualiza la caché de apalancamiento con las posiciones de un user_state"""
+        try:
+            with self._lock_apalancamiento:
+                for asset_position in estado.get("assetPositions", []):
+                    position = asset_position.get("position", {})
+                    leverage = position.get("leverage", {})
+                    if position.get("coin") and leverage.get("type") == "cross" and "value" in leverage:
+                        self.apalancamientos[position["coin"]] = int(leverage["value"])
+        except Exception as e:
+            print(f"Error sincronizando apalancamientos: {e}")
+        return estado
 
-    def create_order(self, symbol, side, size, price=None, leverage=None):
+    def create_order(self, symbol, side, size, price=None, leverage=None, reduce_only=False, cloid=None):
         """
         Crea una orden de mercado o límite con apalancamiento personalizado
         
@@ -195,50 +448,198 @@ class HyperliquidClient:
             size (float): Tamaño de la posición
             price (float, optional): Precio límite (si es None, se crea una orden de mercado)
             leverage (int, optional): Apalancamiento a utilizar (si es None, se usa el valor por defecto)
+            reduce_only (bool): La orden límite solo puede reducir la posición (TP)
+            cloid (Cloid, optional): Identificador propio de la orden límite (permite cancelarla sin oid)
             
         Returns:
             dict: Respuesta de la orden
         """
-        # Intentar configurar el apalancamiento primero si se especificó
-        if leverage is not None:
-            try:
-                self.set_leverage(symbol, leverage)
-                print(f"[{symbol}] Apalancamiento configurado antes de la orden: {leverage}x")
-            except Exception as e:
-                print(f"[{symbol}] Error al configurar apalancamiento: {e}")
-        else:
-            # Si no se especificó leverage, usar el valor de config.py
-            try:
-                default_leverage = config.LEVERAGE
-                self.set_leverage(symbol, default_leverage)
-                print(f"[{symbol}] Usando apalancamiento predeterminado: {default_leverage}x")
-            except Exception as e:
-                print(f"[{symbol}] Error al configurar apalancamiento predeterminado: {e}")
+        # Solo se envía updateLeverage si el apalancamiento confirmado es distinto
+        # (si no se especificó leverage, se usa el valor de config.py)
+        self.set_leverage(symbol, leverage if leverage is not None else config.LEVERAGE)
         
         # Crear la orden
         is_buy = True if side.lower() == "buy" else False
         
+        # Cualquier orden cambia posiciones/margen: el snapshot de cuenta deja de ser válido
+        self.invalidar_cuenta()
+        
         # Si price es None, crear orden de mercado. De lo contrario, orden límite.
         if price is None:
             print(f"[{symbol}] Creando orden de mercado: {side.upper()} {size}")
             return self.exchange.market_open(symbol, is_buy, size)
         else:
             print(f"[{symbol}] Creando orden límite: {side.upper()} {size} @ {price}")
-            return self.exchange.limit_open(symbol, is_buy, size, price)
+            return self.exchange.order(symbol, is_buy, size, price, {"limit": {"tif": "Gtc"}},
+                                       reduce_only=reduce_only, cloid=cloid)
+    
+    def precio_agresivo(self, symbol, is_buy, slippage=Exchange.DEFAULT_SLIPPAGE, precio_referencia=None):
+        """
+        Precio límite de una orden IOC "a mercado": el mid desplazado 'slippage' en
+        contra, redondeado con las reglas de precio del activo (ReglasActivo)
+        
+        Args:
+            precio_referencia (float, optional): Precio medio actual; si falta se usa el
+                                                 feed WebSocket o allMids
+        """
+        if precio_referencia is None and self.feed is not None:
+            precio_referencia = self.feed.obtener_mid(symbol, config.WS_MAX_STALENESS_SEC)
+        if precio_referencia is None:
+            precio_referencia = self.get_all_mids()[symbol]
+        precio = precio_referencia * (1 + slippage if is_buy else 1 - slippage)
+        sz_decimals = self.info.asset_to_sz_decimals[self.info.name_to_asset(symbol)]
+        return ReglasActivo(symbol, sz_decimals).redondear_precio(precio)
+    
+    def abrir_con_tp(self, symbol, side, size, tp_price, precio_referencia=None, leverage=None,
+                     slippage=Exchange.DEFAULT_SLIPPAGE):
+        """
+        Envía la entrada (IOC agresiva, equivalente a market) y su TP reduce-only en
+        una única acción firmada con agrupación normalTpsl: el TP queda activo en el
+        exchange en cuanto se llena la entrada, sin una segunda petición.
+        
+        Args:
+            symbol (str): Símbolo del activo
+            side (str): 'buy' o 'sell' (lado de la entrada)
+            size (float): Tamaño de la posición
+            tp_price (float): Precio del Take Profit (ya redondeado a las reglas del activo)
+            precio_referencia (float, optional): Precio medio actual; evita consultar allMids
+            
+        El TP hijo vuelve en la respuesta como "waitingForFill"/"waitingForTrigger",
+        sin oid: lleva un Cloid propio con el que se consulta su oid al momento (y con
+        el que se puede cancelar aunque esa consulta falle).
+        
+        Returns:
+            dict: {'status', 'entrada': {'oid', 'total_sz', 'avg_px', 'error'},
+                   'tp': {'oid', 'cloid', 'estado', 'error'}, 'respuesta'}
+        """
+        self.set_leverage(symbol, leverage if leverage is not None else config.LEVERAGE)
+        is_buy = side.lower() == "buy"
+        precio_entrada = self.precio_agresivo(symbol, is_buy, slippage, precio_referencia)
+        cloid_tp = nuevo_cloid()
+        ordenes = [
+            {"coin": symbol, "is_buy": is_buy, "sz": size, "limit_px": precio_entrada,
+             "order_type": {"limit": {"tif": "Ioc"}}, "reduce_only": False},
+            {"coin": symbol, "is_buy": not is_buy, "sz": size, "limit_px": tp_price,
+             "order_type": {"trigger": {"triggerPx": tp_price, "isMarket": False, "tpsl": "tp"}},
+             "reduce_only": True, "cloid": cloid_tp},
+        ]
+        
+        self.invalidar_cuenta()
+        print(f"[{symbol}] Enviando entrada {side.upper()} {size} + TP @ {tp_price} (normalTpsl)")
+        respuesta = self.exchange.bulk_orders(ordenes, grouping="normalTpsl")
+        
+        resultado = {"status": respuesta.get("status") if isinstance(respuesta, dict) else None,
+                     "entrada": {}, "tp": {}, "respuesta": respuesta}
+        try:
+            estados = respuesta["response"]["data"]["statuses"]
+        except (KeyError, TypeError):
+            resultado["entrada"]["error"] = str(respuesta)
+            return resultado
+        
+        for clave, estado in zip(("entrada", "tp"), estados):
+            resultado[clave].update(_resumir_estado(estado))
+        
+        tp = resultado["tp"]
+        if tp.get("estado") and not tp.get("error"):
+            tp["cloid"] = cloid_tp.to_raw()
+            if tp.get("oid") is None:
+                try:
+                    _, _, tp["oid"] = self.estado_orden(cloid_tp)
+                except Exception as e:
+                    print(f"[{symbol}] No se pudo consultar el oid del TP (se usará su cloid): {e}")
+        return resultado
+    
+    def estado_orden(self, orden):
+        """
+        Consulta orderStatus de una orden por oid o por Cloid
+        
+        Returns:
+            tuple: (estado, tamaño llenado, oid); estado None si el exchange no la conoce
+        """
+        if isinstance(orden, Cloid):
+            respuesta = self.info.query_order_by_cloid(WALLET_ADDRESS, orden)
+        else:
+            respuesta = self.info.query_order_by_oid(WALLET_ADDRESS, int(orden))
+        if not isinstance(respuesta, dict) or respuesta.get("status") != "order":
+            return None, 0.0, None
+        datos = respuesta["order"]
+        orden_info = datos.get("order") or {}
+        llenado = float(orden_info.get("origSz", 0)) - float(orden_info.get("sz", 0))
+        return datos.get("status"), llenado, orden_info.get("oid")
+    
+    def cerrar_con_confirmacion(self, symbol, size, is_buy, precio_referencia=None, plazo=None,
+                                slippage=Exchange.DEFAULT_SLIPPAGE):
+        """
+        Envía una orden IOC reduce-only (cierre a mercado) y confirma cuánto se llenó.
+        
+        La respuesta de la orden IOC ya trae el tamaño llenado, así que en el caso
+        normal no hay ninguna espera. Solo si la respuesta es ambigua (orden en libro
+        o error de red) se espera a los fills del WebSocket o a orderStatus, como
+        mucho 'plazo' segundos.
+        
+        Args:
+            symbol (str): Símbolo del activo
+            size (float): Tamaño a cerrar
+            is_buy (bool): Lado de la orden de cierre (True para cerrar un short)
+            precio_referencia (float, optional): Precio medio actual; evita consultar allMids
+            plazo (float, optional): Segundos máximos de espera de la confirmación
+            
+        Returns:
+            dict: {'oid', 'llenado', 'avg_px', 'cerrado', 'error', 'respuesta'}
+        """
+        plazo = config.CIERRE_PLAZO_SEC if plazo is None else plazo
+        cloid = nuevo_cloid()
+        resultado = {"oid": None, "llenado": 0.0, "avg_px": None, "cerrado": False,
+                     "error": None, "respuesta": None}
+        
+        self.invalidar_cuenta()
+        try:
+            precio = self.precio_agresivo(symbol, is_buy, slippage, precio_referencia)
+            respuesta = self.exchange.order(symbol, is_buy, size, precio, {"limit": {"tif": "Ioc"}},
+                                            reduce_only=True, cloid=cloid)
+            resultado["respuesta"] = respuesta
+            estado = _resumir_estado(respuesta["response"]["data"]["statuses"][0])
+        except Exception as e:
+            # Timeout o respuesta inesperada: el Cloid permite saber si la orden llegó al exchange
+            print(f"[{symbol}] Respuesta de cierre no disponible ({e}), consultando por cloid")
+            estado = {"error": str(e)}
+            try:
+                _, _, estado["oid"] = self.estado_orden(cloid)
+            except Exception as e2:
+                print(f"[{symbol}] Error consultando orden de cierre por cloid: {e2}")
+        
+        resultado["oid"] = estado.get("oid")
+        resultado["avg_px"] = estado.get("avg_px")
+        if estado.get("estado") == "filled":
+            resultado["llenado"] = estado["total_sz"]
+        elif resultado["oid"] is not None:
+            # Orden aceptada sin llenado confirmado en la respuesta: llenados del WebSocket u orderStatus
+            resultado["llenado"] = self.llenados.esperar(
+                resultado["oid"], size, plazo,
+                consultar=lambda oid: self.estado_orden(oid)[:2])
+        else:
+            resultado["error"] = estado.get("error") or estado.get("estado")
+        
+        resultado["cerrado"] = resultado["llenado"] >= size * (1 - 1e-9)
+        return resultado
     
-    def cancel_order(self, symbol, order_id):
+    def cancel_order(self, symbol, order_id=None, cloid=None):
         """
-        Cancela una orden existente
+        Cancela una orden existente por su oid o, si no se conoce, por su cloid
         
         Args:
             symbol (str): Símbolo del activo
-            order_id (str): ID de la orden a cancelar
+            order_id (str, optional): ID de la orden a cancelar
+            cloid (str, optional): Cloid de la orden ("0x" + 32 hex)
             
         Returns:
             dict: Respuesta de la cancelación
         """
+        self.invalidar_cuenta()
         try:
-            return self.exchange.cancel_order(symbol, order_id)
+            if not order_id and cloid:
+                return self.exchange.cancel_by_cloid(symbol, Cloid(cloid))
+            return self.exchange.cancel(symbol, int(order_id))
         except Exception as e:
             print(f"Error al cancelar orden para {symbol}: {str(e)}")
             return {"status": "error", "message": str(e)}
@@ -0,0 +1,269 @@
+# indicadores.py
+import math
+import warnings
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+VENTANA_ATR = 14
+VENTANA_ATR_MEDIA = 20
+VENTANA_VOL = 20
+PERIODO_EMA = 30
+VENTANA_RUPTURA = 5
+
+# Cada cuántas velas se recalculan las sumas móviles desde cero (evita deriva numérica)
+RECALCULO_SUMAS = 500
+
+
+def calcular_atr(df, n=14):
+    high_low = df['high'] - df['low']
+    high_close = abs(df['high'] - df['close'].shift())
+    low_close = abs(df['low'] - df['close'].shift())
+    ranges = pd.concat([high_low, high_close, low_close], axis=1)
+    true_range = ranges.max(axis=1)
+    atr = true_range.rolling(window=n, min_periods=1).mean()
+    return atr
+
+def calcular_ema(df, n=30):
+    return df['close'].ewm(span=n, adjust=False).mean()
+
+
+class MotorIndicadores:
+    """
+    Motor incremental de los indicadores de la estrategia microestructura v2.
+
+    Mantiene el estado de las velas cerradas y calcula en tiempo constante los
+    valores de la vela actual (en formación), sin recorrer el histórico:
+    ATR(14), media de 20 ATR, EMA30, media de volumen de 20 velas, spike de
+    volumen y máximo/mínimo de las 5 velas previas. Los resultados coinciden con
+    las versiones pandas (calcular_atr, calcular_ema, rolling) sobre la misma serie.
+    """
+
+    def __init__(self, vol_mult=1.0):
+        self.vol_mult = vol_mult
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.n = 0
+        self.ultimo_ts = None
+        self.prev_close = None
+        self.ema = None
+        self.tr = deque(maxlen=VENTANA_ATR)
+        self.atr = deque(maxlen=VENTANA_ATR_MEDIA)
+        self.vol = deque(maxlen=VENTANA_VOL)
+        self.highs = deque(maxlen=VENTANA_RUPTURA)
+        self.lows = deque(maxlen=VENTANA_RUPTURA)
+        self.suma_tr = 0.0
+        self.suma_atr = 0.0
+        self.suma_vol = 0.0
+
+    @staticmethod
+    def _media_movil(ventana, suma, nuevo, tamano, min_periodos):
+        """Media de la ventana incluyendo 'nuevo' como último valor (NaN si no hay suficientes)"""
+        if len(ventana) == tamano:
+            suma = suma - ventana[0]
+            cuenta = tamano
+        else:
+            cuenta = len(ventana) + 1
+        if cuenta < min_periodos:
+            return math.nan
+        return (suma + nuevo) / cuenta
+
+    def valores(self, high, low, close, volume, vol_mult=None):
+        """
+        Calcula los indicadores de una vela sin incorporarla al estado (la vela en
+        formación se puede evaluar tantas veces como cambie)
+
+        Returns:
+            dict: atr, atr_media, ema30, vol_rolling, vol_spike, prev_max, prev_min, close, n
+        """
+        if self.prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+
+        atr = self._media_movil(self.tr, self.suma_tr, tr, VENTANA_ATR, 1)
+        atr_media = self._media_movil(self.atr, self.suma_atr, atr, VENTANA_ATR_MEDIA, VENTANA_ATR_MEDIA)
+        vol_rolling = self._media_movil(self.vol, self.suma_vol, volume, VENTANA_VOL, VENTANA_VOL)
+
+        if vol_mult is None:
+            vol_mult = self.vol_mult
+        alpha = 2.0 / (PERIODO_EMA + 1)
+        ema = close if self.ema is None else alpha * close + (1 - alpha) * self.ema
+
+        return {
+            'atr': atr,
+            'atr_media': atr_media,
+            'ema30': ema,
+            'vol_rolling': vol_rolling,
+            'vol_spike': bool(volume > vol_rolling * vol_mult) if not math.isnan(vol_rolling) else False,
+            'prev_max': max(self.highs) if self.highs else math.nan,
+            'prev_min': min(self.lows) if self.lows else math.nan,
+            'close': close,
+            'n': self.n + 1,
+            'tr': tr
+        }
+
+    def cerrar_vela(self, timestamp, high, low, close, volume):
+        """Incorpora una vela cerrada al estado y devuelve sus indicadores"""
+        v = self.valores(high, low, close, volume)
+
+        for ventana, nombre_suma, nuevo in ((self.tr, 'suma_tr', v['tr']),
+                                            (self.atr, 'suma_atr', v['atr']),
+                                            (self.vol, 'suma_vol', volume)):
+            suma = getattr(self, nombre_suma)
+            if len(ventana) == ventana.maxlen:
+                suma -= ventana[0]
+            ventana.append(nuevo)
+            setattr(self, nombre_suma, suma + nuevo)
+
+        self.ema = v['ema30']
+        self.prev_close = close
+        self.highs.append(high)
+        self.lows.append(low)
+        self.ultimo_ts = timestamp
+        self.n += 1
+
+        if self.n % RECALCULO_SUMAS == 0:
+            self.suma_tr = math.fsum(self.tr)
+            self.suma_atr = math.fsum(self.atr)
+            self.suma_vol = math.fsum(self.vol)
+        return v
+
+
+# Columnas de la matriz de velas (símbolos x velas x columnas)
+COL_OPEN, COL_HIGH, COL_LOW, COL_CLOSE, COL_VOLUME = range(5)
+
+
+def _media_movil_matriz(valores, ventana, min_periodos):
+    """Media móvil a lo largo del eje temporal (eje 1) mediante sumas acumuladas"""
+    acumulado = np.cumsum(valores, axis=1)
+    suma = acumulado.copy()
+    suma[:, ventana:] = acumulado[:, ventana:] - acumulado[:, :-ventana]
+    cuenta = np.minimum(np.arange(1, valores.shape[1] + 1), ventana).astype(np.float64)
+    media = suma / cuenta
+    media[:, cuenta < min_periodos] = np.nan
+    return media
+
+
+def calcular_indicadores_matriz(velas):
+    """
+    Calcula los indicadores de la estrategia para todos los símbolos y todas las velas a la vez
+
+    Args:
+        velas (np.ndarray): Matriz (símbolos, velas, 5) con open, high, low, close, volume
+
+    Returns:
+        dict: Matrices (símbolos, velas) con atr, atr_media, ema30, vol_rolling, prev_max, prev_min
+    """
+    high = velas[:, :, COL_HIGH]
+    low = velas[:, :, COL_LOW]
+    close = velas[:, :, COL_CLOSE]
+    volume = velas[:, :, COL_VOLUME]
+    n_velas = velas.shape[1]
+
+    # True range: la primera vela no tiene cierre previo y usa high - low
+    prev_close = np.empty_like(close)
+    prev_close[:, 0] = np.nan
+    prev_close[:, 1:] = close[:, :-1]
+    with np.errstate(invalid='ignore'):
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+    atr = _media_movil_matriz(true_range, VENTANA_ATR, 1)
+    atr_media = _media_movil_matriz(atr, VENTANA_ATR_MEDIA, VENTANA_ATR_MEDIA)
+    vol_rolling = _media_movil_matriz(volume, VENTANA_VOL, VENTANA_VOL)
+
+    # La EMA es recursiva: se delega en pandas, que la resuelve en C para todas las columnas
+    ema30 = pd.DataFrame(close.T).ewm(span=PERIODO_EMA, adjust=False).mean().to_numpy().T
+
+    # Máximo/mínimo de las 5 velas anteriores (excluida la actual)
+    relleno = np.full((velas.shape[0], VENTANA_RUPTURA), np.nan)
+    ventanas_high = np.lib.stride_tricks.sliding_window_view(np.concatenate([relleno, high], axis=1), VENTANA_RUPTURA, axis=1)
+    ventanas_low = np.lib.stride_tricks.sliding_window_view(np.concatenate([relleno, low], axis=1), VENTANA_RUPTURA, axis=1)
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        prev_max = np.nanmax(ventanas_high[:, :n_velas], axis=2)
+        prev_min = np.nanmin(ventanas_low[:, :n_velas], axis=2)
+
+    return {
+        'atr': atr,
+        'atr_media': atr_media,
+        'ema30': ema30,
+        'vol_rolling': vol_rolling,
+        'prev_max': prev_max,
+        'prev_min': prev_min,
+    }
+
+
+def calcular_indicadores_incrementales(velas):
+    """
+    Mismo resultado que calcular_indicadores_matriz, recorriendo las velas una a una
+    con MotorIndicadores (el cálculo que hace el bot en vivo al cerrar cada vela)
+
+    Args:
+        velas (np.ndarray): Matriz (símbolos, velas, 5) con open, high, low, close, volume
+
+    Returns:
+        dict: Matrices (símbolos, velas) con atr, atr_media, ema30, vol_rolling, prev_max, prev_min
+    """
+    columnas = ('atr', 'atr_media', 'ema30', 'vol_rolling', 'prev_max', 'prev_min')
+    resultado = {columna: np.empty(velas.shape[:2]) for columna in columnas}
+    for i in range(velas.shape[0]):
+        motor = MotorIndicadores()
+        for t, (_, high, low, close, volume) in enumerate(velas[i].tolist()):
+            v = motor.cerrar_vela(t, high, low, close, volume)
+            for columna in columnas:
+                resultado[columna][i, t] = v[columna]
+    return resultado
+
+
+def comparar_con_pandas(df, vol_mult=1.0):
+    """
+    Recorre el DataFrame con MotorIndicadores y devuelve la máxima diferencia absoluta
+    de cada indicador frente al cálculo pandas (calcular_atr, calcular_ema y rolling)
+    """
+    referencia = pd.DataFrame({
+        'atr': calcular_atr(df, VENTANA_ATR),
+        'ema30': calcular_ema(df, PERIODO_EMA),
+        'vol_rolling': df['volume'].rolling(VENTANA_VOL).mean(),
+    })
+    referencia['atr_media'] = referencia['atr'].rolling(VENTANA_ATR_MEDIA).mean()
+    referencia['prev_max'] = df['high'].shift(1).rolling(VENTANA_RUPTURA, min_periods=1).max()
+    referencia['prev_min'] = df['low'].shift(1).rolling(VENTANA_RUPTURA, min_periods=1).min()
+
+    motor = MotorIndicadores(vol_mult)
+    obtenidos = {columna: [] for columna in referencia.columns}
+    for fila in df[['timestamp', 'high', 'low', 'close', 'volume']].itertuples(index=False):
+        v = motor.cerrar_vela(fila.timestamp, fila.high, fila.low, fila.close, fila.volume)
+        for columna in obtenidos:
+            obtenidos[columna].append(v[columna])
+
+    diferencias = {}
+    for columna, valores in obtenidos.items():
+        esperado = referencia[columna].to_numpy(dtype=float)
+        valores = np.asarray(valores, dtype=float)
+        if not np.array_equal(np.isnan(esperado), np.isnan(valores)):
+            diferencias[columna] = math.inf
+            continue
+        mascara = ~np.isnan(esperado)
+        diferencias[columna] = float(np.max(np.abs(esperado[mascara] - valores[mascara]))) if mascara.any() else 0.0
+    return diferencias
+
+
+if __name__ == "__main__":
+    # Verificación numérica contra pandas sobre un paseo aleatorio sintético
+    rng = np.random.default_rng(42)
+    n = 5000
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.002, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.002, n))
+    df = pd.DataFrame({
+        'timestamp': np.arange(n) * 60000,
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'volume': rng.lognormal(3, 1, n)
+    })
+    for columna, diferencia in comparar_con_pandas(df, vol_mult=1.5).items():
+        estado = "OK" if diferencia < 1e-9 else "DIFERENCIA"
+        print(f"{columna:12s} max |dif| = {diferencia:.3e}  {estado}")
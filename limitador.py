@@ -0,0 +1,147 @@
+# limitador.py
+import asyncio
+import threading
+import time
+
+import config
+
+# Prioridades: las órdenes y cancelaciones nunca esperan a la reserva de las lecturas
+PRIORIDAD_ORDEN = 0
+PRIORIDAD_LECTURA = 1
+
+# Pesos de Hyperliquid por tipo de petición /info (el resto pesa PESO_INFO_DEFECTO)
+PESO_INFO = {
+    "l2Book": 2, "allMids": 2, "clearinghouseState": 2, "orderStatus": 2,
+    "spotClearinghouseState": 2, "exchangeStatus": 2, "userRole": 60,
+}
+PESO_INFO_DEFECTO = 20
+VELAS_POR_PESO = 60    # candleSnapshot suma 1 de peso por cada 60 velas devueltas
+ORDENES_POR_PESO = 40  # Una acción /exchange pesa 1 + floor(órdenes / 40)
+
+
+def peso_peticion(url_path, payload):
+    """
+    Peso y prioridad de una petición a la API REST de Hyperliquid
+
+    Returns:
+        tuple: (peso, prioridad)
+    """
+    payload = payload or {}
+    if url_path == "/exchange":
+        accion = payload.get("action") or {}
+        elementos = len(accion.get("orders") or accion.get("cancels") or [])
+        return 1 + elementos // ORDENES_POR_PESO, PRIORIDAD_ORDEN
+    return PESO_INFO.get(payload.get("type"), PESO_INFO_DEFECTO), PRIORIDAD_LECTURA
+
+
+def peso_respuesta(payload, respuesta):
+    """Peso adicional que se conoce al recibir la respuesta (velas devueltas por candleSnapshot)"""
+    if (payload or {}).get("type") == "candleSnapshot" and isinstance(respuesta, list):
+        return len(respuesta) // VELAS_POR_PESO
+    return 0
+
+
+class LimitadorPeso:
+    """
+    Cubo de tokens con el presupuesto de peso por minuto de Hyperliquid.
+
+    Se recarga de forma continua a 'capacidad * margen / periodo' tokens por
+    segundo. Las lecturas dejan siempre libre una reserva para que órdenes y
+    cancelaciones no esperen detrás de los datos de mercado. Cada 429 reduce a la
+    mitad el ritmo de recarga, que se recupera progresivamente mientras no lleguen más.
+    """
+
+    def __init__(self, capacidad=None, periodo=60.0, margen=None, reserva_ordenes=None, recuperacion=None):
+        self.capacidad = (capacidad or config.RATE_LIMIT_PESO_MINUTO) * (margen or config.RATE_LIMIT_MARGEN)
+        self.periodo = periodo
+        self.reserva = self.capacidad * (reserva_ordenes if reserva_ordenes is not None
+                                         else config.RATE_LIMIT_RESERVA_ORDENES)
+        self.recuperacion = recuperacion or config.RATE_LIMIT_RECUPERACION_SEC
+        self.factor = 1.0             # Fracción del ritmo nominal (baja con cada 429)
+        self.penalizaciones = 0
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self, ahora):
+        transcurrido = ahora - self._ultimo
+        self._ultimo = ahora
+        self.factor = min(1.0, self.factor + transcurrido / self.recuperacion)
+        self._tokens = min(self.capacidad, self._tokens + transcurrido * self.factor * self.capacidad / self.periodo)
+
+    def reservar(self, peso, prioridad=PRIORIDAD_LECTURA):
+        """
+        Intenta consumir 'peso' tokens sin bloquear
+
+        Returns:
+            float: 0 si se concedió; si no, segundos estimados hasta poder reintentarlo
+        """
+        with self._lock:
+            self._recargar(time.monotonic())
+            minimo = peso + (self.reserva if prioridad == PRIORIDAD_LECTURA else 0.0)
+            if self._tokens >= minimo:
+                self._tokens -= peso
+                return 0.0
+            ritmo = self.factor * self.capacidad / self.periodo
+            return (minimo - self._tokens) / ritmo
+
+    def adquirir(self, peso, prioridad=PRIORIDAD_LECTURA):
+        """Bloquea hasta poder consumir 'peso' tokens"""
+        while True:
+            espera = self.reservar(peso, prioridad)
+            if espera <= 0:
+                return
+            time.sleep(min(espera, 1.0))
+
+    async def adquirir_async(self, peso, prioridad=PRIORIDAD_LECTURA):
+        while True:
+            espera = self.reservar(peso, prioridad)
+            if espera <= 0:
+                return
+            await asyncio.sleep(min(espera, 1.0))
+
+    def cargar(self, peso):
+        """Descuenta peso ya consumido (puede dejar el cubo en negativo y frenar las siguientes)"""
+        if peso:
+            with self._lock:
+                self._tokens -= peso
+
+    def penalizar(self):
+        """Respuesta 429: se vacía el cubo y se reduce a la mitad el ritmo de recarga"""
+        with self._lock:
+            self._recargar(time.monotonic())
+            self.factor = max(self.factor / 2, 0.05)
+            self._tokens = min(self._tokens, 0.0)
+            self.penalizaciones += 1
+
+    def limitar_api(self, api):
+        """Envuelve el método post de un objeto API del SDK (Info, Exchange) con el limitador"""
+        post_original = api.post
+
+        def post(url_path, payload=None):
+            peso, prioridad = peso_peticion(url_path, payload)
+            self.adquirir(peso, prioridad)
+            try:
+                respuesta = post_original(url_path, payload)
+            except Exception as e:
+                if getattr(e, "status_code", None) == 429:
+                    self.penalizar()
+                raise
+            self.cargar(peso_respuesta(payload, respuesta))
+            return respuesta
+
+        api.post = post
+        return api
+
+
+_limitador = None
+_lock_limitador = threading.Lock()
+
+
+def obtener_limitador():
+    """Limitador compartido por todos los clientes del proceso (el límite es por IP)"""
+    global _limitador
+    with _lock_limitador:
+        if _limitador is None:
+            _limitador = LimitadorPeso()
+        return _limitador
@@ -0,0 +1,85 @@
+# llenados.py
+import threading
+import time
+import logging
+
+# Estados de orderStatus que ya no pueden recibir más llenados
+ESTADOS_FINALES = {"filled", "canceled", "rejected", "marginCanceled", "reduceOnlyCanceled",
+                   "selfTradeCanceled", "siblingFilledCanceled", "delistedCanceled",
+                   "liquidatedCanceled", "scheduledCancel"}
+
+
+class RegistroLlenados:
+    """
+    Cantidad llenada por oid, alimentada por la suscripción WebSocket 'userFills'.
+
+    'esperar' bloquea con una condición (sin sleeps fijos) hasta que la orden
+    acumula el tamaño pedido o vence el plazo. Si no llegan eventos del WebSocket,
+    consulta orderStatus con intervalos crecientes como respaldo.
+    """
+
+    def __init__(self, max_oids=1000):
+        self.max_oids = max_oids
+        self._cond = threading.Condition()
+        self._llenado = {}   # oid -> tamaño llenado acumulado (orden de inserción = antigüedad)
+        self._vistos = set() # tid de los fills ya contados (el WebSocket puede repetirlos al reconectar)
+
+    def registrar(self, fills):
+        """Suma los fills recibidos y despierta a quien esté esperando"""
+        with self._cond:
+            for fill in fills:
+                try:
+                    clave = fill.get("tid") or (fill["oid"], fill.get("time"), fill["sz"])
+                    if clave in self._vistos:
+                        continue
+                    self._vistos.add(clave)
+                    oid = int(fill["oid"])
+                    self._llenado[oid] = self._llenado.get(oid, 0.0) + float(fill["sz"])
+                except (KeyError, ValueError, TypeError) as e:
+                    logging.error(f"Fill con formato inesperado {fill}: {e}")
+            # Se descartan los oids más antiguos para no crecer sin límite
+            while len(self._llenado) > self.max_oids:
+                self._llenado.pop(next(iter(self._llenado)))
+            if len(self._vistos) > 10 * self.max_oids:
+                self._vistos.clear()
+            self._cond.notify_all()
+
+    def llenado(self, oid):
+        with self._cond:
+            return self._llenado.get(int(oid), 0.0)
+
+    def esperar(self, oid, tamano, plazo, consultar=None, intervalo_consulta=0.1, intervalo_maximo=1.0):
+        """
+        Espera a que la orden 'oid' acumule 'tamano' llenado
+
+        Args:
+            oid (int): Identificador de la orden
+            tamano (float): Tamaño total esperado
+            plazo (float): Segundos máximos de espera
+            consultar (callable, optional): oid -> (estado, llenado) vía REST (orderStatus)
+
+        Returns:
+            float: Tamaño llenado confirmado al terminar (completo o al vencer el plazo)
+        """
+        oid = int(oid)
+        objetivo = tamano * (1 - 1e-9)
+        limite = time.monotonic() + plazo
+        espera_consulta = intervalo_consulta
+        while True:
+            restante = limite - time.monotonic()
+            with self._cond:
+                self._cond.wait_for(lambda: self._llenado.get(oid, 0.0) >= objetivo,
+                                    timeout=max(min(restante, espera_consulta) if consultar else restante, 0))
+                llenado = self._llenado.get(oid, 0.0)
+            if llenado >= objetivo or limite - time.monotonic() <= 0:
+                return llenado
+            if consultar is None:
+                continue
+            try:
+                estado, llenado_rest = consultar(oid)
+            except Exception as e:
+                print(f"Error consultando estado de la orden {oid}: {e}")
+                estado, llenado_rest = None, 0.0
+            if llenado_rest >= objetivo or estado in ESTADOS_FINALES:
+                return max(llenado, llenado_rest)
+            espera_consulta = min(espera_consulta * 2, intervalo_maximo)
@@ -5,17 +5,40 @@ import math
 import json
 import os
 import logging
+import signal
+import threading
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
     TIMEOUT_MINUTES, LEVERAGE, MARGIN_PER_TRADE, ATR_TP_MULT, MAX_TP_PCT,
     # Nuevos parámetros para DCA
     DCA_ENABLED, DCA_MAX_LOSS_PCT, DCA_MAX_ENTRIES, DCA_SIZE_MULTIPLIER, 
-    DCA_MIN_TIME_BETWEEN, DCA_MAX_TOTAL_SIZE_MULT
+    DCA_MIN_TIME_BETWEEN, DCA_MAX_TOTAL_SIZE_MULT,
+    VELAS_CAPACIDAD, INTERVALO_SEGUNDOS,
+    ENTRADAS_ADELANTO_CIERRE_SEC, ENTRADAS_INTERVALO_MIN_SEC, UMBRALES_RETRASO_CIERRE_SEC, MANTENIMIENTO_TP_SEC,
+    MANTENIMIENTO_DCA_SEC, MANTENIMIENTO_HUERFANAS_SEC, SALDO_SEC, REEVALUACION_CHEQUEO_SEC,
+    MAX_WORKERS_ESCANEO, MAX_SIMBOLOS, MIN_VOLUMEN_24H_USD, ESTADISTICAS_HTTP_SEC,
+    CIERRE_REINTENTOS, ESTADO_VOLCADO_SEC, DIARIO_ARCHIVO, DIARIO_SNAPSHOT_EVENTOS, DIARIO_FSYNC,
+    HISTORIAL_DIRECTORIO, HISTORIAL_SINCRONIZAR_SEC, HISTORIAL_COMPACTAR_SEC
 )
 from secret import WALLET_ADDRESS
 from notificaciones import enviar_telegram
-from hyperliquid_client import HyperliquidClient
+from hyperliquid_client import HyperliquidClient, nuevo_cloid, resumir_respuesta
+from hyperliquid_async import ClienteSincrono
+from transporte import obtener_transporte
+from almacen_velas import AlmacenVelas
+from planificador import Planificador
+from universo import obtener_universo, seleccionar_simbolos
+from metadatos import MetadatosExchange
+from estado_bot import AlmacenEstado, EstadoMemoria
+from diario import DiarioEventos
+import historial
+from senales import evaluar_senales_lote, MIN_VELAS, LONG, SHORT
+from estrategia import (
+    MULTIPLICADOR_VOL_POR_SIMBOLO, BREAKOUT_ATR_MULT_POR_SIMBOLO,
+    VOLATILITY_WINDOW, VOLATILITY_UMBRAL, detectar_volatilidad_extrema, calcular_tp_atr
+)
 
 logging.basicConfig(
     filename='bot_errors.log',
@@ -59,6 +82,28 @@ def crear_cliente_con_reintentos(tiempo_espera=10):
 
 client = crear_cliente_con_reintentos(tiempo_espera=10)  # Reintenta cada 10 segundos indefinidamente
 
+# Velas en memoria: tras la primera descarga solo se piden las velas nuevas
+almacen_velas = AlmacenVelas(client, capacidad=VELAS_CAPACIDAD)
+
+# szDecimals y reglas de redondeo de todos los perpetuos (persistidos y refrescados en segundo plano)
+metadatos = MetadatosExchange(client)
+metadatos.cargar()
+
+# Cliente asyncio (bucle propio en segundo plano) para descargar las velas de todos los símbolos a la vez
+cliente_async = ClienteSincrono()
+
+# Pool acotado para la I/O por símbolo del escaneo de entradas (precio, spread)
+pool_escaneo = ThreadPoolExecutor(max_workers=MAX_WORKERS_ESCANEO, thread_name_prefix="escaneo")
+
+# Umbrales de ruptura de la vela en formación por símbolo (los fija evaluar_entradas_lote y los
+# recalcula al_cerrar_vela con cada vela nueva)
+umbrales_disparo = {}
+# Rupturas detectadas por el WebSocket pendientes de evaluar (símbolo -> mid) y vela
+# (timestamp de apertura en ms) en la que cada símbolo ya disparó: como mucho un disparo por vela
+rupturas_pendientes = {}
+disparos_vela = {}
+lock_disparo = threading.Lock()
+
 ATR_SL_MULT = 1.0
 # MIN_POTENTIAL_PROFIT eliminado
 
@@ -66,42 +111,29 @@ SPREAD_MAX_PCT_POR_SIMBOLO = {
     "BTC": 1.0, "ETH": 1.0, "BNB": 1.0, "SOL": 1.5, "XRP": 2.0, "ADA": 1.5,
     "AVAX": 1.5, "LINK": 1.5, "MATIC": 1.5
 }
-MULTIPLICADOR_VOL_POR_SIMBOLO = {
-    "BTC": 1.5, "ETH": 1.5, "BNB": 1.5, "SOL": 1.2, "XRP": 1.2,
-    "ADA": 1.2, "AVAX": 1.2, "LINK": 1.2, "MATIC": 1.2
-}
-BREAKOUT_ATR_MULT_POR_SIMBOLO = {
-    "BTC": 0.15, "ETH": 0.15, "BNB": 0.15, "SOL": 0.1, "XRP": 0.1,
-    "ADA": 0.1, "AVAX": 0.1, "LINK": 0.1, "MATIC": 0.1
-}
-
-# Definir la precisión para cada símbolo según las reglas de Hyperliquid
-PRECISION_POR_SIMBOLO = {
-    "BTC": 3,  # 0.001 BTC
-    "ETH": 2,  # 0.01 ETH
-    "BNB": 2,  # 0.01 BNB
-    "SOL": 1,  # 0.1 SOL
-    "XRP": 0,  # 1 XRP
-    "ADA": 0,  # 1 ADA
-    "AVAX": 1, # 0.1 AVAX
-    "LINK": 1, # 0.1 LINK
-    "MATIC": 0 # 1 MATIC
-}
 
-ATR_LEVELS_FILE = "trade_levels_atr.json"
+ATR_LEVELS_FILE = "trade_levels_atr.json"  # Solo para la migración inicial a estado_bot.db
 TP_ORDERS_FILE = "tp_orders.json"
-PNL_HISTORY_FILE = "pnl_history.csv"  # Cambiado a CSV para mejor compatibilidad con pandas
 COOLDOWN_MINUTES = 5  # Reducido de 15 a 5 minutos
 SPREAD_MAX_PCT = 1
 MAX_RETRIES = 3
 RETRY_SLEEP = 5  # Aumentado de 2 a 5 segundos
-VOLATILITY_WINDOW = 10
-VOLATILITY_UMBRAL = 0.015
 REEVALUACION_SIMBOLOS_HORAS = 1  # Reducido de 6 horas a 1 hora
 DEBUG = False  # Controla el verbose
 VERIFICACION_CIERRE_INTENTOS = 3  # Número de intentos para verificar cierre
 VERIFICACION_CIERRE_ESPERA = 3  # Segundos entre verificaciones
 
+# Niveles TP, DCA y órdenes TP en memoria; se vuelcan en segundo plano a SQLite (WAL)
+almacen_estado = AlmacenEstado()
+almacen_estado.migrar_json(ATR_LEVELS_FILE, TP_ORDERS_FILE, avisar=lambda mensaje: enviar_telegram(mensaje, tipo="error"))
+estado = EstadoMemoria(almacen_estado, intervalo=ESTADO_VOLCADO_SEC)
+estado.iniciar()
+
+# Historial de operaciones y saldo: diario de eventos; los CSV y ultimo_saldo.txt son vistas derivadas
+diario = DiarioEventos(DIARIO_ARCHIVO, cada_snapshot=DIARIO_SNAPSHOT_EVENTOS, fsync=DIARIO_FSYNC)
+diario.recuperar()
+historial_columnar = historial.HistorialColumnar(HISTORIAL_DIRECTORIO) if historial.disponible() else None
+
 resumen_diario = {
     "trades_abiertos": 0,
     "trades_cerrados": 0,
@@ -117,13 +149,12 @@ def debug_print(mensaje, *args):
         else:
             print(mensaje)
 
-def evaluar_dca(posiciones):
+def evaluar_dca(posiciones, mercado=None):
     """Evalúa posiciones en negativo para aplicar estrategia DCA"""
     if not DCA_ENABLED:
         return
         
     niveles_atr = cargar_niveles_atr()
-    tp_orders = cargar_ordenes_tp()
     
     for pos in posiciones:
         try:
@@ -134,7 +165,7 @@ def evaluar_dca(posiciones):
             pnl = float(pos.get('unrealizedPnl', 0))
             
             # Obtener información de la posición
-            precio_actual = obtener_precio_hyperliquid(symbol)
+            precio_actual = obtener_precio_hyperliquid(symbol, mercado)
             if precio_actual is None:
                 continue
                 
@@ -191,6 +222,7 @@ def ejecutar_dca(symbol, direccion, pos, precio_actual, niveles_atr):
         
         # Calcular el tamaño del DCA basado en el tamaño ORIGINAL
         dca_size = original_size * DCA_SIZE_MULTIPLIER
+        dca_size = metadatos.redondear_tamano(symbol, dca_size) or dca_size
         
         # Verificar tamaño total acumulado
         total_actual = position_size
@@ -202,14 +234,12 @@ def ejecutar_dca(symbol, direccion, pos, precio_actual, niveles_atr):
             print(f"[{symbol}] Advertencia: Se alcanzó límite de tamaño máximo")
             # Pero no limitamos el tamaño, seguimos con el valor original
         
-        # Obtener ATR actual para recalcular TP
-        datos = obtener_datos_historicos(symbol)
-        if datos is None:
+        # Obtener ATR actual para recalcular TP (incremental sobre las velas del almacén)
+        indicadores = obtener_indicadores(symbol)
+        if indicadores is None:
             print(f"[{symbol}] No se pudo obtener datos para recalcular ATR")
             return False
-            
-        # Calcular ATR
-        atr = calcular_atr(datos).iloc[-1]
+        atr = indicadores['atr']
         
         # Ejecutar orden DCA
         side = "buy" if direccion == "BUY" else "sell"
@@ -241,27 +271,25 @@ def ejecutar_dca(symbol, direccion, pos, precio_actual, niveles_atr):
         
         # Actualizar información DCA
         num_dca = dca_info.get("num_entradas", 0) + 1
-        
-        niveles_atr[symbol] = {
-            "tp_fijo": nuevo_tp,
-            "dca_info": {
-                "num_entradas": num_dca,
-                "ultima_entrada": datetime.now().isoformat(),
-                "precio_promedio": precio_promedio,
-                "total_size": total_size,
-                "original_size": original_size,  # NUEVO: Guardar el tamaño original
-                "entradas": dca_info.get("entradas", []) + [
-                    {"precio": precio_actual, "tamano": dca_size, "fecha": datetime.now().isoformat()}
-                ]
-            }
+        fecha_dca = datetime.now().isoformat()
+        nuevo_dca_info = {
+            "num_entradas": num_dca,
+            "ultima_entrada": fecha_dca,
+            "precio_promedio": precio_promedio,
+            "total_size": total_size,
+            "original_size": original_size,  # NUEVO: Guardar el tamaño original
+            "entradas": dca_info.get("entradas", []) + [
+                {"precio": precio_actual, "tamano": dca_size, "fecha": fecha_dca}
+            ]
         }
-        guardar_niveles_atr(niveles_atr)
+        niveles_atr[symbol] = {"tp_fijo": nuevo_tp, "dca_info": nuevo_dca_info}
         
         # Cancelar orden TP antigua si existe
-        tp_orders = cargar_ordenes_tp()
-        if symbol in tp_orders and "order_id" in tp_orders[symbol] and tp_orders[symbol]["order_id"]:
+        orden_tp_anterior = estado.orden_tp(symbol) or {}
+        if orden_tp_anterior.get("order_id") or orden_tp_anterior.get("cloid"):
             try:
-                client.cancel_order(symbol=symbol, order_id=tp_orders[symbol]["order_id"])
+                client.cancel_order(symbol=symbol, order_id=orden_tp_anterior.get("order_id"),
+                                    cloid=orden_tp_anterior.get("cloid"))
                 print(f"[{symbol}] Orden TP anterior cancelada")
             except Exception as e:
                 print(f"[{symbol}] Error cancelando orden TP antigua: {e}")
@@ -270,37 +298,35 @@ def ejecutar_dca(symbol, direccion, pos, precio_actual, niveles_atr):
         tp_side = "sell" if direccion == "BUY" else "buy"
         tp_orden = crear_orden_tp_hyperliquid(symbol, tp_side, total_size, nuevo_tp)
         
-        # Actualizar registro de órdenes TP
-        if tp_orden:
-            # MODIFICACIÓN IMPORTANTE: Obtener tiempo de apertura original si existe, si no usar la hora actual
-            if symbol in tp_orders:
-                tiempo_apertura_original = tp_orders[symbol].get("tiempo_apertura", datetime.now().isoformat())
-            else:
-                tiempo_apertura_original = datetime.now().isoformat()
-                
-            tp_orders[symbol] = {
-                "order_id": tp_orden.get("order_id", ""),
-                "price": nuevo_tp,
-                "size": total_size,
-                "side": tp_side,
-                "created_at": datetime.now().isoformat(),
-                "tiempo_apertura": tiempo_apertura_original,  # CONSERVAR el tiempo original
-                "ultimo_dca": datetime.now().isoformat()  # Añadir el tiempo del último DCA
-            }
-            guardar_ordenes_tp(tp_orders)
+        # La entrada DCA y la sustitución de su TP se guardan juntas (o ninguna)
+        with estado.transaccion():
+            estado.guardar_nivel(symbol, nuevo_tp, nuevo_dca_info)
+            estado.agregar_entrada_dca(symbol, precio_actual, dca_size, fecha_dca)
+            
+            # Actualizar registro de órdenes TP
+            if tp_orden:
+                # MODIFICACIÓN IMPORTANTE: Obtener tiempo de apertura original si existe, si no usar la hora actual
+                tiempo_apertura_original = orden_tp_anterior.get("tiempo_apertura", datetime.now().isoformat())
+                    
+                estado.guardar_orden_tp(symbol, {
+                    "order_id": tp_orden.get("order_id") or "",
+                    "cloid": tp_orden.get("cloid"),
+                    "price": tp_orden.get("tp_price", nuevo_tp),
+                    "size": total_size,
+                    "side": tp_side,
+                    "created_at": datetime.now().isoformat(),
+                    "tiempo_apertura": tiempo_apertura_original,  # CONSERVAR el tiempo original
+                    "ultimo_dca": datetime.now().isoformat()  # Añadir el tiempo del último DCA
+                })
         
-        # Registrar en historial
+        # Registrar en historial (dca_history.csv se deriva del diario)
         try:
-            # Asegurarse de que el archivo existe y tiene encabezados
-            if not os.path.exists("dca_history.csv"):
-                with open("dca_history.csv", "w") as f:
-                    f.write("timestamp,symbol,direccion,entry_original,precio_dca,tamano_dca,precio_promedio,nuevo_tp,num_dca\n")
-                    
-            # Añadir la nueva entrada DCA
-            with open("dca_history.csv", "a") as f:
-                f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')},{symbol},{direccion},{entry_price},{precio_actual},{dca_size},{precio_promedio},{nuevo_tp},{num_dca}\n")
+            diario.registrar("dca", symbol=symbol, direccion=direccion, entry_original=entry_price,
+                             precio_dca=precio_actual, tamano_dca=dca_size, precio_promedio=precio_promedio,
+                             nuevo_tp=nuevo_tp, num_dca=num_dca)
         except Exception as e:
             print(f"Error guardando historial DCA: {e}")
+            logging.error(f"Error guardando historial DCA: {e}", exc_info=True)
         
         # Notificar
         mejora_porcentual = abs((precio_promedio - entry_price) / entry_price) * 100
@@ -322,40 +348,21 @@ def ejecutar_dca(symbol, direccion, pos, precio_actual, niveles_atr):
         return False
 
 def obtener_simbolos_disponibles():
-    """Obtiene la lista de símbolos disponibles en Hyperliquid ordenados por capitalización"""
-    # Lista ampliada de los 20 pares con mayor capitalización en Hyperliquid
-    todos_simbolos = [
-        'BTC', 'ETH', 'SOL', 'BNB', 'XRP', 'ADA', 'AVAX', 'LINK', 'MATIC'
-    ]
+    """Obtiene los perpetuos listados en Hyperliquid ordenados por liquidez (volumen diario)"""
+    print("Descubriendo perpetuos disponibles en Hyperliquid...")
     
-    print("Verificando disponibilidad de símbolos en Hyperliquid...")
+    # Una llamada metaAndAssetCtxs + allMids para todo el universo (caché en disco entre reevaluaciones)
+    activos = obtener_universo(client, REEVALUACION_SIMBOLOS_HORAS * 3600)
+    simbolos_disponibles = seleccionar_simbolos(activos, MAX_SIMBOLOS, MIN_VOLUMEN_24H_USD)
+    # El universo ya trae szDecimals: los listados nuevos tienen reglas de redondeo sin otra descarga de 'meta'
+    metadatos.incorporar(activos)
     
-    simbolos_disponibles = []
-    simbolos_solo_precio = []  # Nueva lista para símbolos con precio pero sin datos históricos
+    por_simbolo = {a["symbol"]: a for a in activos}
+    for symbol in simbolos_disponibles:
+        activo = por_simbolo[symbol]
+        print(f"✅ {symbol} - Precio: {activo['mid']} | Volumen 24h: {activo['volumen_24h']:,.0f} USD | OI: {activo['open_interest']:,.0f} USD")
     
-    for symbol in todos_simbolos:
-        try:
-            # Intenta obtener precio actual para verificar disponibilidad
-            precio = client.get_price(symbol)
-            if precio and precio.get('mid'):
-                # Verificar además que podemos obtener datos históricos
-                df = client.get_ohlcv(symbol, '1m', 10)  # Solo probamos con 10 velas
-                if df is not None and len(df) > 0:
-                    simbolos_disponibles.append(symbol)
-                    print(f"✅ {symbol} disponible completo - Precio: {precio.get('mid')}")
-                else:
-                    # Ya no añadiremos estos símbolos a la lista principal
-                    simbolos_solo_precio.append(symbol)
-                    print(f"⚠️ {symbol} tiene precio ({precio.get('mid')}) pero no datos históricos - NO SE USARÁ")
-            else:
-                print(f"❌ {symbol} no disponible o sin liquidez")
-        except Exception as e:
-            print(f"❌ Error verificando {symbol}: {str(e)}")
-    
-    # Ya no agregamos los símbolos que solo tienen precio
-    print(f"Total de símbolos disponibles con datos históricos completos: {len(simbolos_disponibles)}")
-    if simbolos_solo_precio:
-        print(f"Símbolos descartados (solo tienen precio): {', '.join(simbolos_solo_precio)}")
+    print(f"Total de símbolos seleccionados: {len(simbolos_disponibles)} de {len(activos)} perpetuos listados")
     
     # Guardar la última vez que verificamos los símbolos
     with open("ultima_verificacion_simbolos.txt", "w") as f:
@@ -407,44 +414,28 @@ def retry_api_call(func, *args, **kwargs):
     return None
 
 def cargar_niveles_atr():
+    """Niveles TP y DCA de todos los símbolos ({symbol: {"tp_fijo", "dca_info"}})"""
     try:
-        if os.path.exists(ATR_LEVELS_FILE):
-            with open(ATR_LEVELS_FILE, "r") as f:
-                return json.load(f)
-        else:
-            return {}
+        return estado.niveles()
     except Exception as e:
         logging.error(f"Error cargando niveles ATR: {e}", exc_info=True)
         enviar_telegram(f"⚠️ Error al cargar niveles ATR: {e}", tipo="error")
         return {}
 
-def guardar_niveles_atr(data):
-    try:
-        with open(ATR_LEVELS_FILE, "w") as f:
-            json.dump(data, f)
-    except Exception as e:
-        logging.error(f"Error guardando niveles ATR: {e}", exc_info=True)
-        enviar_telegram(f"⚠️ Error al guardar niveles ATR: {e}", tipo="error")
-
 def cargar_ordenes_tp():
-    """Carga las órdenes TP pendientes del archivo"""
+    """Carga las órdenes TP pendientes ({symbol: {"order_id", "price", ...}})"""
     try:
-        if os.path.exists(TP_ORDERS_FILE):
-            with open(TP_ORDERS_FILE, "r") as f:
-                return json.load(f)
-        else:
-            return {}
+        return estado.ordenes_tp()
     except Exception as e:
         logging.error(f"Error cargando órdenes TP: {e}", exc_info=True)
         return {}
 
-def guardar_ordenes_tp(data):
-    """Guarda las órdenes TP pendientes al archivo"""
+def borrar_nivel_atr(symbol):
     try:
-        with open(TP_ORDERS_FILE, "w") as f:
-            json.dump(data, f)
+        estado.borrar_nivel(symbol)
     except Exception as e:
-        logging.error(f"Error guardando órdenes TP: {e}", exc_info=True)
+        logging.error(f"Error borrando niveles ATR de {symbol}: {e}", exc_info=True)
+        enviar_telegram(f"⚠️ Error al guardar niveles ATR: {e}", tipo="error")
 
 def ajustar_precision(valor, precision):
     return float(f"{valor:.{precision}f}") if precision > 0 else float(int(valor))
@@ -452,22 +443,11 @@ def ajustar_precision(valor, precision):
 # Función nueva para guardar historial de PnL real
 def guardar_historial_pnl(symbol, direccion, entry_price, exit_price, tp_price, pnl_real, 
                          tiempo_abierto=None, razon_cierre="normal"):
-    """Guarda el historial de PnL para análisis posterior en formato CSV"""
+    """Registra el cierre en el diario de eventos (pnl_history.csv se deriva de él)"""
     try:
-        # Asegurarse de que el archivo existe con encabezados
-        if not os.path.exists(PNL_HISTORY_FILE):
-            with open(PNL_HISTORY_FILE, "w") as f:
-                f.write("timestamp,symbol,direccion,precio_entrada,precio_salida,tp,pnl_real,tiempo_abierto,razon_cierre\n")
-        
-        # Tiempo actual
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Si no se proporciona tiempo abierto, será N/A
-        tiempo_abierto = tiempo_abierto if tiempo_abierto else "N/A"
-        
-        # Guardar en CSV (asegurarse de que haya un salto de línea al final)
-        with open(PNL_HISTORY_FILE, "a") as f:
-            f.write(f"{timestamp},{symbol},{direccion},{entry_price},{exit_price},{tp_price or 0},{pnl_real},{tiempo_abierto},{razon_cierre}\n")  # Asegúrate de que termina con \n
+        diario.registrar("cerrada", symbol=symbol, direccion=direccion, precio_entrada=entry_price,
+                         precio_salida=exit_price, tp=tp_price, pnl_real=pnl_real,
+                         tiempo_abierto=tiempo_abierto, razon_cierre=razon_cierre)
         
         print(f"[HISTORIAL] Trade {symbol} {direccion} guardado. PnL: {pnl_real}")
             
@@ -565,43 +545,41 @@ def obtener_posiciones_hyperliquid():
 
 def obtener_datos_historicos(symbol, interval='1m', limit=100):
     try:
-        # Importamos pandas aquí para asegurar que está disponible
-        import pandas as pd
-        
         # No enviamos notificaciones por errores de datos históricos
-        df = client.get_ohlcv(symbol, interval, limit)
-        if df is None:
+        # El almacén solo descarga las velas posteriores a la última que ya tiene
+        if not almacen_velas.actualizar(symbol, interval):
             # Solo registrar en el log, sin enviar a Telegram
             print(f"Error al obtener datos históricos para {symbol}")
             logging.error(f"Error al obtener datos históricos para {symbol}")
             return None
             
-        if isinstance(df, list):
-            df = pd.DataFrame(df)
-            df.columns = ['timestamp','open','high','low','close','volume']
-        return df
+        return almacen_velas.obtener_dataframe(symbol, interval, limit)
     except Exception as e:
         # Solo registrar en el log, sin enviar a Telegram
         print(f"Error al obtener datos históricos para {symbol}: {e}")
         logging.error(f"Error al obtener datos históricos para {symbol}: {e}", exc_info=True)
         return None
 
-def calcular_atr(df, n=14):
-    high_low = df['high'] - df['low']
-    high_close = abs(df['high'] - df['close'].shift())
-    low_close = abs(df['low'] - df['close'].shift())
-    ranges = pd.concat([high_low, high_close, low_close], axis=1)
-    true_range = ranges.max(axis=1)
-    atr = true_range.rolling(window=n, min_periods=1).mean()
-    return atr
-
-def calcular_ema(df, n=30):
-    return df['close'].ewm(span=n, adjust=False).mean()
+def obtener_indicadores(symbol, interval='1m'):
+    """Pone al día las velas del símbolo y devuelve los indicadores de la vela en formación"""
+    try:
+        if not almacen_velas.actualizar(symbol, interval):
+            print(f"Error al obtener datos históricos para {symbol}")
+            logging.error(f"Error al obtener datos históricos para {symbol}")
+            return None
+        return almacen_velas.indicadores(symbol, interval, MULTIPLICADOR_VOL_POR_SIMBOLO.get(symbol, 1.0))
+    except Exception as e:
+        print(f"Error al obtener indicadores para {symbol}: {e}")
+        logging.error(f"Error al obtener indicadores para {symbol}: {e}", exc_info=True)
+        return None
 
-def spread_aceptable(symbol):
+def spread_aceptable(symbol, mercado=None):
     try:
         spread_limit = SPREAD_MAX_PCT_POR_SIMBOLO.get(symbol, SPREAD_MAX_PCT)
-        order_book = retry_api_call(client.get_order_book, symbol=symbol)
+        if mercado is not None:
+            order_book = mercado.libro(symbol)
+        else:
+            order_book = retry_api_call(client.get_order_book, symbol=symbol)
         if not order_book or not order_book['bids'] or not order_book['asks']:
             logging.error(f"No se pudo obtener order book para {symbol}")
             return False
@@ -617,158 +595,130 @@ def spread_aceptable(symbol):
         logging.error(f"Error al evaluar spread aceptable para {symbol}: {e}", exc_info=True)
         return False
 
-def detectar_volatilidad_extrema(df):
-    if len(df) < VOLATILITY_WINDOW + 1:
-        return False
-    precio_ini = df['close'].iloc[-VOLATILITY_WINDOW-1]
-    precio_fin = df['close'].iloc[-1]
-    move_pct = abs(precio_fin - precio_ini) / precio_ini
-    if move_pct > VOLATILITY_UMBRAL:
-        return True
-    return False
-
-def aplicar_condiciones_microestructura_v2(df, precio_actual, symbol):
-    # Si no tenemos datos históricos, no podemos aplicar la estrategia
-    if df is None or len(df) < 30:  # Necesitamos al menos 30 velas para los cálculos (EMA30)
-        return None, "No hay suficientes datos históricos para este símbolo", None, None
-        
-    # Aquí comienza el código original de la estrategia de microestructura
-    ventana_vol = 20
-    ventana_atr = 14
-    ventana_atr_media = 20
-
-    breakout_mult = BREAKOUT_ATR_MULT_POR_SIMBOLO.get(symbol, 0.1)
-    vol_mult = MULTIPLICADOR_VOL_POR_SIMBOLO.get(symbol, 1.0)
-
-    df['vol_rolling'] = df['volume'].rolling(ventana_vol).mean()
-    df['atr'] = calcular_atr(df, ventana_atr)
-    df['atr_media'] = df['atr'].rolling(ventana_atr_media).mean()
-    df['ema30'] = calcular_ema(df, 30)
-    df['vol_spike'] = df['volume'] > df['vol_rolling'] * vol_mult
-
-    atr_actual = df['atr'].iloc[-1]
-    atr_media_actual = df['atr_media'].iloc[-1]
-    close_actual = df['close'].iloc[-1]
-    ema30_actual = df['ema30'].iloc[-1]
-    prev_max = df['high'].iloc[-6:-1].max()
-    prev_min = df['low'].iloc[-6:-1].min()
-
-    if atr_actual < 0.7 * atr_media_actual:
-        razon = f"ATR actual ({atr_actual:.6f}) < 0.5*ATR20 media ({0.5*atr_media_actual:.6f})."
-        return None, razon, None, None
-
-    long_signal = (
-        df['vol_spike'].iloc[-1]
-        and close_actual > prev_max + breakout_mult * atr_actual
-        and close_actual > ema30_actual
-    )
-    short_signal = (
-        df['vol_spike'].iloc[-1]
-        and close_actual < prev_min - breakout_mult * atr_actual
-        and close_actual < ema30_actual
-    )
-
-    if long_signal or short_signal:
-        accion = 'BUY' if long_signal else 'SELL'
-        razon = f"Señal {'LONG' if long_signal else 'SHORT'}: spike volumen, ruptura real y tendencia {'alcista' if long_signal else 'bajista'} EMA30."
-        # Eliminado completamente el código de potential profit
-        return accion, razon, atr_actual, close_actual
-
-    razon = f"No se detecta señal de microestructura (volumen spike: {df['vol_spike'].iloc[-1]})"
-    return None, razon, None, None
-
-def calcular_tp_atr(entry_price, atr, direction, fee_rate=0.001):
-    """
-    Calcula el precio de Take Profit basado en ATR con validación de dirección mejorada.
+def evaluar_velas_simbolos(simbolos_lote, matrices):
     """
-    max_tp_move = entry_price * MAX_TP_PCT
+    Evalúa la estrategia en la última vela de cada símbolo (ver senales.evaluar_senales_lote)
     
-    # Normalizar la dirección para asegurar que solo sea "BUY" o "SELL"
-    direction_normalizada = direction.upper().strip()
-    if "BUY" in direction_normalizada:
-        direction_normalizada = "BUY"
-    elif "SELL" in direction_normalizada:
-        direction_normalizada = "SELL"
-    else:
-        # Si no podemos determinar la dirección, usar un valor seguro
-        print(f"ERROR: Dirección no reconocida '{direction}'. Se usará 'SELL' por defecto.")
-        direction_normalizada = "SELL"
+    Los símbolos se agrupan por número de velas: cada matriz del lote tiene filas de
+    igual longitud sin recortar el histórico de nadie, así que un símbolo recién
+    listado no altera las semillas de EMA/ATR (ni las señales) de los demás.
     
-    if direction_normalizada == "BUY":
-        # Para operaciones LONG
-        tp = entry_price + ATR_TP_MULT * atr
-        # No permitir que exceda el porcentaje máximo
-        tp = min(tp, entry_price * (1 + MAX_TP_PCT))
-        # Asegurar ganancia mínima para cubrir comisiones
-        tp = max(tp, entry_price * (1 + fee_rate * 3))
-    else:
-        # Para operaciones SHORT
-        tp = entry_price - ATR_TP_MULT * atr
-        # No permitir que exceda el porcentaje máximo (en SHORT es precio menor)
-        tp = max(tp, entry_price * (1 - MAX_TP_PCT))
-        # Asegurar ganancia mínima para cubrir comisiones (pero sin subir sobre el precio de entrada)
-        tp = min(tp, entry_price * (1 - fee_rate * 3))
+    Args:
+        simbolos_lote (list): Símbolos a evaluar
+        matrices (list): Arrays (n, 6) [timestamp, open, high, low, close, volume] de cada símbolo
     
-    # Validación final para detectar valores desorbitados
-    pct_change = abs(tp - entry_price) / entry_price
-    if pct_change > MAX_TP_PCT:
-        print(f"ADVERTENCIA: TP calculado ({tp:.4f}) excede el límite máximo permitido ({MAX_TP_PCT*100}%)")
-        # Corregir el TP para que respete el límite máximo
-        if direction_normalizada == "BUY":
-            tp = entry_price * (1 + MAX_TP_PCT)
-        else:
-            tp = entry_price * (1 - MAX_TP_PCT)
+    Returns:
+        tuple: (lista de (simbolo, accion, razon, atr, entry_price, fuerza),
+                dict simbolo -> (umbral_long, umbral_short) de la vela en formación)
+    """
+    grupos = {}
+    for simbolo, velas in zip(simbolos_lote, matrices):
+        grupos.setdefault(len(velas), []).append((simbolo, velas))
     
-    return tp
+    resultados = []
+    umbrales = {}
+    for grupo in grupos.values():
+        simbolos_grupo = [simbolo for simbolo, _ in grupo]
+        velas = np.stack([m[:, 1:] for _, m in grupo])
+        senales = evaluar_senales_lote(velas, simbolos_grupo, BREAKOUT_ATR_MULT_POR_SIMBOLO, MULTIPLICADOR_VOL_POR_SIMBOLO)
+        
+        for i, simbolo in enumerate(simbolos_grupo):
+            if not np.isnan(senales['umbral_long'][i]):
+                umbrales[simbolo] = (float(senales['umbral_long'][i]), float(senales['umbral_short'][i]))
+            
+            atr_actual = float(senales['atr'][i])
+            atr_media_actual = float(senales['atr_media'][i])
+            if senales['accion'][i] == LONG:
+                accion = 'BUY'
+            elif senales['accion'][i] == SHORT:
+                accion = 'SELL'
+            else:
+                accion = None
+            
+            if accion:
+                razon = f"Señal {'LONG' if accion == 'BUY' else 'SHORT'}: spike volumen, ruptura real y tendencia {'alcista' if accion == 'BUY' else 'bajista'} EMA30."
+                resultados.append((simbolo, accion, razon, atr_actual, float(senales['close'][i]), float(senales['fuerza'][i])))
+            elif not senales['atr_ok'][i]:
+                razon = f"ATR actual ({atr_actual:.6f}) < 0.5*ATR20 media ({0.5*atr_media_actual:.6f})."
+                resultados.append((simbolo, None, razon, None, None, 0.0))
+            else:
+                razon = f"No se detecta señal de microestructura (volumen spike: {bool(senales['vol_spike'][i])})"
+                resultados.append((simbolo, None, razon, None, None, 0.0))
+    return resultados, umbrales
+
+def evaluar_entradas_lote(candidatos, interval='1m', limit=100):
+    """
+    Actualiza las velas de los candidatos y evalúa la estrategia para todos a la vez
+    sobre una matriz símbolos x velas (ver senales.evaluar_senales_lote)
+    
+    Las velas de todos los candidatos se descargan a la vez con el cliente asyncio.
+    
+    Returns:
+        list: Tuplas (simbolo, accion, razon, atr, entry_price, fuerza) en el orden de 'candidatos'
+    """
+    resultados = []
+    simbolos_lote = []
+    matrices = []
+    try:
+        actualizados = cliente_async.ejecutar(almacen_velas.actualizar_lote(cliente_async.cliente, candidatos, interval))
+    except Exception as e:
+        logging.error(f"Error actualizando velas del lote: {e}", exc_info=True)
+        actualizados = [False] * len(candidatos)
+    for simbolo, actualizado in zip(candidatos, actualizados):
+        if not actualizado:
+            print(f"Error al obtener datos históricos para {simbolo}")
+            logging.error(f"Error al obtener datos históricos para {simbolo}")
+            continue
+        velas = almacen_velas.obtener_array(simbolo, interval, limit)
+        if velas is None or len(velas) < MIN_VELAS:
+            resultados.append((simbolo, None, "No hay suficientes datos históricos para este símbolo", None, None, 0.0))
+            continue
+        simbolos_lote.append(simbolo)
+        matrices.append(velas)
+
+    if simbolos_lote:
+        senales_lote, umbrales = evaluar_velas_simbolos(simbolos_lote, matrices)
+        resultados.extend(senales_lote)
+        
+        # Precios de ruptura vigentes hasta el cierre de la vela: el WebSocket los vigila entre evaluaciones
+        with lock_disparo:
+            umbrales_disparo.clear()
+            umbrales_disparo.update(umbrales)
+
+    orden = {simbolo: i for i, simbolo in enumerate(candidatos)}
+    return sorted(resultados, key=lambda r: orden[r[0]])
 
-def calcular_cantidad_valida(symbol, monto_usdt):
+def calcular_cantidad_valida(symbol, monto_usdt, mercado=None):
     """
     Calcula la cantidad válida para una orden en Hyperliquid asegurando
     que cumpla con los requisitos de precisión.
     """
     try:
-        precio_actual = obtener_precio_hyperliquid(symbol)
+        precio_actual = obtener_precio_hyperliquid(symbol, mercado)
         if precio_actual is None:
             print(f"[{symbol}] No se pudo obtener precio actual")
             return None
             
-        # Obtener la precisión adecuada para este símbolo
-        precision = PRECISION_POR_SIMBOLO.get(symbol, 0)
+        # Reglas de redondeo del activo (szDecimals del exchange)
+        reglas = metadatos.reglas(symbol)
+        if reglas is None:
+            print(f"[{symbol}] Sin metadatos del exchange para este símbolo")
+            logging.error(f"Sin metadatos del exchange para {symbol}")
+            return None
         
         # Calcular la cantidad base (Añadir log)
         cantidad_calculada = monto_usdt / precio_actual
         print(f"[{symbol}] Monto USDT: {monto_usdt}, Precio actual: {precio_actual}")
         print(f"[{symbol}] Cantidad calculada antes de ajustar precision: {cantidad_calculada}")
         
-        # Para los tokens que requieren enteros (DOGE, ARB, etc.)
-        if precision == 0:
-            cantidad_redondeada = int(cantidad_calculada)
-            print(f"[{symbol}] Cantidad redondeada a entero: {cantidad_redondeada}")
-            # Asegurarnos de que la cantidad no sea cero
-            if cantidad_redondeada == 0:
-                cantidad_redondeada = 1
-                print(f"[{symbol}] Cantidad ajustada a mínimo 1 (entero)")
-        else:
-            # Para tokens que permiten decimales, redondeamos a la precisión adecuada
-            cantidad_redondeada = round(cantidad_calculada, precision)
-            print(f"[{symbol}] Cantidad redondeada a precisión {precision}: {cantidad_redondeada}")
-            # Asegurarnos de que la cantidad no sea cero
-            if cantidad_redondeada == 0:
-                cantidad_redondeada = 10**(-precision)
-                print(f"[{symbol}] Cantidad ajustada a mínimo {10**(-precision)}")
-        
-        # Convertir a float para asegurar compatibilidad con la API
-        cantidad_redondeada = float(cantidad_redondeada)
+        # Redondeo a szDecimals (como mínimo una unidad negociable)
+        cantidad_redondeada = reglas.redondear_tamano(cantidad_calculada)
+        print(f"[{symbol}] Cantidad redondeada a precisión {reglas.sz_decimals}: {cantidad_redondeada}")
         
         # Verificar si la cantidad es adecuada
         valor_posicion = cantidad_redondeada * precio_actual
         print(f"[{symbol}] Valor USD final de la posición: {valor_posicion:.2f} USD (esperado: ~{monto_usdt})")
         
-        # Añadir una verificación adicional para el caso de SOL
-        if symbol == "SOL" and cantidad_redondeada < 1.0:
-            print(f"[SOL] ADVERTENCIA: La cantidad calculada es muy baja ({cantidad_redondeada}), se usará 6.6")
-            cantidad_redondeada = 6.6  # Valor fijo para SOL como prueba
-        
         return cantidad_redondeada
         
     except Exception as e:
@@ -819,8 +769,10 @@ def crear_orden_tp_hyperliquid(symbol, side, quantity, price):
     """
     try:
         # La API de Hyperliquid necesita ser llamada de manera diferente para órdenes límite
-        precision = PRECISION_POR_SIMBOLO.get(symbol, 0)
-        price_rounded = round(price, precision + 2)  # Más precisión para el precio
+        # 5 cifras significativas y como mucho 6 - szDecimals decimales
+        price_rounded = metadatos.redondear_precio(symbol, price)
+        if price_rounded is None:
+            price_rounded = float(f"{price:.5g}")
         
         # Para debugging
         print(f"[{symbol}] Creando orden TP: {side} {quantity} @ {price_rounded}")
@@ -830,16 +782,24 @@ def crear_orden_tp_hyperliquid(symbol, side, quantity, price):
         
         # Intento 1: Usar create_order pero sin el parámetro 'type'
         try:
+            cloid = nuevo_cloid()
             orden = client.create_order(
                 symbol=symbol,
                 side=side,
                 size=quantity,
-                price=price_rounded
-                # Eliminado el parámetro 'type="limit"'
+                price=price_rounded,
+                reduce_only=True,
+                cloid=cloid
             )
             
             if orden and "status" in orden:
                 print(f"[{symbol}] Orden TP creada exitosamente: {orden}")
+                # Identificadores para cancelarla más tarde (oid de la respuesta y cloid propio)
+                estado_tp = resumir_respuesta(orden)
+                if not estado_tp.get("error"):
+                    orden["order_id"] = estado_tp.get("oid")
+                    orden["cloid"] = cloid.to_raw()
+                orden["tp_price"] = price_rounded
                 return orden
             else:
                 print(f"[{symbol}] Error al crear orden TP: respuesta sin status")
@@ -848,15 +808,6 @@ def crear_orden_tp_hyperliquid(symbol, side, quantity, price):
         except Exception as e:
             print(f"[{symbol}] Error al crear orden TP con método principal: {e}")
         
-        # Intento 2: Usar exchange.limit_open si está disponible
-        try:
-            orden = client.exchange.limit_open(symbol, is_buy, quantity, price_rounded)
-            if orden and "status" in orden:
-                print(f"[{symbol}] Orden TP creada exitosamente (método alternativo): {orden}")
-                return orden
-        except Exception as e2:
-            print(f"[{symbol}] Error en método alternativo de TP: {e2}")
-            
         # Si llegamos aquí, es que fallaron todas las opciones anteriores
         # Creamos un TP en modo manual (solo para seguimiento)
         print(f"[{symbol}] Usando modo de TP manual como fallback")
@@ -864,91 +815,90 @@ def crear_orden_tp_hyperliquid(symbol, side, quantity, price):
     except Exception as e:
         print(f"[{symbol}] Error general al crear orden TP: {e}")
         logging.error(f"Error general al crear orden TP para {symbol}: {e}", exc_info=True)
-        return {"status": "manual_tp", "tp_price": price}
+        return {"status": "manual_tp", "tp_price": metadatos.redondear_precio(symbol, price) or price}
 
-def ejecutar_orden_hyperliquid(symbol, side, quantity, tp_price=None):
+def ejecutar_orden_hyperliquid(symbol, side, quantity, tp_price=None, precio_referencia=None):
     """
     Ejecuta una orden de mercado y opcionalmente establece un TP
     
+    Con TP, entrada y TP reduce-only se envían juntos en una sola acción
+    (bulk_orders con agrupación normalTpsl): la posición nunca queda sin TP.
+    
     Args:
         symbol (str): Símbolo del par de trading
         side (str): Dirección de la orden ('buy' o 'sell')
         quantity (float): Cantidad a operar
         tp_price (float, optional): Precio para el Take Profit
+        precio_referencia (float, optional): Precio actual para calcular el límite de la entrada
     
     Returns:
         dict: Orden principal ejecutada
         dict: Orden TP si se estableció
     """
     try:
-        # Ejecutar la orden principal (market) - MODIFICACIÓN para aplicar apalancamiento
-        try:
-            # Aplicar explícitamente el apalancamiento configurado
-            orden_principal = client.create_order(
-                symbol=symbol,
-                side=side,
-                size=quantity,
-                leverage=LEVERAGE  # Añadimos el parámetro leverage explícitamente
-            )
-        except TypeError as e:
-            # Si falla, intentar con un método alternativo
-            print(f"[{symbol}] Error con create_order estándar: {e}")
-            try:
-                # Intentar usando exchange.market_open si está disponible y aplicar apalancamiento
-                is_buy = side.lower() == "buy"
-                # Intentamos configurar el leverage primero si la API lo permite
-                try:
-                    client.set_leverage(symbol=symbol, leverage=LEVERAGE)
-                except Exception as e_lev:
-                    print(f"[{symbol}] Error configurando leverage: {e_lev}")
-                
-                orden_principal = client.exchange.market_open(symbol, is_buy, quantity)
-            except Exception as e2:
-                print(f"[{symbol}] Error con método alternativo: {e2}")
-                enviar_telegram(f"⚠️ Error al ejecutar orden para {symbol}: {e2}", tipo="error")
+        if tp_price is None:
+            orden_principal = client.create_order(symbol=symbol, side=side, size=quantity, leverage=LEVERAGE)
+            if not orden_principal or "status" not in orden_principal:
+                enviar_telegram(f"⚠️ Error al ejecutar orden para {symbol}", tipo="error")
                 return None, None
+            return orden_principal, None
+        
+        # 5 cifras significativas y como mucho 6 - szDecimals decimales
+        tp_redondeado = metadatos.redondear_precio(symbol, tp_price) or float(f"{tp_price:.5g}")
+        tiempo_apertura = datetime.now()
+        resultado = client.abrir_con_tp(symbol, side, quantity, tp_redondeado,
+                                        precio_referencia=precio_referencia, leverage=LEVERAGE)
         
-        if not orden_principal or "status" not in orden_principal:
-            enviar_telegram(f"⚠️ Error al ejecutar orden para {symbol}", tipo="error")
+        entrada = resultado["entrada"]
+        if resultado["status"] != "ok" or entrada.get("estado") != "filled":
+            print(f"[{symbol}] Entrada no ejecutada: {entrada.get('error') or resultado['respuesta']}")
+            logging.error(f"Entrada no ejecutada para {symbol}: {resultado['respuesta']}")
+            enviar_telegram(f"⚠️ Error al ejecutar orden para {symbol}: {entrada.get('error', 'sin llenado')}", tipo="error")
             return None, None
-            
+        
+        orden_principal = {"status": "ok", "order_id": entrada.get("oid"), "size": entrada.get("total_sz"),
+                           "avg_px": entrada.get("avg_px"), "respuesta": resultado["respuesta"]}
         print(f"[{symbol}] Orden principal ejecutada: {orden_principal}")
         
-        # Registrar tiempo de apertura del trade
-        tiempo_apertura = datetime.now()
+        # El TP cubre lo que realmente se llenó, no la cantidad pedida
+        tamano_llenado = entrada.get("total_sz") or quantity
+        tp_side = "sell" if side.lower() == "buy" else "buy"
+        if resultado["tp"].get("error"):
+            # El exchange rechazó el TP hijo: se crea como orden límite independiente
+            print(f"[{symbol}] TP rechazado en la orden agrupada: {resultado['tp']['error']}")
+            orden_tp = crear_orden_tp_hyperliquid(symbol, tp_side, tamano_llenado, tp_redondeado)
+        else:
+            orden_tp = {"status": "ok", "order_id": resultado["tp"].get("oid"), "cloid": resultado["tp"].get("cloid"),
+                        "estado": resultado["tp"].get("estado"), "tp_price": tp_redondeado}
         
-        # Si se especifica precio TP, crear una orden límite para el TP
-        orden_tp = None
-        if tp_price is not None:
-            # Esperar un breve momento para asegurar que la orden principal se procesó
-            time.sleep(0.5)
-            
-            # El lado del TP es opuesto a la entrada
-            tp_side = "sell" if side.lower() == "buy" else "buy"
-            
-            # Crear la orden TP
-            orden_tp = crear_orden_tp_hyperliquid(symbol, tp_side, quantity, tp_price)
-            
-            # Guardar el ID de la orden TP para seguimiento
+        try:
+            diario.registrar("abierta", symbol=symbol, direccion=side.upper(),
+                             precio=entrada.get("avg_px"), tamano=tamano_llenado,
+                             tp=tp_redondeado, order_id=entrada.get("oid"))
             if orden_tp:
-                # Guardar referencia de la orden TP
-                try:
-                    tp_orders = cargar_ordenes_tp()
-                    
-                    # Guardar relación entre símbolo y orden TP
-                    tp_orders[symbol] = {
-                        "order_id": orden_tp.get("order_id", ""),
-                        "price": tp_price,
-                        "size": quantity,
-                        "side": tp_side,
-                        "created_at": datetime.now().isoformat(),
-                        "tiempo_apertura": tiempo_apertura.isoformat()  # Guardar tiempo de apertura
-                    }
-                    
-                    guardar_ordenes_tp(tp_orders)
-                    print(f"[{symbol}] Orden TP guardada en archivo de seguimiento")
-                except Exception as e:
-                    print(f"[{symbol}] Error guardando referencia de orden TP: {e}")
+                diario.registrar("tp_colocado", symbol=symbol, order_id=orden_tp.get("order_id"),
+                                 precio=orden_tp.get("tp_price", tp_redondeado), tamano=tamano_llenado)
+        except Exception as e:
+            print(f"[{symbol}] Error registrando la apertura en el diario: {e}")
+            logging.error(f"Error registrando la apertura de {symbol} en el diario: {e}", exc_info=True)
+        
+        # Guardar el ID de la orden TP para seguimiento
+        if orden_tp:
+            try:
+                # Guardar relación entre símbolo y orden TP
+                estado.guardar_orden_tp(symbol, {
+                    "order_id": orden_tp.get("order_id") or "",
+                    "cloid": orden_tp.get("cloid"),
+                    "entry_order_id": entrada.get("oid"),
+                    "price": orden_tp.get("tp_price", tp_redondeado),
+                    "size": tamano_llenado,
+                    "side": tp_side,
+                    "created_at": datetime.now().isoformat(),
+                    "tiempo_apertura": tiempo_apertura.isoformat()  # Guardar tiempo de apertura
+                })
+                print(f"[{symbol}] Orden TP guardada en el estado")
+            except Exception as e:
+                print(f"[{symbol}] Error guardando referencia de orden TP: {e}")
             
         return orden_principal, orden_tp
     except Exception as e:
@@ -972,26 +922,18 @@ def verificar_ordenes_tp_pendientes():
         simbolos_con_posicion = [pos['asset'] for pos in posiciones]
         
         # Verificar órdenes pendientes
-        ordenes_activas = []
         for symbol, order_info in tp_orders.items():
             # Si ya no hay posición para este símbolo, cancelar la orden TP
             if symbol not in simbolos_con_posicion:
                 try:
-                    if "order_id" in order_info and order_info["order_id"]:
-                        # Solo intentar cancelar si hay un ID de orden
-                        client.cancel_order(symbol=symbol, order_id=order_info["order_id"])
+                    if order_info.get("order_id") or order_info.get("cloid"):
+                        # Solo intentar cancelar si hay un ID de orden (oid o cloid)
+                        client.cancel_order(symbol=symbol, order_id=order_info.get("order_id"),
+                                            cloid=order_info.get("cloid"))
                         print(f"[{symbol}] Orden TP cancelada - Posición cerrada")
                 except Exception as e:
                     print(f"[{symbol}] Error cancelando orden TP: {e}")
-            else:
-                ordenes_activas.append(symbol)
-        
-        # Actualizar el archivo de órdenes TP
-        tp_orders_actualizadas = {symbol: info for symbol, info in tp_orders.items() 
-                                 if symbol in ordenes_activas}
-        
-        if len(tp_orders) != len(tp_orders_actualizadas):
-            guardar_ordenes_tp(tp_orders_actualizadas)
+                estado.borrar_orden_tp(symbol)
             
     except Exception as e:
         print(f"Error verificando órdenes TP pendientes: {e}")
@@ -1039,6 +981,7 @@ def cerrar_posicion(symbol, positionAmt):
     Cierra una posición usando parámetros compatibles con la API de Hyperliquid
     Con verificación mejorada y manejo de errores
     """
+    global last_trade_time
     try:
         pnl_real = None
         tiempo_abierto = "N/A"
@@ -1046,10 +989,10 @@ def cerrar_posicion(symbol, positionAmt):
 
         try:
             # Verificar si tenemos información de tiempo de apertura en las órdenes TP
-            tp_orders = cargar_ordenes_tp()
-            if symbol in tp_orders and "tiempo_apertura" in tp_orders[symbol]:
+            orden_tp = estado.orden_tp(symbol) or {}
+            if "tiempo_apertura" in orden_tp:
                 try:
-                    tiempo_apertura = datetime.fromisoformat(tp_orders[symbol]["tiempo_apertura"])
+                    tiempo_apertura = datetime.fromisoformat(orden_tp["tiempo_apertura"])
                     tiempo_abierto = str(datetime.now() - tiempo_apertura).split('.')[0]  # Formato HH:MM:SS
                     print(f"[{symbol}] Tiempo abierto calculado: {tiempo_abierto}")
                 except Exception as e:
@@ -1072,13 +1015,12 @@ def cerrar_posicion(symbol, positionAmt):
             entryPrice = 0
 
         # Cancelar órdenes TP pendientes
-        tp_orders = cargar_ordenes_tp()
-        if symbol in tp_orders and "order_id" in tp_orders[symbol] and tp_orders[symbol]["order_id"]:
+        orden_tp = estado.orden_tp(symbol) or {}
+        if orden_tp.get("order_id") or orden_tp.get("cloid"):
             try:
-                client.cancel_order(symbol=symbol, order_id=tp_orders[symbol]["order_id"])
+                client.cancel_order(symbol=symbol, order_id=orden_tp.get("order_id"), cloid=orden_tp.get("cloid"))
                 print(f"[{symbol}] Orden TP cancelada antes de cerrar posición")
-                del tp_orders[symbol]
-                guardar_ordenes_tp(tp_orders)
+                estado.borrar_orden_tp(symbol)
             except Exception as e:
                 print(f"[{symbol}] Error cancelando orden TP: {e}")
 
@@ -1090,95 +1032,44 @@ def cerrar_posicion(symbol, positionAmt):
 
         print(f"[{symbol}] Cerrando posición: {side.upper()} {quantity} (posición original: {position_float})")
 
-        # MÉTODO 1: Usar create_order simple
-        try:
-            order = client.create_order(
-                symbol=symbol,
-                side=side,
-                size=quantity
-            )
-            if order:
-                print(f"[{symbol}] Orden de cierre enviada exitosamente: {order}")
-                time.sleep(3)  # Esperar para que se procese
-
-                # Verificar si realmente se cerró
-                if verificar_posicion_cerrada(symbol):
-                    # Activar cooldown tras cierre exitoso
-                    last_trade_time = datetime.now()
-                    print(f"[{symbol}] Cooldown activado tras cierre exitoso")
-                    print(f"[{symbol}] ✓ Posición cerrada exitosamente (método 1)")
-                    precio_actual = obtener_precio_hyperliquid(symbol) or entryPrice
-                    tp = None  # Puedes ajustar este valor si tienes el TP usado
-                    # NO guardar historial aquí - Se guardará en evaluar_cierre_operacion_hyperliquid
-                    if pnl_real is not None:
-                        return order, True, pnl_real
-                    else:
-                        return order, True
-                else:
-                    print(f"[{symbol}] Posición sigue abierta en intento 1: {quantity}")
-        except Exception as e1:
-            print(f"[{symbol}] Error en método 1: {e1}")
-
-        # MÉTODO 2: Intentar con exchange.market_close si está disponible
-        try:
-            is_buy = side.lower() == "buy"
-            order = client.exchange.market_close(symbol, is_buy, quantity)
-            if order:
-                print(f"[{symbol}] Orden de cierre enviada (método 2): {order}")
-                time.sleep(3)
-                if verificar_posicion_cerrada(symbol):
-                    # Activar cooldown tras cierre exitoso
-                    last_trade_time = datetime.now()
-                    print(f"[{symbol}] Cooldown activado tras cierre exitoso")
-                    print(f"[{symbol}] ✓ Posición cerrada exitosamente (método 2)")
-                    precio_actual = obtener_precio_hyperliquid(symbol) or entryPrice
-                    tp = None
-                    # NO guardar historial aquí - Se guardará en evaluar_cierre_operacion_hyperliquid
-                    if pnl_real is not None:
-                        return order, True, pnl_real
-                    else:
-                        return order, True
-                else:
-                    print(f"[{symbol}] Posición sigue abierta después de método 2")
-        except Exception as e2:
-            print(f"[{symbol}] Error en método 2: {e2}")
-
-        # MÉTODO 3: Intentar cerrando por lotes pequeños
-        try:
-            print(f"[{symbol}] Intentando cerrar en lotes pequeños...")
-            is_buy = side.lower() == "buy"
-            parte = quantity / 5.0
-            for i in range(5):
-                try:
-                    cantidad_parte = parte
-                    if i == 4:  # Último lote, asegurar que cierre todo
-                        posicion_actual = obtener_posicion_actual(symbol)
-                        if posicion_actual is not None and abs(posicion_actual) > 0.0001:
-                            cantidad_parte = abs(posicion_actual)
-                        else:
-                            break
-                    print(f"[{symbol}] Cerrando lote {i+1}/5: {cantidad_parte}")
-                    order = client.exchange.market_close(symbol, is_buy, cantidad_parte)
-                    print(f"[{symbol}] Respuesta lote {i+1}: {order}")
-                    time.sleep(1.5)
-                except Exception as e:
-                    print(f"[{symbol}] Error en lote {i+1}: {e}")
-
-            if verificar_posicion_cerrada(symbol):
-                # Activar cooldown tras cierre exitoso
-                last_trade_time = datetime.now()
-                print(f"[{symbol}] Cooldown activado tras cierre exitoso")
-                print(f"[{symbol}] ✓ Posición cerrada exitosamente (método 3 - lotes)")
-                precio_actual = obtener_precio_hyperliquid(symbol) or entryPrice
-                tp = None
-                # NO guardar historial aquí - Se guardará en evaluar_cierre_operacion_hyperliquid
-                order_info = {"status": "ok", "method": "batch_close"}
-                if pnl_real is not None:
-                    return order_info, True, pnl_real
-                else:
-                    return order_info, True
-        except Exception as e3:
-            print(f"[{symbol}] Error en método 3: {e3}")
+        # Cierre con órdenes IOC reduce-only: cada respuesta indica cuánto se ha llenado,
+        # así que se reintenta solo el resto, sin esperas fijas ni releer todas las posiciones
+        is_buy = side.lower() == "buy"
+        reglas = metadatos.reglas(symbol)
+        tamano_minimo = reglas.tamano_minimo if reglas else 0.0001
+        pendiente = quantity
+        order = None
+        for intento in range(1, CIERRE_REINTENTOS + 1):
+            try:
+                resultado = client.cerrar_con_confirmacion(symbol, pendiente, is_buy,
+                                                           precio_referencia=obtener_precio_hyperliquid(symbol))
+                order = resultado["respuesta"] or order
+                pendiente = max(pendiente - resultado["llenado"], 0.0)
+                if reglas:
+                    pendiente = round(pendiente, reglas.sz_decimals)
+                print(f"[{symbol}] Cierre intento {intento}: llenado {resultado['llenado']} @ {resultado['avg_px']}, "
+                      f"pendiente {pendiente}" + (f" ({resultado['error']})" if resultado["error"] else ""))
+                if resultado["cerrado"] or pendiente < tamano_minimo:
+                    break
+                if resultado["error"] and verificar_posicion_cerrada(symbol):
+                    # p.ej. el TP se ejecutó antes: la orden reduce-only ya no tiene nada que cerrar
+                    pendiente = 0.0
+                    break
+            except Exception as e:
+                print(f"[{symbol}] Error en intento de cierre {intento}: {e}")
+                logging.error(f"Error en intento de cierre {intento} para {symbol}: {e}", exc_info=True)
+        
+        if pendiente < tamano_minimo:
+            # Activar cooldown tras cierre exitoso
+            last_trade_time = datetime.now()
+            print(f"[{symbol}] Cooldown activado tras cierre exitoso")
+            print(f"[{symbol}] ✓ Posición cerrada exitosamente")
+            # NO guardar historial aquí - Se guardará en evaluar_cierre_operacion_hyperliquid
+            order = order or {"status": "ok", "method": "ioc_reduce_only"}
+            if pnl_real is not None:
+                return order, True, pnl_real
+            else:
+                return order, True
 
         # Si llegamos aquí, todos los métodos fallaron
         print(f"[{symbol}] ❌ No se pudo cerrar la posición tras múltiples intentos")
@@ -1260,11 +1151,11 @@ def evaluar_cierre_operacion_hyperliquid(pos, precio_actual, niveles_atr):
                 )
                 
                 # Guardar el historial para análisis posterior
-                tp_orders = cargar_ordenes_tp()
+                orden_tp = estado.orden_tp(symbol) or {}
                 tiempo_abierto = "N/A"
-                if symbol in tp_orders and "tiempo_apertura" in tp_orders[symbol]:
+                if "tiempo_apertura" in orden_tp:
                     try:
-                        tiempo_apertura = datetime.fromisoformat(tp_orders[symbol]["tiempo_apertura"])
+                        tiempo_apertura = datetime.fromisoformat(orden_tp["tiempo_apertura"])
                         tiempo_abierto = str(datetime.now() - tiempo_apertura).split('.')[0]
                     except Exception as e:
                         print(f"[{symbol}] Error calculando tiempo abierto en cierre TP: {e}")
@@ -1286,7 +1177,7 @@ def evaluar_cierre_operacion_hyperliquid(pos, precio_actual, niveles_atr):
                 # Eliminar el TP del archivo SOLO SI el cierre está confirmado
                 if symbol in niveles_atr:
                     del niveles_atr[symbol]
-                    guardar_niveles_atr(niveles_atr)
+                    borrar_nivel_atr(symbol)
                 
                 return True
                 
@@ -1297,8 +1188,11 @@ def evaluar_cierre_operacion_hyperliquid(pos, precio_actual, niveles_atr):
     
     return False
 
-def obtener_precio_hyperliquid(symbol):
+def obtener_precio_hyperliquid(symbol, mercado=None):
     try:
+        # Con snapshot de ciclo el precio sale de allMids/feed o del libro ya descargado
+        if mercado is not None:
+            return mercado.precio(symbol)
         ticker = retry_api_call(client.get_price, symbol=symbol)
         if ticker and 'mid' in ticker:
             return float(ticker['mid'])
@@ -1310,13 +1204,38 @@ def obtener_precio_hyperliquid(symbol):
         logging.error(f"Error al obtener precio para {symbol}: {e}", exc_info=True)
         return None
 
-def abrir_posicion_con_tp(simbolo, accion, entry_price, atr):
+def validar_entrada(simbolo, mercado=None):
+    """
+    Filtros previos a abrir una señal: precio disponible, volatilidad y spread
+
+    Returns:
+        bool: True si la señal puede abrirse
+    """
+    try:
+        # --- Detección de alta volatilidad ---
+        if detectar_volatilidad_extrema(almacen_velas.obtener_dataframe(simbolo)):
+            print(f"🚨 Alta volatilidad detectada en {simbolo}: se suspende apertura de trades en este ciclo.")
+            return False
+
+        if obtener_precio_hyperliquid(simbolo, mercado) is None:
+            return False
+
+        # --- Filtro de spread ---
+        if not spread_aceptable(simbolo, mercado):
+            print(f"[{simbolo}] Spread no aceptable. Se descarta trade.")
+            return False
+        return True
+    except Exception as e:
+        logging.error(f"Error validando entrada para {simbolo}: {e}", exc_info=True)
+        return False
+
+def abrir_posicion_con_tp(simbolo, accion, entry_price, atr, mercado=None):
     """Abre una posición con Take Profit automático en el exchange"""
     if tiene_saldo_suficiente(MARGIN_PER_TRADE):
         monto_usdt = LEVERAGE * MARGIN_PER_TRADE
         print(f"[{simbolo}] Calculando tamaño para monto: {monto_usdt} USDT (LEVERAGE={LEVERAGE}, MARGIN_PER_TRADE={MARGIN_PER_TRADE})")
         
-        cantidad_valida = calcular_cantidad_valida(simbolo, monto_usdt)
+        cantidad_valida = calcular_cantidad_valida(simbolo, monto_usdt, mercado)
         print(f"[{simbolo}] Tamaño calculado final: {cantidad_valida}")
         
         if cantidad_valida:
@@ -1326,7 +1245,8 @@ def abrir_posicion_con_tp(simbolo, accion, entry_price, atr):
             print(f"[{simbolo}] Ejecutando orden con tamaño: {cantidad_valida}, precio: {entry_price}, TP: {tp}")
             
             # Ejecutar la orden con TP incluido
-            orden_principal, orden_tp = ejecutar_orden_hyperliquid(simbolo, accion, cantidad_valida, tp)
+            orden_principal, orden_tp = ejecutar_orden_hyperliquid(simbolo, accion, cantidad_valida, tp,
+                                                                   obtener_precio_hyperliquid(simbolo, mercado))
             
             if orden_principal:
                 # Intentar extraer el tamaño real ejecutado
@@ -1342,9 +1262,7 @@ def abrir_posicion_con_tp(simbolo, accion, entry_price, atr):
                 print(f"[{simbolo}] Trade ejecutado ({accion}) | ATR: {atr:.4f} | TP: {tp:.4f}")
                 
                 # Guardar niveles solo como respaldo
-                niveles_atr = cargar_niveles_atr()
-                niveles_atr[simbolo] = {"tp_fijo": tp}
-                guardar_niveles_atr(niveles_atr)
+                estado.guardar_nivel(simbolo, tp)
                 
                 # Enviar notificación
                 icono_abierto = "🔵"
@@ -1417,11 +1335,11 @@ def cerrar_posiciones_huerfanas():
                         direccion = "BUY" if positionAmt > 0 else "SELL"
                         
                         # Guardar el historial para análisis posterior
-                        tp_orders = cargar_ordenes_tp()
+                        orden_tp = estado.orden_tp(symbol) or {}
                         tiempo_abierto = "N/A"
-                        if symbol in tp_orders and "tiempo_apertura" in tp_orders[symbol]:
+                        if "tiempo_apertura" in orden_tp:
                             try:
-                                tiempo_apertura = datetime.fromisoformat(tp_orders[symbol]["tiempo_apertura"])
+                                tiempo_apertura = datetime.fromisoformat(orden_tp["tiempo_apertura"])
                                 tiempo_abierto = str(datetime.now() - tiempo_apertura).split('.')[0]
                             except Exception as e:
                                 print(f"[{symbol}] Error calculando tiempo abierto en cierre huérfana: {e}")
@@ -1443,8 +1361,333 @@ def cerrar_posiciones_huerfanas():
         logging.error(f"Error verificando posiciones huérfanas: {e}", exc_info=True)
 
 last_trade_time = None
+simbolos = []
+tiempo_inicio = datetime.now()
+
+planificador = Planificador()
+
+
+def al_recibir_mids(mids):
+    """
+    Oyente de allMids (hilo del WebSocket): cuando un candidato cruza su umbral de
+    ruptura se adelanta la evaluación de ese símbolo sin esperar al cierre de vela.
+    Cada símbolo dispara como mucho una vez por vela, aunque el mid siga más allá
+    del umbral en los ticks siguientes.
+    """
+    vela_actual = int(time.time() // INTERVALO_SEGUNDOS["1m"]) * INTERVALO_SEGUNDOS["1m"] * 1000
+    hay_rupturas = False
+    with lock_disparo:
+        for symbol, (umbral_long, umbral_short) in umbrales_disparo.items():
+            mid = mids.get(symbol)
+            if mid is None or not (mid > umbral_long or mid < umbral_short):
+                continue
+            if disparos_vela.get(symbol) == vela_actual:
+                continue
+            disparos_vela[symbol] = vela_actual
+            rupturas_pendientes[symbol] = mid
+            hay_rupturas = True
+    if hay_rupturas:
+        planificador.disparar("rupturas")
+
+
+def al_cerrar_vela(symbol, interval):
+    """
+    Oyente de cierre de AlmacenVelas: al empezar una vela nueva los umbrales del
+    escaneo (calculados sobre la vela que acaba de cerrar) ya no valen. Se recalculan
+    para la vela en formación con los indicadores incrementales: máximo/mínimo de las
+    5 velas cerradas anteriores +/- el multiplicador de ruptura por ATR.
+    """
+    if interval != '1m':
+        return
+    with lock_disparo:
+        if symbol not in umbrales_disparo:
+            return   # Solo los candidatos del último escaneo (sin posición abierta)
+    valores = almacen_velas.indicadores(symbol, interval, MULTIPLICADOR_VOL_POR_SIMBOLO.get(symbol, 1.0))
+    with lock_disparo:
+        if symbol not in umbrales_disparo:
+            return
+        if valores is None or valores['n'] < MIN_VELAS or math.isnan(valores['atr']) or math.isnan(valores['prev_max']):
+            # Sin umbral fiable para la vela nueva mejor no disparar que hacerlo con el anterior
+            del umbrales_disparo[symbol]
+            return
+        mult = BREAKOUT_ATR_MULT_POR_SIMBOLO.get(symbol, 0.1)
+        umbrales_disparo[symbol] = (valores['prev_max'] + mult * valores['atr'],
+                                    valores['prev_min'] - mult * valores['atr'])
+
+
+def activar_streaming(simbolos_activos):
+    client.iniciar_streaming(simbolos_activos)
+    if client.feed is not None:
+        client.feed.agregar_oyente_mids(al_recibir_mids)
+        cliente_async.cliente.feed = client.feed
+        almacen_velas.agregar_oyente_cierre(al_cerrar_vela)
+
+
+def tarea_saldo():
+    print(f"\nTiempo Transcurrido: {datetime.now() - tiempo_inicio}")
+    try:
+        account = retry_api_call(client.get_account)
+        if account:
+            # Intentar obtener el saldo desde diferentes rutas posibles en la respuesta
+            saldo_usdt = None
+            if "equity" in account:
+                saldo_usdt = float(account["equity"])
+            elif "marginSummary" in account and "accountValue" in account["marginSummary"]:
+                saldo_usdt = float(account["marginSummary"]["accountValue"])
+
+            if saldo_usdt is not None:
+                print(f"Saldo actual: {saldo_usdt:.4f} USDT")
+                # Solo se registran los cambios; ultimo_saldo.txt (lo lee el panel) se deriva del diario
+                if saldo_usdt != diario.estado["saldo"]:
+                    diario.registrar("saldo", saldo=saldo_usdt)
+            else:
+                print("❌ No se pudo extraer el saldo.")
+    except Exception as e:
+        print(f"❌ Error obteniendo saldo: {e}")
+
+
+def tarea_historial():
+    # Eventos nuevos del diario -> Parquet particionado por día (lo lee el panel)
+    try:
+        filas = historial_columnar.sincronizar(diario)
+        if filas and DEBUG:
+            print(f"[HISTORIAL] {filas} filas añadidas al historial Parquet")
+    except Exception as e:
+        print(f"Error sincronizando el historial Parquet: {e}")
+        logging.error(f"Error sincronizando el historial Parquet: {e}", exc_info=True)
+
+
+def tarea_compactar_historial():
+    try:
+        compactadas = historial_columnar.compactar()
+        if compactadas:
+            print(f"[HISTORIAL] {compactadas} particiones compactadas")
+    except Exception as e:
+        print(f"Error compactando el historial Parquet: {e}")
+        logging.error(f"Error compactando el historial Parquet: {e}", exc_info=True)
+
+
+def tarea_estadisticas_http():
+    for host, datos in obtener_transporte().estadisticas().items():
+        print(f"[HTTP] {host}: {datos['peticiones']} peticiones | {datos['conexiones_nuevas']} conexiones nuevas | "
+              f"{datos['reutilizadas']} reutilizadas | latencia media {datos['latencia_media_ms']:.1f} ms")
+    for ruta, datos in obtener_transporte().latencias_por_ruta().items():
+        print(f"[HTTP] {ruta}: latencia media {datos['latencia_media_ms']:.1f} ms | máx {datos['latencia_max_ms']:.1f} ms")
+    for nombre, datos in planificador.estadisticas().items():
+        if datos['ejecuciones']:
+            print(f"[CICLO] {nombre}: {datos['ejecuciones']} ejecuciones | media {datos['media_ms']:.0f} ms | "
+                  f"máx {datos['max_ms']:.0f} ms")
+
+
+def tarea_reevaluar_simbolos():
+    global simbolos
+    # Reevaluar los símbolos disponibles periódicamente (pero sin enviar mensajes)
+    if verificar_tiempo_para_reevaluar():
+        print("Reevaluando símbolos disponibles...")
+        simbolos_actualizados = obtener_simbolos_disponibles()
+        if simbolos_actualizados:
+            simbolos = simbolos_actualizados
+            activar_streaming(simbolos)
+            print(f"Lista de símbolos actualizada: {simbolos}")
+
+
+def tarea_mantenimiento_tp():
+    # Un único user_state por pasada: el resto de consultas reutilizan el snapshot
+    client.invalidar_cuenta()
+
+    # Verificar órdenes TP pendientes
+    verificar_ordenes_tp_pendientes()
+
+    posiciones = obtener_posiciones_hyperliquid()
+    niveles_atr = cargar_niveles_atr()
+    mercado = client.snapshot_mercado()
+
+    # Imprimir símbolos con posiciones abiertas para depuración
+    simbolos_abiertos = [pos.get('asset', '').upper() for pos in posiciones]
+    print(f"Símbolos con posiciones abiertas: {simbolos_abiertos}")
+
+    print(f"Posiciones abiertas en Hyperliquid ({len(posiciones)}):")
+    for pos in posiciones:
+        symbol = pos['asset']
+        positionAmt = pos['position']
+        entryPrice = pos['entryPrice']
+        pnl = pos.get('unrealizedPnl', 0)
+        print(f"  {symbol} | Cantidad: {positionAmt} | Precio Entrada: {entryPrice} | PnL No Realizado: {pnl}")
+
+    # --- Evaluación de cierre (respaldo local por si falla el TP del exchange) ---
+    for pos in posiciones:
+        symbol = pos['asset']
+        precio_actual = obtener_precio_hyperliquid(symbol, mercado)
+        if precio_actual is None:
+            continue
+        if evaluar_cierre_operacion_hyperliquid(pos, precio_actual, niveles_atr):
+            if symbol in niveles_atr:
+                del niveles_atr[symbol]
+                borrar_nivel_atr(symbol)
+
+
+def tarea_dca():
+    evaluar_dca(obtener_posiciones_hyperliquid(), client.snapshot_mercado())
+
+
+def tarea_huerfanas():
+    # Verificar posiciones huérfanas (sin TP registrado)
+    print("Verificando posiciones huérfanas...")
+    cerrar_posiciones_huerfanas()
+
+
+def en_cooldown():
+    """True (y lo indica) si aún no ha pasado COOLDOWN_MINUTES desde el último trade abierto"""
+    now = datetime.now()
+    if last_trade_time and (now - last_trade_time) < timedelta(minutes=COOLDOWN_MINUTES):
+        restante = timedelta(minutes=COOLDOWN_MINUTES) - (now - last_trade_time)
+        print(f"En cooldown tras última operación. Esperando {restante} antes de poder abrir otro trade.")
+        return True
+    return False
+
+
+def abrir_mejor_senal(resultados):
+    """
+    Filtra las señales de 'resultados' (ver evaluar_velas_simbolos) y abre como mucho
+    una posición, empezando por la ruptura más fuerte
+    """
+    global last_trade_time
+
+    senales = []
+    for simbolo, accion, razon, atr, entry_price, fuerza in resultados:
+        if not accion or atr is None:
+            print(f"[{simbolo}] No se abre trade. Razón: {razon}")
+            continue
+        senales.append((simbolo, accion, atr, entry_price, fuerza))
+    if not senales:
+        return
+
+    # Filtros de todas las señales en paralelo; se intenta primero la ruptura más fuerte.
+    # Precio y libro de cada símbolo se consultan una sola vez en todo el ciclo.
+    mercado = client.snapshot_mercado()
+    validas = list(pool_escaneo.map(lambda senal: validar_entrada(senal[0], mercado), senales))
+    aptas = sorted((senal for senal, valida in zip(senales, validas) if valida), key=lambda senal: senal[4], reverse=True)
+
+    for simbolo, accion, atr, entry_price, fuerza in aptas:
+        if abrir_posicion_con_tp(simbolo, accion, entry_price, atr, mercado):
+            resumen_diario["trades_abiertos"] += 1
+            last_trade_time = datetime.now()
+            break
+
+
+def tarea_entradas():
+    # --- Cooldown tras un trade abierto ---
+    if en_cooldown():
+        return
+
+    posiciones = obtener_posiciones_hyperliquid()
+
+    # --- Solo se permite una apertura nueva por ciclo ---
+    candidatos = []
+    for simbolo in simbolos:
+        # Usar la nueva función para verificar posiciones existentes
+        ya_abierta = verificar_posicion_existente(simbolo, posiciones)
+        if ya_abierta:
+            print(f"Ya existe una posición abierta para {simbolo}. Se omite.")
+            continue
+        candidatos.append(simbolo)
+
+    # Señales de todos los candidatos en una sola pasada vectorizada
+    print(f"\nEvaluando condiciones microestructura para {len(candidatos)} símbolos...")
+    abrir_mejor_senal(evaluar_entradas_lote(candidatos))
+
+
+def tarea_umbrales(interval='1m'):
+    """
+    Justo después de cada cierre de vela: pone al día las velas de los candidatos con
+    umbral para que AlmacenVelas vea el cierre y al_cerrar_vela los recalcule
+    """
+    with lock_disparo:
+        candidatos = list(umbrales_disparo)
+    if not candidatos:
+        return
+    try:
+        cliente_async.ejecutar(almacen_velas.actualizar_lote(cliente_async.cliente, candidatos, interval))
+    except Exception as e:
+        logging.error(f"Error actualizando velas para los umbrales de ruptura: {e}", exc_info=True)
+
+
+def tarea_rupturas(interval='1m', limit=100):
+    """
+    Evalúa solo los símbolos cuyo mid cruzó su umbral de ruptura (ver al_recibir_mids)
+    sobre las velas en memoria, con la vela en formación actualizada con ese mid.
+
+    Si la vela en formación aún no está en el almacén (cambió la vela desde el último
+    escaneo) se descarga solo lo que falta de ese símbolo: el volumen de la vela no
+    llega por allMids y sin él no hay spike de volumen que evaluar.
+    """
+    with lock_disparo:
+        pendientes = dict(rupturas_pendientes)
+        rupturas_pendientes.clear()
+    if not pendientes or en_cooldown():
+        return
+
+    posiciones = obtener_posiciones_hyperliquid()
+    paso_ms = INTERVALO_SEGUNDOS[interval] * 1000
+    vela_actual = int(time.time() * 1000) // paso_ms * paso_ms
+    simbolos_lote = []
+    matrices = []
+    for simbolo, mid in pendientes.items():
+        if verificar_posicion_existente(simbolo, posiciones):
+            continue
+        velas = almacen_velas.obtener_array(simbolo, interval, limit)
+        if velas is None or velas[-1, 0] < vela_actual:
+            if not almacen_velas.actualizar(simbolo, interval):
+                continue
+            velas = almacen_velas.obtener_array(simbolo, interval, limit)
+        if velas is None or len(velas) < MIN_VELAS:
+            continue
+        # obtener_array devuelve una copia: el mid no modifica el almacén
+        velas[-1, 2] = max(velas[-1, 2], mid)
+        velas[-1, 3] = min(velas[-1, 3], mid)
+        velas[-1, 4] = mid
+        simbolos_lote.append(simbolo)
+        matrices.append(velas)
+
+    if simbolos_lote:
+        print(f"\nRuptura detectada por WebSocket en {', '.join(simbolos_lote)}: evaluando...")
+        resultados, _ = evaluar_velas_simbolos(simbolos_lote, matrices)
+        abrir_mejor_senal(resultados)
+
+def al_recibir_senal(signum, _frame):
+    """
+    SIGTERM/SIGINT (kill, systemd/docker stop, Ctrl+C): se deja terminar la tarea en
+    curso y se sale del bucle del planificador para volcar el estado. Una segunda
+    señal sale de inmediato (el volcado final se hace igualmente en el finally).
+    """
+    global senales_recibidas
+    senales_recibidas += 1
+    print(f"Señal {signal.Signals(signum).name} recibida: deteniendo el bot...")
+    if senales_recibidas > 1:
+        raise SystemExit(128 + signum)
+    planificador.detener()
+
+
+def cerrar_bot():
+    """Vuelca a disco el estado en memoria y cierra el diario (con su snapshot)"""
+    try:
+        estado.detener()
+    except Exception as e:
+        logging.error(f"Error volcando el estado al salir: {e}", exc_info=True)
+    try:
+        diario.cerrar()
+    except Exception as e:
+        logging.error(f"Error cerrando el diario al salir: {e}", exc_info=True)
+    if client.feed is not None:
+        client.feed.detener()
+
+
+senales_recibidas = 0
 
 if __name__ == "__main__":
+    # Sin manejador, SIGTERM mata el proceso sin pasar por atexit ni por el volcado del estado
+    signal.signal(signal.SIGTERM, al_recibir_senal)
+    signal.signal(signal.SIGINT, al_recibir_senal)
     try:
         # Primero verificamos los símbolos disponibles
         simbolos = obtener_simbolos_disponibles()
@@ -1453,140 +1696,46 @@ if __name__ == "__main__":
             enviar_telegram("⚠️ No se encontraron símbolos disponibles para operar. El bot se detendrá.", tipo="error")
             exit(1)
         
+        # Mantener en memoria el libro de cada símbolo vía WebSocket (con REST de respaldo)
+        activar_streaming(simbolos)
+        metadatos.iniciar_refresco()
+        
         # Ahora enviamos un solo mensaje de inicio con toda la información
-        enviar_telegram(f"🚀 Bot arrancado correctamente y en ejecución.\n\n🔍 Símbolos disponibles para operar ({len(simbolos)}/{20}): {', '.join(simbolos)}", tipo="info")
+        enviar_telegram(f"🚀 Bot arrancado correctamente y en ejecución.\n\n🔍 Símbolos disponibles para operar ({len(simbolos)}/{MAX_SIMBOLOS or 'todos'}): {', '.join(simbolos)}", tipo="info")
             
-        intervalo_segundos = 10  # Aumentado a 10 segundos para reducir carga en API
         tiempo_inicio = datetime.now()
-        ultima_reevaluacion = datetime.now()
-        ultimo_chequeo_huerfanas = datetime.now()
 
         print("Iniciando bot de scalping microestructura v2 con TP en exchange (Hyperliquid Testnet)...")
         print(f"Configuración: Apalancamiento={LEVERAGE}x | Margen por operación={MARGIN_PER_TRADE} USDT")
         print(f"TP: {ATR_TP_MULT}xATR (máx {MAX_TP_PCT*100:.1f}% sobre entrada) | SL: NO")
 
-        while True:
-            print(f"\nTiempo Transcurrido: {datetime.now() - tiempo_inicio}")
-            
-            # Añadir esta sección para obtener y registrar el saldo
-            try:
-                account = retry_api_call(client.get_account)
-                if account:
-                    # Intentar obtener el saldo desde diferentes rutas posibles en la respuesta
-                    saldo_usdt = None
-                    if "equity" in account:
-                        saldo_usdt = float(account["equity"])
-                    elif "marginSummary" in account and "accountValue" in account["marginSummary"]:
-                        saldo_usdt = float(account["marginSummary"]["accountValue"])
-                    
-                    if saldo_usdt is not None:
-                        print(f"Saldo actual: {saldo_usdt:.4f} USDT")
-                        # Registra en archivo para que el panel lo pueda leer
-                        with open("ultimo_saldo.txt", "w") as f:
-                            f.write(f"{saldo_usdt}")
-                    else:
-                        print("❌ No se pudo extraer el saldo.")
-            except Exception as e:
-                print(f"❌ Error obteniendo saldo: {e}")
-            
-            # Verificar órdenes TP pendientes
-            verificar_ordenes_tp_pendientes()
-            
-            # Reevaluar los símbolos disponibles periódicamente (pero sin enviar mensajes)
-            if verificar_tiempo_para_reevaluar():
-                print("Reevaluando símbolos disponibles...")
-                simbolos_actualizados = obtener_simbolos_disponibles()
-                if simbolos_actualizados:
-                    simbolos = simbolos_actualizados
-                    print(f"Lista de símbolos actualizada: {simbolos}")
-
-            posiciones = obtener_posiciones_hyperliquid()
-            niveles_atr = cargar_niveles_atr()
-
-            # Imprimir símbolos con posiciones abiertas para depuración
-            simbolos_abiertos = [pos.get('asset', '').upper() for pos in posiciones]
-            print(f"Símbolos con posiciones abiertas: {simbolos_abiertos}")
-
-            print(f"Posiciones abiertas en Hyperliquid ({len(posiciones)}):")
-            for pos in posiciones:
-                symbol = pos['asset']
-                positionAmt = pos['position']
-                entryPrice = pos['entryPrice']
-                pnl = pos.get('unrealizedPnl', 0)
-                print(f"  {symbol} | Cantidad: {positionAmt} | Precio Entrada: {entryPrice} | PnL No Realizado: {pnl}")
-
-            # --- Evaluación de cierre (respaldo local por si falla el TP del exchange) ---
-            for pos in posiciones:
-                symbol = pos['asset']
-                precio_actual = obtener_precio_hyperliquid(symbol)
-                if precio_actual is None:
-                    continue
-                if evaluar_cierre_operacion_hyperliquid(pos, precio_actual, niveles_atr):
-                    if symbol in niveles_atr:
-                        del niveles_atr[symbol]
-                        guardar_niveles_atr(niveles_atr)
-            # NUEVO: Evaluar posiciones para DCA
-            evaluar_dca(posiciones)
-            
-            # Verificar posiciones huérfanas (sin TP registrado) cada hora
-            now = datetime.now()
-            if (now - ultimo_chequeo_huerfanas).total_seconds() > 3600:  # 3600 segundos = 1 hora
-                print("Verificando posiciones huérfanas...")
-                cerrar_posiciones_huerfanas()
-                ultimo_chequeo_huerfanas = now
-            
-            # --- Espera cooldown tras un trade abierto ---
-            if last_trade_time and (now - last_trade_time) < timedelta(minutes=COOLDOWN_MINUTES):
-                restante = timedelta(minutes=COOLDOWN_MINUTES) - (now - last_trade_time)
-                print(f"En cooldown tras última operación. Esperando {restante} antes de poder abrir otro trade.")
-                time.sleep(intervalo_segundos)
-                continue
-
-            # --- Solo se permite una apertura nueva por ciclo ---
-            apertura_realizada = False
-            for simbolo in simbolos:
-                # Usar la nueva función para verificar posiciones existentes
-                ya_abierta = verificar_posicion_existente(simbolo, posiciones)
-                if ya_abierta:
-                    print(f"Ya existe una posición abierta para {simbolo}. Se omite.")
-                    continue
-                
-                if apertura_realizada:
-                    continue
-
-                print(f"\nEvaluando condiciones microestructura para {simbolo}...")
-                datos = obtener_datos_historicos(simbolo)
-                if datos is None:
-                    continue
-
-                precio_actual = obtener_precio_hyperliquid(simbolo)
-                if precio_actual is None:
-                    continue
-
-                # --- Detección de alta volatilidad ---
-                if detectar_volatilidad_extrema(datos):
-                    msg = f"🚨 Alta volatilidad detectada en {simbolo}: se suspende apertura de trades en este ciclo."
-                    print(msg)
-                    continue
-
-                # --- Filtro de spread ---
-                if not spread_aceptable(simbolo):
-                    print(f"[{simbolo}] Spread no aceptable. Se descarta trade.")
-                    continue
-
-                accion, razon, atr, entry_price = aplicar_condiciones_microestructura_v2(datos, precio_actual, simbolo)
-
-                if accion and atr is not None:
-                    if abrir_posicion_con_tp(simbolo, accion, entry_price, atr):
-                        resumen_diario["trades_abiertos"] += 1
-                        apertura_realizada = True
-                        last_trade_time = datetime.now()
-                        break
-                else:
-                    print(f"[{simbolo}] No se abre trade. Razón: {razon}")
-
-            print(f"\nEsperando {intervalo_segundos} segundos antes de la próxima evaluación...")
-            time.sleep(intervalo_segundos)
+        # Mantenimiento de posiciones en temporizadores independientes
+        planificador.cada("saldo", SALDO_SEC, tarea_saldo)
+        planificador.cada("mantenimiento_tp", MANTENIMIENTO_TP_SEC, tarea_mantenimiento_tp)
+        planificador.cada("dca", MANTENIMIENTO_DCA_SEC, tarea_dca)
+        planificador.cada("huerfanas", MANTENIMIENTO_HUERFANAS_SEC, tarea_huerfanas, inmediata=False)
+        planificador.cada("estadisticas_http", ESTADISTICAS_HTTP_SEC, tarea_estadisticas_http, inmediata=False)
+        planificador.cada("reevaluar_simbolos", REEVALUACION_CHEQUEO_SEC, tarea_reevaluar_simbolos, inmediata=False)
+        if historial_columnar is not None:
+            planificador.cada("historial", HISTORIAL_SINCRONIZAR_SEC, tarea_historial)
+            planificador.cada("compactar_historial", HISTORIAL_COMPACTAR_SEC, tarea_compactar_historial,
+                              inmediata=False)
+
+        # Entradas: todos los candidatos justo antes de cada cierre de vela de 1m
+        planificador.en_cierre_vela("entradas", INTERVALO_SEGUNDOS["1m"], tarea_entradas,
+                                    desfase=-ENTRADAS_ADELANTO_CIERRE_SEC,
+                                    intervalo_minimo=ENTRADAS_INTERVALO_MIN_SEC)
+        planificador.disparar("entradas")
+        # Rupturas: solo por disparo desde el WebSocket (la ejecución periódica sin pendientes no hace nada)
+        planificador.cada("rupturas", INTERVALO_SEGUNDOS["1m"], tarea_rupturas, inmediata=False)
+        if client.feed is not None:
+            # Umbrales de la vela nueva en cuanto cierra la anterior (los vigila al_recibir_mids)
+            planificador.en_cierre_vela("umbrales", INTERVALO_SEGUNDOS["1m"], tarea_umbrales,
+                                        desfase=UMBRALES_RETRASO_CIERRE_SEC)
+
+        planificador.ejecutar()
     except Exception as e:
         logging.error(f"Error crítico en el bucle principal: {e}", exc_info=True)
         enviar_telegram(f"❗️ Error crítico en el bucle principal: {e}", tipo="error")
+    finally:
+        cerrar_bot()
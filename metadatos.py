@@ -0,0 +1,154 @@
+# metadatos.py
+import json
+import math
+import os
+import threading
+import time
+import logging
+
+ARCHIVO_METADATOS = "metadatos.json"
+
+# Reglas de Hyperliquid para perpetuos: el precio admite como mucho 5 cifras
+# significativas y (6 - szDecimals) decimales; los precios enteros siempre son válidos
+MAX_DECIMALES_PRECIO = 6
+MAX_CIFRAS_SIGNIFICATIVAS = 5
+
+
+class ReglasActivo:
+    """Reglas de redondeo de tamaño y precio de un activo, precalculadas a partir de szDecimals"""
+
+    def __init__(self, symbol, sz_decimals, max_leverage=None):
+        self.symbol = symbol
+        self.sz_decimals = sz_decimals
+        self.max_leverage = max_leverage
+        self.decimales_precio = max(MAX_DECIMALES_PRECIO - sz_decimals, 0)
+        self.tamano_minimo = 10 ** -sz_decimals
+
+    def redondear_tamano(self, tamano):
+        """Redondea el tamaño a szDecimals (nunca por debajo del mínimo negociable)"""
+        return max(round(tamano, self.sz_decimals), self.tamano_minimo)
+
+    def redondear_precio(self, precio):
+        """Redondea el precio a 5 cifras significativas y a los decimales permitidos"""
+        if precio <= 0:
+            return precio
+        if precio >= 10 ** MAX_CIFRAS_SIGNIFICATIVAS:
+            return float(round(precio))
+        decimales_significativos = MAX_CIFRAS_SIGNIFICATIVAS - 1 - math.floor(math.log10(precio))
+        return round(precio, min(decimales_significativos, self.decimales_precio))
+
+
+class MetadatosExchange:
+    """
+    Metadatos de todos los perpetuos (szDecimals, apalancamiento máximo) con las
+    reglas de redondeo de cada activo.
+
+    Se cargan del disco si la copia de 'metadatos.json' es reciente (o de la API si
+    no hay copia o está caducada), se refrescan en segundo plano y también cuando se
+    pide un símbolo que no está en caché (p.ej. un listado nuevo del universo).
+    """
+
+    def __init__(self, client, ruta=ARCHIVO_METADATOS, intervalo_refresco=3600, espera_faltante=60):
+        self.client = client
+        self.ruta = ruta
+        self.intervalo_refresco = intervalo_refresco
+        self.espera_faltante = espera_faltante
+        self._reglas = {}
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._ultimo_refresco_faltante = 0.0
+
+    def cargar(self):
+        """Carga los metadatos guardados; si no existen o tienen más de 'intervalo_refresco' segundos los descarga"""
+        antiguedad = None
+        if os.path.exists(self.ruta):
+            try:
+                with open(self.ruta, "r") as f:
+                    datos = json.load(f)
+                self._actualizar(datos["activos"])
+                antiguedad = time.time() - datos.get("timestamp", 0)
+            except Exception as e:
+                logging.error(f"Error leyendo {self.ruta}: {e}")
+        if antiguedad is None or antiguedad > self.intervalo_refresco:
+            # Si la descarga falla se sigue con la copia del disco
+            self.refrescar()
+
+    def refrescar(self):
+        """Descarga 'meta' del exchange, actualiza las reglas y las guarda en disco"""
+        try:
+            meta = self.client.get_meta()
+            activos = [{"symbol": a["name"], "sz_decimals": int(a["szDecimals"]),
+                        "max_leverage": a.get("maxLeverage")} for a in meta["universe"]]
+            self._actualizar(activos)
+            self._guardar(activos)
+            return True
+        except Exception as e:
+            print(f"Error actualizando metadatos del exchange: {e}")
+            logging.error(f"Error actualizando metadatos del exchange: {e}", exc_info=True)
+            return False
+
+    def incorporar(self, activos):
+        """
+        Añade o actualiza reglas a partir de activos ya descargados (el universo de
+        metaAndAssetCtxs trae szDecimals y maxLeverage), sin otra llamada a 'meta'
+
+        Args:
+            activos (list): Diccionarios con 'symbol', 'sz_decimals' y 'max_leverage'
+        """
+        with self._lock:
+            por_simbolo = {symbol: {"symbol": symbol, "sz_decimals": r.sz_decimals, "max_leverage": r.max_leverage}
+                           for symbol, r in self._reglas.items()}
+            for a in activos:
+                por_simbolo[a["symbol"]] = {"symbol": a["symbol"], "sz_decimals": int(a["sz_decimals"]),
+                                            "max_leverage": a.get("max_leverage")}
+            todos = list(por_simbolo.values())
+            self._actualizar(todos)
+        try:
+            self._guardar(todos)
+        except Exception as e:
+            logging.error(f"Error guardando {self.ruta}: {e}")
+
+    def _guardar(self, activos):
+        with open(self.ruta, "w") as f:
+            json.dump({"timestamp": time.time(), "activos": activos}, f, indent=2)
+
+    def _actualizar(self, activos):
+        # Se sustituye el diccionario completo: los lectores nunca ven un estado a medias
+        self._reglas = {a["symbol"]: ReglasActivo(a["symbol"], a["sz_decimals"], a.get("max_leverage"))
+                        for a in activos}
+
+    def iniciar_refresco(self):
+        """Arranca el hilo que refresca los metadatos cada 'intervalo_refresco' segundos"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._hilo = threading.Thread(target=self._bucle_refresco, name="metadatos", daemon=True)
+        self._hilo.start()
+
+    def _bucle_refresco(self):
+        while True:
+            time.sleep(self.intervalo_refresco)
+            self.refrescar()
+
+    def reglas(self, symbol):
+        """
+        ReglasActivo del símbolo, o None si no está listado. Un símbolo que falta en
+        caché provoca un refresco (como mucho uno cada 'espera_faltante' segundos)
+        """
+        reglas = self._reglas.get(symbol)
+        if reglas is not None:
+            return reglas
+        with self._lock:
+            if time.time() - self._ultimo_refresco_faltante < self.espera_faltante:
+                return self._reglas.get(symbol)
+            self._ultimo_refresco_faltante = time.time()
+        print(f"[{symbol}] Sin metadatos en caché: se refrescan del exchange")
+        self.refrescar()
+        return self._reglas.get(symbol)
+
+    def redondear_tamano(self, symbol, tamano):
+        reglas = self.reglas(symbol)
+        return reglas.redondear_tamano(tamano) if reglas else None
+
+    def redondear_precio(self, symbol, precio):
+        reglas = self.reglas(symbol)
+        return reglas.redondear_precio(precio) if reglas else None
@@ -1,5 +1,6 @@
 from secret import TELEGRAM_TOKEN, TELEGRAM_CHAT_ID
-import requests
+from transporte import obtener_transporte
+from grabacion import obtener_sesion
 
 def enviar_telegram(mensaje, tipo="info"):
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
@@ -8,7 +9,13 @@ def enviar_telegram(mensaje, tipo="info"):
         "text": mensaje,
         "parse_mode": "HTML"
     }
+    sesion = obtener_sesion()
+    if sesion is not None and sesion.reproduciendo:
+        # Reproduciendo una sesión grabada: sin mensajes reales
+        print(f"[Telegram] {mensaje}")
+        return
     try:
-        requests.post(url, data=data)
+        # Sesión compartida: sin nuevo handshake TLS por mensaje y con timeout
+        obtener_transporte().post(url, data=data)
     except Exception as e:
         print(f"Error enviando notificación Telegram: {e}")
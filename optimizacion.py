@@ -0,0 +1,208 @@
+# optimizacion.py
+"""
+Búsqueda de parámetros (grid o aleatoria) sobre el backtest, repartida entre todos los núcleos.
+
+Las velas y sus indicadores (que no dependen de los parámetros buscados) se
+calculan y escriben una sola vez en archivos .npy que cada proceso abre como
+memoria mapeada (np.load(mmap_mode='r')): los workers comparten las mismas páginas
+del sistema operativo y cada tarea solo envía su combinación de parámetros.
+
+Parámetros ajustables: los de backtest.PARAMETROS_DEFECTO. 'breakout_mult' y
+'vol_mult' aceptan un número (mismo valor para todos los símbolos) y también se
+pueden fijar por símbolo con claves 'breakout_mult.BTC', 'vol_mult.ETH', etc.
+
+Uso:
+    python optimizacion.py --datos historico_1m.npz --modo grid
+    python optimizacion.py --datos historico_1m.npz --modo random --muestras 500 --metrica win_rate
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import indicadores
+from senales import calcular_senales, vector_parametros
+
+ESPACIO_BUSQUEDA = {
+    "atr_tp_mult": [0.8, 1.0, 1.2, 1.5, 2.0],
+    "max_tp_pct": [0.01, 0.02, 0.03],
+    "dca_max_loss_pct": [0.03, 0.05, 0.08],
+    "dca_size_multiplier": [0.5, 1.0, 1.5],
+    "volatility_umbral": [0.01, 0.015, 0.02],
+    "breakout_mult": [0.05, 0.1, 0.15, 0.2],
+    "vol_mult": [1.0, 1.2, 1.5, 2.0],
+}
+
+ARCHIVO_RESULTADOS = "resultados_optimizacion.csv"
+
+# Memoria máxima por worker para las señales cacheadas por multiplicadores
+CACHE_SENALES_MB = 256
+
+# Estado de cada proceso worker (se rellena en _inicializar_worker)
+_worker = {}
+
+
+def generar_grid(espacio):
+    """Todas las combinaciones del espacio de búsqueda"""
+    claves = list(espacio)
+    return [dict(zip(claves, valores)) for valores in itertools.product(*(espacio[c] for c in claves))]
+
+
+def generar_aleatorias(espacio, muestras, semilla=None):
+    """
+    Combinaciones aleatorias del espacio: una lista se muestrea como valores discretos
+    y una tupla (min, max) como rango continuo uniforme
+    """
+    rng = random.Random(semilla)
+    combinaciones = []
+    for _ in range(muestras):
+        combinacion = {}
+        for clave, valores in espacio.items():
+            if isinstance(valores, tuple):
+                combinacion[clave] = rng.uniform(*valores)
+            else:
+                combinacion[clave] = rng.choice(valores)
+        combinaciones.append(combinacion)
+    return combinaciones
+
+
+def parametros_backtest(combinacion, simbolos):
+    """Traduce una combinación de la búsqueda a parámetros de backtest.ejecutar_backtest"""
+    parametros = {}
+    por_simbolo = {
+        "breakout_mult": dict(backtest.PARAMETROS_DEFECTO["breakout_mult"]),
+        "vol_mult": dict(backtest.PARAMETROS_DEFECTO["vol_mult"]),
+    }
+    for clave, valor in combinacion.items():
+        nombre, _, symbol = clave.partition(".")
+        if nombre in por_simbolo:
+            if symbol:
+                por_simbolo[nombre][symbol] = valor
+            else:
+                por_simbolo[nombre].update({s: valor for s in simbolos})
+        else:
+            parametros[clave] = valor
+    parametros.update(por_simbolo)
+    return parametros
+
+
+def _clave_senales(combinacion):
+    return sorted((clave, str(valor)) for clave, valor in combinacion.items()
+                  if clave.partition(".")[0] in ("breakout_mult", "vol_mult"))
+
+
+def _inicializar_worker(ruta_velas, ruta_timestamps, rutas_indicadores, simbolos):
+    # Memoria mapeada: las páginas se comparten entre procesos en lugar de copiarse
+    _worker["velas"] = np.load(ruta_velas, mmap_mode="r")
+    _worker["timestamps"] = np.load(ruta_timestamps)
+    _worker["indicadores"] = {nombre: np.load(ruta, mmap_mode="r") for nombre, ruta in rutas_indicadores.items()}
+    _worker["simbolos"] = simbolos
+    _worker["cache_senales"] = {}
+    _worker["bytes_senales"] = 0
+
+
+def _senales(breakout, vol):
+    """
+    Acción y ATR por vela para unos multiplicadores. Los indicadores los calcula una
+    vez el proceso principal (ver ejecutar_busqueda) y los multiplicadores se aplican
+    encima. De cada combinación solo se guarda lo que usa el backtest (acción int8 y
+    ATR compartido), con la caché acotada a CACHE_SENALES_MB.
+    """
+    velas = _worker["velas"]
+    matrices = _worker["indicadores"]
+
+    clave = (breakout.tobytes(), vol.tobytes())
+    cache = _worker["cache_senales"]
+    if clave not in cache:
+        accion = calcular_senales(velas, breakout, vol, indicadores=matrices)["accion"]
+        limite = CACHE_SENALES_MB * 1024 * 1024
+        while cache and _worker["bytes_senales"] + accion.nbytes > limite:
+            _worker["bytes_senales"] -= cache.pop(next(iter(cache)))["accion"].nbytes
+        cache[clave] = {"accion": accion, "atr": matrices["atr"]}
+        _worker["bytes_senales"] += accion.nbytes
+    return cache[clave]
+
+
+def _evaluar(combinacion):
+    velas = _worker["velas"]
+    simbolos = _worker["simbolos"]
+    parametros = parametros_backtest(combinacion, simbolos)
+
+    breakout = vector_parametros(simbolos, parametros["breakout_mult"], 0.1)
+    vol = vector_parametros(simbolos, parametros["vol_mult"], 1.0)
+    senales = _senales(breakout, vol)
+
+    operaciones = backtest.ejecutar_backtest(velas, _worker["timestamps"], simbolos, parametros, senales=senales)
+    resultado = dict(combinacion)
+    resultado.update(backtest.resumir_resultados(operaciones))
+    return resultado
+
+
+def ejecutar_busqueda(simbolos, timestamps, velas, combinaciones, procesos=None, metrica="pnl_total",
+                      archivo=ARCHIVO_RESULTADOS):
+    """
+    Ejecuta un backtest por combinación en un pool de procesos y guarda el ranking
+
+    Returns:
+        pd.DataFrame: Resultados ordenados por 'metrica' de mayor a menor
+    """
+    procesos = procesos or os.cpu_count()
+    directorio = tempfile.mkdtemp(prefix="optimizacion_")
+    try:
+        ruta_velas = os.path.join(directorio, "velas.npy")
+        ruta_timestamps = os.path.join(directorio, "timestamps.npy")
+        np.save(ruta_velas, np.ascontiguousarray(velas))
+        np.save(ruta_timestamps, timestamps)
+        # Los indicadores no dependen de los parámetros buscados: una sola vez para todos los workers
+        rutas_indicadores = {}
+        for nombre, matriz in indicadores.calcular_indicadores_matriz(velas).items():
+            rutas_indicadores[nombre] = os.path.join(directorio, f"indicador_{nombre}.npy")
+            np.save(rutas_indicadores[nombre], matriz)
+
+        # Tareas ordenadas por multiplicadores para que cada worker reutilice sus señales
+        combinaciones = sorted(combinaciones, key=_clave_senales)
+        lote = max(1, len(combinaciones) // (procesos * 8))
+
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_worker,
+                                 initargs=(ruta_velas, ruta_timestamps, rutas_indicadores, simbolos)) as pool:
+            resultados = list(pool.map(_evaluar, combinaciones, chunksize=lote))
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    ranking = pd.DataFrame(resultados).sort_values(metrica, ascending=False).reset_index(drop=True)
+    ranking.to_csv(archivo, index=False)
+    return ranking
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Optimización de parámetros de estrategia y DCA")
+    parser.add_argument("--datos", default="historico_1m.npz", help="Archivo .npz con las velas (ver backtest.py)")
+    parser.add_argument("--modo", choices=["grid", "random"], default="grid")
+    parser.add_argument("--muestras", type=int, default=200, help="Combinaciones en modo random")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos (por defecto todos los núcleos)")
+    parser.add_argument("--metrica", default="pnl_total", help="Columna por la que ordenar los resultados")
+    parser.add_argument("--salida", default=ARCHIVO_RESULTADOS)
+    args = parser.parse_args()
+
+    simbolos, timestamps, velas = backtest.cargar_historico(args.datos)
+    if args.modo == "grid":
+        combinaciones = generar_grid(ESPACIO_BUSQUEDA)
+    else:
+        combinaciones = generar_aleatorias(ESPACIO_BUSQUEDA, args.muestras)
+
+    print(f"Evaluando {len(combinaciones)} combinaciones sobre {len(simbolos)} símbolos x {len(timestamps)} velas "
+          f"con {args.procesos or os.cpu_count()} procesos...")
+    inicio = time.perf_counter()
+    ranking = ejecutar_busqueda(simbolos, timestamps, velas, combinaciones, args.procesos, args.metrica, args.salida)
+    duracion = time.perf_counter() - inicio
+
+    print(f"Completado en {duracion:.1f} s ({len(combinaciones) / duracion:.1f} backtests/s). Resultados en {args.salida}")
+    print(ranking.head(10).to_string(index=False))
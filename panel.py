@@ -6,6 +6,8 @@ import json
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from hyperliquid_client import HyperliquidClient
+from estado_bot import AlmacenEstado, ARCHIVO_ESTADO
+import historial
 
 # Configuración de página
 st.set_page_config(
@@ -279,11 +281,22 @@ AUTO_REFRESH_SECONDS = 15
 # Constante para archivo de historial
 PNL_HISTORY_FILE = "pnl_history.csv"
 
-# Archivos de niveles TP
+# Archivos de niveles TP (los JSON solo hasta que el bot los migre a estado_bot.db)
 TP_ORDERS_FILE = "tp_orders.json"
 ATR_LEVELS_FILE = "trade_levels_atr.json"
 DCA_HISTORY_FILE = "dca_history.csv"
 
+# Historial en Parquet particionado por día que escribe el bot (si hay pyarrow); si no, los CSV
+try:
+    from config import HISTORIAL_DIRECTORIO
+except ImportError:
+    HISTORIAL_DIRECTORIO = historial.DIRECTORIO_HISTORIAL
+HISTORIAL_COLUMNAR = historial.HistorialColumnar(HISTORIAL_DIRECTORIO) if historial.disponible() else None
+
+
+def historial_columnar_activo():
+    return HISTORIAL_COLUMNAR is not None and HISTORIAL_COLUMNAR.fechas("pnl")[0] is not None
+
 # Función para cargar configuración
 def cargar_configuracion():
     try:
@@ -327,25 +340,39 @@ def cargar_simbolos_disponibles():
     except Exception:
         return []
 
+# Función para leer el estado del bot: (niveles ATR/DCA, órdenes TP)
+def leer_estado_bot():
+    if os.path.exists(ARCHIVO_ESTADO):
+        # Solo lectura: con WAL no bloquea las escrituras del bot
+        almacen = AlmacenEstado(ARCHIVO_ESTADO, solo_lectura=True)
+        try:
+            return almacen.niveles(), almacen.ordenes_tp()
+        finally:
+            almacen.cerrar()
+    
+    atr_levels, tp_orders = {}, {}
+    if os.path.exists(ATR_LEVELS_FILE):
+        with open(ATR_LEVELS_FILE, "r") as f:
+            atr_levels = json.load(f)
+    if os.path.exists(TP_ORDERS_FILE):
+        with open(TP_ORDERS_FILE, "r") as f:
+            tp_orders = json.load(f)
+    return atr_levels, tp_orders
+
 # Función para cargar niveles TP
 def cargar_niveles_tp():
     try:
         niveles_tp = {}
+        atr_levels, tp_orders = leer_estado_bot()
         
-        # Intentar cargar desde tp_orders.json
-        if os.path.exists(TP_ORDERS_FILE):
-            with open(TP_ORDERS_FILE, "r") as f:
-                tp_orders = json.load(f)
-                for symbol, data in tp_orders.items():
-                    niveles_tp[symbol] = data.get("price", 0)
+        # Intentar cargar desde las órdenes TP
+        for symbol, data in tp_orders.items():
+            niveles_tp[symbol] = data.get("price", 0)
         
-        # Si no hay datos o faltan símbolos, intentar con trade_levels_atr.json
-        if os.path.exists(ATR_LEVELS_FILE):
-            with open(ATR_LEVELS_FILE, "r") as f:
-                atr_levels = json.load(f)
-                for symbol, data in atr_levels.items():
-                    if symbol not in niveles_tp and "tp_fijo" in data:
-                        niveles_tp[symbol] = data.get("tp_fijo", 0)
+        # Si no hay datos o faltan símbolos, intentar con los niveles ATR
+        for symbol, data in atr_levels.items():
+            if symbol not in niveles_tp and "tp_fijo" in data:
+                niveles_tp[symbol] = data.get("tp_fijo", 0)
                         
         return niveles_tp
     except Exception as e:
@@ -357,18 +384,16 @@ def cargar_info_dca():
     try:
         dca_info = {}
         
-        # Cargar desde ATR_LEVELS_FILE para obtener info de DCA
-        if os.path.exists(ATR_LEVELS_FILE):
-            with open(ATR_LEVELS_FILE, "r") as f:
-                atr_levels = json.load(f)
-                for symbol, data in atr_levels.items():
-                    if "dca_info" in data:
-                        dca_info[symbol] = {
-                            "num_entradas": data["dca_info"].get("num_entradas", 0),
-                            "precio_promedio": data["dca_info"].get("precio_promedio", 0),
-                            "total_size": data["dca_info"].get("total_size", 0),
-                            "ultima_entrada": data["dca_info"].get("ultima_entrada", None)
-                        }
+        # Cargar los niveles ATR para obtener info de DCA
+        atr_levels, _ = leer_estado_bot()
+        for symbol, data in atr_levels.items():
+            if "dca_info" in data:
+                dca_info[symbol] = {
+                    "num_entradas": data["dca_info"].get("num_entradas", 0),
+                    "precio_promedio": data["dca_info"].get("precio_promedio", 0),
+                    "total_size": data["dca_info"].get("total_size", 0),
+                    "ultima_entrada": data["dca_info"].get("ultima_entrada", None)
+                }
                         
         return dca_info
     except Exception as e:
@@ -486,50 +511,121 @@ def cerrar_posicion(symbol, position_amount):
     except Exception as e:
         return False, f"Error: {e}"
 
+
+def preparar_historial_pnl(df):
+    # Convertir timestamp a datetime
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    
+    # Convertir tiempo_abierto (H:MM:SS) a timedelta cuando no es N/A, vectorizado
+    if 'tiempo_abierto' in df.columns:
+        df['tiempo_abierto_td'] = pd.to_timedelta(df['tiempo_abierto'].astype('string').replace('N/A', pd.NA),
+                                                  errors='coerce')
+    else:
+        df['tiempo_abierto'] = 'N/A'
+        df['tiempo_abierto_td'] = pd.NaT
+    
+    # Convertir pnl_real a float
+    if 'pnl_real' in df.columns:
+        df['pnl_real'] = pd.to_numeric(df['pnl_real'], errors='coerce')
+    else:
+        df['pnl_real'] = 0.0
+    
+    return df
+
+
+def preparar_historial_dca(df):
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+
+# Un lector por archivo compartido entre reruns y sesiones: cada recarga solo parsea las filas nuevas
+@st.cache_resource
+def lector_historial_pnl():
+    return historial.LectorCSVIncremental(PNL_HISTORY_FILE, preparar_historial_pnl)
+
+
+@st.cache_resource
+def lector_historial_dca():
+    return historial.LectorCSVIncremental(DCA_HISTORY_FILE, preparar_historial_dca)
+
+
+def filtrar_historial(df, desde=None, hasta=None, simbolo=None):
+    if df.empty:
+        return df
+    if desde:
+        df = df[df['timestamp'].dt.date >= desde]
+    if hasta:
+        df = df[df['timestamp'].dt.date <= hasta]
+    if simbolo:
+        df = df[df['symbol'] == simbolo]
+    return df
+
+
 # Función para cargar datos de historial
-@st.cache_data(ttl=300)  # Cachear por 5 minutos
-def cargar_datos_historial():
-    if not os.path.exists(PNL_HISTORY_FILE):
+def cargar_datos_historial_csv():
+    try:
+        return lector_historial_pnl().leer()
+    except Exception as e:
+        print(f"Error al cargar datos de historial: {e}")
         return pd.DataFrame()
-    
+
+
+def preparar_historial_parquet_pnl(df):
+    df['tiempo_abierto_td'] = pd.to_timedelta(df['tiempo_abierto_seg'], unit='s')
+    return df
+
+
+# Como los CSV: un lector por tabla compartido entre reruns, que solo lee las particiones con archivos nuevos
+@st.cache_resource
+def lector_historial_parquet(tabla):
+    return historial.LectorParquetIncremental(HISTORIAL_COLUMNAR, tabla,
+                                              preparar_historial_parquet_pnl if tabla == "pnl" else None)
+
+
+def resumen_historial_parquet():
+    fecha_min, fecha_max = HISTORIAL_COLUMNAR.fechas("pnl")
+    return fecha_min, fecha_max, lector_historial_parquet("pnl").leer()
+
+def cargar_resumen_historial():
+    """
+    Rango de fechas, símbolos y direcciones del historial para los filtros.
+    Con Parquet las fechas salen de los nombres de partición y el resto del lector incremental.
+
+    Returns:
+        tuple: (fecha_min, fecha_max, símbolos, direcciones) o None si no hay historial
+    """
+    if historial_columnar_activo():
+        fecha_min, fecha_max, df = resumen_historial_parquet()
+    else:
+        df = cargar_datos_historial_csv()
+        if df.empty:
+            return None
+        fecha_min, fecha_max = df['timestamp'].min().date(), df['timestamp'].max().date()
+    if df.empty:
+        return None
+    direcciones = sorted(df['direccion'].dropna().unique().tolist()) if 'direccion' in df.columns else []
+    return fecha_min, fecha_max, sorted(df['symbol'].dropna().unique().tolist()), direcciones
+
+def cargar_historial_parquet(tabla, desde=None, hasta=None, simbolo=None):
+    # Los filtros se aplican sobre la tabla en memoria: cambiar de filtro no vuelve a leer disco
+    return filtrar_historial(lector_historial_parquet(tabla).leer(), desde, hasta, simbolo)
+
+def cargar_datos_historial(desde=None, hasta=None, simbolo=None):
+    """Trades cerrados entre 'desde' y 'hasta' (incluidos), opcionalmente de un solo símbolo"""
     try:
-        # Usar error_bad_lines=False (o en versiones nuevas on_bad_lines='skip') para saltar líneas con errores
-        df = pd.read_csv(PNL_HISTORY_FILE, on_bad_lines='skip')
-        
-        # Convertir timestamp a datetime
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-        # Convertir tiempo_abierto a timedelta cuando no es N/A
-        def parse_tiempo(t):
-            if pd.isna(t) or t == 'N/A':
-                return pd.NaT
-            try:
-                parts = t.split(':')
-                if len(parts) == 3:
-                    h, m, s = map(int, parts)
-                    return timedelta(hours=h, minutes=m, seconds=s)
-                return pd.NaT
-            except:
-                return pd.NaT
-        
-        # Verificar si la columna existe antes de aplicar la función
-        if 'tiempo_abierto' in df.columns:
-            df['tiempo_abierto_td'] = df['tiempo_abierto'].apply(parse_tiempo)
-        else:
-            df['tiempo_abierto'] = 'N/A'
-            df['tiempo_abierto_td'] = pd.NaT
-        
-        # Convertir pnl_real a float
-        if 'pnl_real' in df.columns:
-            df['pnl_real'] = pd.to_numeric(df['pnl_real'], errors='coerce')
-        else:
-            df['pnl_real'] = 0.0
-        
-        return df
+        if historial_columnar_activo():
+            return cargar_historial_parquet("pnl", desde, hasta, simbolo)
+        return filtrar_historial(cargar_datos_historial_csv(), desde, hasta, simbolo)
     except Exception as e:
         print(f"Error al cargar datos de historial: {e}")
         return pd.DataFrame()
 
+def cargar_historial_dca(desde=None, hasta=None, simbolo=None):
+    """Entradas DCA entre 'desde' y 'hasta' (incluidos), opcionalmente de un solo símbolo"""
+    if historial_columnar_activo():
+        return cargar_historial_parquet("dca", desde, hasta, simbolo)
+    return filtrar_historial(lector_historial_dca().leer(), desde, hasta, simbolo)
+
 # Función para obtener tiempos de apertura y último DCA de las posiciones actuales
 def obtener_tiempos_apertura():
     """
@@ -538,45 +634,43 @@ def obtener_tiempos_apertura():
     """
     try:
         tiempos = {}
-        # Cargar desde tp_orders.json
-        if os.path.exists(TP_ORDERS_FILE):
-            with open(TP_ORDERS_FILE, "r") as f:
-                tp_orders = json.load(f)
-                for symbol, data in tp_orders.items():
-                    tiempos[symbol] = {"apertura": "N/A", "ultimo_dca": "N/A"}
+        # Cargar desde las órdenes TP del estado del bot
+        _, tp_orders = leer_estado_bot()
+        for symbol, data in tp_orders.items():
+            tiempos[symbol] = {"apertura": "N/A", "ultimo_dca": "N/A"}
+            
+            # Obtener tiempo apertura
+            if "tiempo_apertura" in data:
+                try:
+                    tiempo_apertura = datetime.fromisoformat(data["tiempo_apertura"])
+                    duracion = datetime.now() - tiempo_apertura
+                    tiempos[symbol]["apertura"] = str(duracion).split('.')[0]  # Formato HH:MM:SS
+                except Exception as e:
+                    print(f"Error procesando tiempo apertura para {symbol}: {e}")
+            
+            # Obtener tiempo último DCA si existe y es diferente al de apertura
+            if "ultimo_dca" in data:
+                try:
+                    tiempo_dca = datetime.fromisoformat(data["ultimo_dca"])
                     
-                    # Obtener tiempo apertura
+                    # Verificar si hay tiempo de apertura para comparar
                     if "tiempo_apertura" in data:
-                        try:
-                            tiempo_apertura = datetime.fromisoformat(data["tiempo_apertura"])
-                            duracion = datetime.now() - tiempo_apertura
-                            tiempos[symbol]["apertura"] = str(duracion).split('.')[0]  # Formato HH:MM:SS
-                        except Exception as e:
-                            print(f"Error procesando tiempo apertura para {symbol}: {e}")
-                    
-                    # Obtener tiempo último DCA si existe y es diferente al de apertura
-                    if "ultimo_dca" in data:
-                        try:
-                            tiempo_dca = datetime.fromisoformat(data["ultimo_dca"])
-                            
-                            # Verificar si hay tiempo de apertura para comparar
-                            if "tiempo_apertura" in data:
-                                tiempo_apertura = datetime.fromisoformat(data["tiempo_apertura"])
-                                diferencia_segundos = abs((tiempo_dca - tiempo_apertura).total_seconds())
-                                
-                                # Solo mostrar el tiempo de DCA si realmente es diferente (más de 60 segundos)
-                                if diferencia_segundos > 60:
-                                    duracion_dca = datetime.now() - tiempo_dca
-                                    tiempos[symbol]["ultimo_dca"] = str(duracion_dca).split('.')[0]
-                                else:
-                                    # Si son prácticamente iguales, marcar como N/A para evitar duplicación
-                                    tiempos[symbol]["ultimo_dca"] = "N/A"
-                            else:
-                                # Si no hay tiempo de apertura para comparar, mostrar el tiempo del DCA
-                                duracion_dca = datetime.now() - tiempo_dca
-                                tiempos[symbol]["ultimo_dca"] = str(duracion_dca).split('.')[0]
-                        except Exception as e:
-                            print(f"Error procesando tiempo último DCA para {symbol}: {e}")
+                        tiempo_apertura = datetime.fromisoformat(data["tiempo_apertura"])
+                        diferencia_segundos = abs((tiempo_dca - tiempo_apertura).total_seconds())
+                        
+                        # Solo mostrar el tiempo de DCA si realmente es diferente (más de 60 segundos)
+                        if diferencia_segundos > 60:
+                            duracion_dca = datetime.now() - tiempo_dca
+                            tiempos[symbol]["ultimo_dca"] = str(duracion_dca).split('.')[0]
+                        else:
+                            # Si son prácticamente iguales, marcar como N/A para evitar duplicación
+                            tiempos[symbol]["ultimo_dca"] = "N/A"
+                    else:
+                        # Si no hay tiempo de apertura para comparar, mostrar el tiempo del DCA
+                        duracion_dca = datetime.now() - tiempo_dca
+                        tiempos[symbol]["ultimo_dca"] = str(duracion_dca).split('.')[0]
+                except Exception as e:
+                    print(f"Error procesando tiempo último DCA para {symbol}: {e}")
         return tiempos
     except Exception as e:
         print(f"Error cargando tiempos de apertura: {e}")
@@ -792,46 +886,37 @@ with tab1:
 
 # Tab 2: Estadísticas
 with tab2:
-    # Cargar datos de historial
-    df = cargar_datos_historial()
+    # Rango y valores disponibles para los filtros (sin cargar el historial completo)
+    resumen = cargar_resumen_historial()
     
-    if df.empty:
+    if resumen is None:
         st.warning("No hay datos de historial disponibles.")
     else:
+        fecha_min, fecha_max, simbolos_historial, direcciones_historial = resumen
+        
         # Filtros
         col1, col2, col3 = st.columns(3)
         
         # Filtro de fechas
         with col1:
-            fecha_min = df['timestamp'].min().date()
-            fecha_max = df['timestamp'].max().date()
-            
             fecha_inicio = st.date_input("Desde:", fecha_min, min_value=fecha_min, max_value=fecha_max)
             fecha_fin = st.date_input("Hasta:", fecha_max, min_value=fecha_min, max_value=fecha_max)
         
         # Filtros de símbolo y dirección
         with col2:
-            simbolos = ['Todos'] + sorted(df['symbol'].unique().tolist())
+            simbolos = ['Todos'] + simbolos_historial
             simbolo_seleccionado = st.selectbox("Símbolo:", simbolos)
         
         with col3:
-            # Verificar que la columna 'direccion' existe
-            if 'direccion' in df.columns:
-                direcciones = ['Todas'] + sorted(df['direccion'].unique().tolist())
+            if direcciones_historial:
+                direcciones = ['Todas'] + direcciones_historial
                 direccion_seleccionada = st.selectbox("Dirección:", direcciones)
             else:
                 direccion_seleccionada = 'Todas'
         
-        # Aplicar filtros
-        df_filtrado = df.copy()
-        
-        # Filtro de fechas
-        df_filtrado = df_filtrado[(df_filtrado['timestamp'].dt.date >= fecha_inicio) & 
-                                (df_filtrado['timestamp'].dt.date <= fecha_fin)]
-        
-        # Filtro de símbolo
-        if simbolo_seleccionado != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['symbol'] == simbolo_seleccionado]
+        # Fechas y símbolo se aplican al cargar (sobre el historial ya leído)
+        df_filtrado = cargar_datos_historial(fecha_inicio, fecha_fin,
+                                             None if simbolo_seleccionado == 'Todos' else simbolo_seleccionado)
         
         # Filtro de dirección
         if direccion_seleccionada != 'Todas' and 'direccion' in df_filtrado.columns:
@@ -1030,23 +1115,18 @@ with tab2:
             st.write(display_df.to_html(escape=False, index=False), unsafe_allow_html=True)
         
         # Agregar sección de historial DCA
-        if os.path.exists(DCA_HISTORY_FILE):
+        try:
+            df_dca_filtrado = cargar_historial_dca(fecha_inicio, fecha_fin,
+                                                   None if simbolo_seleccionado == 'Todos' else simbolo_seleccionado)
+        except Exception as e:
+            df_dca_filtrado = None
+            st.error(f"Error al cargar historial DCA: {e}")
+        
+        if df_dca_filtrado is not None and (historial_columnar_activo() or os.path.exists(DCA_HISTORY_FILE)):
             st.markdown("<h3>Historial de DCA</h3>", unsafe_allow_html=True)
             
             try:
-                df_dca = pd.read_csv(DCA_HISTORY_FILE, on_bad_lines='skip')
-                if not df_dca.empty:
-                    # Convertir timestamp
-                    df_dca['timestamp'] = pd.to_datetime(df_dca['timestamp'])
-                    
-                    # Filtrar por fecha
-                    df_dca_filtrado = df_dca[(df_dca['timestamp'].dt.date >= fecha_inicio) & 
-                                           (df_dca['timestamp'].dt.date <= fecha_fin)]
-                    
-                    # Filtrar por símbolo si está seleccionado
-                    if simbolo_seleccionado != 'Todos':
-                        df_dca_filtrado = df_dca_filtrado[df_dca_filtrado['symbol'] == simbolo_seleccionado]
-                    
+                if 'timestamp' in df_dca_filtrado.columns:
                     # Formatear para mostrar
                     df_dca_display = df_dca_filtrado.copy()
                     df_dca_display['timestamp'] = df_dca_display['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,150 @@
+# planificador.py
+import heapq
+import itertools
+import math
+import threading
+import time
+import logging
+
+
+class Planificador:
+    """
+    Planificador de tareas del bot en un único hilo.
+
+    Cada tarea se ejecuta en su propio temporizador: periódica ('cada') o alineada
+    al cierre de vela ('en_cierre_vela'). Cualquier hilo (p.ej. el WebSocket de
+    mercado) puede adelantar una tarea con 'disparar', respetando su intervalo
+    mínimo entre ejecuciones. Entre eventos el hilo queda bloqueado sin consumir
+    API ni CPU.
+    """
+
+    def __init__(self):
+        self._cola = []                     # heap de (instante, secuencia, nombre)
+        self._tareas = {}
+        self._secuencia = itertools.count()
+        self._condicion = threading.Condition()
+        self._detenido = False
+
+    def cada(self, nombre, intervalo, funcion, inmediata=True):
+        """
+        Ejecuta 'funcion' cada 'intervalo' segundos (contados desde el final de la ejecución anterior)
+        """
+        self._registrar(nombre, funcion, intervalo=intervalo, paso=None, desfase=0.0, intervalo_minimo=0.0,
+                        primera=time.time() if inmediata else time.time() + intervalo)
+
+    def en_cierre_vela(self, nombre, paso, funcion, desfase=0.0, intervalo_minimo=0.0):
+        """
+        Ejecuta 'funcion' en cada cierre de vela de 'paso' segundos, desplazado 'desfase'
+        segundos (negativo = antes del cierre)
+
+        Args:
+            intervalo_minimo (float): Separación mínima entre ejecuciones cuando se dispara por evento
+        """
+        self._registrar(nombre, funcion, intervalo=None, paso=paso, desfase=desfase,
+                        intervalo_minimo=intervalo_minimo, primera=None)
+
+    def _registrar(self, nombre, funcion, intervalo, paso, desfase, intervalo_minimo, primera):
+        with self._condicion:
+            tarea = {
+                'funcion': funcion,
+                'intervalo': intervalo,
+                'paso': paso,
+                'desfase': desfase,
+                'intervalo_minimo': intervalo_minimo,
+                'ultima': None,
+                'proxima': None,
+                'ejecuciones': 0,
+                'duracion_total': 0.0,
+                'duracion_max': 0.0,
+            }
+            self._tareas[nombre] = tarea
+            self._programar(nombre, primera if primera is not None else self._siguiente_cierre(tarea, time.time()))
+
+    @staticmethod
+    def _siguiente_cierre(tarea, ahora):
+        paso, desfase = tarea['paso'], tarea['desfase']
+        return (math.floor((ahora - desfase) / paso) + 1) * paso + desfase
+
+    def _programar(self, nombre, instante):
+        # Las entradas antiguas del heap quedan invalidadas al no coincidir con 'proxima'
+        self._tareas[nombre]['proxima'] = instante
+        heapq.heappush(self._cola, (instante, next(self._secuencia), nombre))
+        self._condicion.notify()
+
+    def disparar(self, nombre):
+        """Adelanta la tarea a ahora (o al fin de su intervalo mínimo). Seguro desde cualquier hilo."""
+        with self._condicion:
+            tarea = self._tareas.get(nombre)
+            if tarea is None:
+                return
+            instante = time.time()
+            if tarea['ultima'] is not None:
+                instante = max(instante, tarea['ultima'] + tarea['intervalo_minimo'])
+            if tarea['proxima'] is None or instante < tarea['proxima']:
+                self._programar(nombre, instante)
+
+    def estadisticas(self):
+        """
+        Duración de cada tarea (tiempo de ciclo)
+
+        Returns:
+            dict: nombre -> {'ejecuciones', 'media_ms', 'max_ms'}
+        """
+        with self._condicion:
+            return {nombre: {"ejecuciones": t['ejecuciones'],
+                             "media_ms": 1000 * t['duracion_total'] / t['ejecuciones'] if t['ejecuciones'] else 0.0,
+                             "max_ms": 1000 * t['duracion_max']}
+                    for nombre, t in self._tareas.items()}
+
+    def detener(self):
+        with self._condicion:
+            self._detenido = True
+            self._condicion.notify()
+
+    def _siguiente_tarea(self):
+        """Bloquea hasta que venza la próxima tarea y devuelve su nombre (None si se detiene)"""
+        with self._condicion:
+            while not self._detenido:
+                if not self._cola:
+                    self._condicion.wait()
+                    continue
+                instante, _, nombre = self._cola[0]
+                if self._tareas[nombre]['proxima'] != instante:
+                    heapq.heappop(self._cola)
+                    continue
+                espera = instante - time.time()
+                if espera > 0:
+                    self._condicion.wait(espera)
+                    continue
+                heapq.heappop(self._cola)
+                self._tareas[nombre]['proxima'] = None
+                self._tareas[nombre]['ultima'] = time.time()
+                return nombre
+            return None
+
+    def ejecutar(self):
+        """Bucle principal: ejecuta las tareas a su hora hasta que se llame a detener()"""
+        while True:
+            nombre = self._siguiente_tarea()
+            if nombre is None:
+                return
+            tarea = self._tareas[nombre]
+            inicio = time.perf_counter()
+            try:
+                tarea['funcion']()
+            except Exception as e:
+                print(f"Error en la tarea '{nombre}': {e}")
+                logging.error(f"Error en la tarea '{nombre}': {e}", exc_info=True)
+            duracion = time.perf_counter() - inicio
+
+            with self._condicion:
+                tarea['ejecuciones'] += 1
+                tarea['duracion_total'] += duracion
+                tarea['duracion_max'] = max(tarea['duracion_max'], duracion)
+                ahora = time.time()
+                # Un disparo recibido durante la ejecución ya dejó programada la siguiente
+                if tarea['proxima'] is None:
+                    if tarea['paso'] is not None:
+                        self._programar(nombre, self._siguiente_cierre(tarea, ahora))
+                    else:
+                        self._programar(nombre, ahora + tarea['intervalo'])
@@ -0,0 +1,107 @@
+# senales.py
+import numpy as np
+
+from indicadores import calcular_indicadores_matriz, COL_CLOSE, COL_VOLUME
+
+MIN_VELAS = 30            # Velas mínimas para evaluar la estrategia (EMA30)
+UMBRAL_ATR_MEDIA = 0.7    # Se descarta la señal si ATR < 0.7 * media de ATR
+
+# Códigos de acción de la matriz de señales
+SIN_SENAL, LONG, SHORT = 0, 1, -1
+
+
+def vector_parametros(simbolos, por_simbolo, defecto):
+    """Convierte un diccionario de parámetros por símbolo en un vector alineado con 'simbolos'"""
+    return np.array([por_simbolo.get(symbol, defecto) for symbol in simbolos], dtype=np.float64)
+
+
+def calcular_senales(velas, breakout_mult, vol_mult, indicadores=None):
+    """
+    Evalúa las condiciones de microestructura v2 en todas las velas de todos los símbolos
+
+    Args:
+        velas (np.ndarray): Matriz (símbolos, velas, 5) con open, high, low, close, volume
+        breakout_mult (np.ndarray): Multiplicador de ruptura sobre ATR por símbolo
+        vol_mult (np.ndarray): Multiplicador de volumen por símbolo
+        indicadores (dict, optional): Resultado previo de calcular_indicadores_matriz
+
+    Returns:
+        dict: Matrices (símbolos, velas) con 'accion' (LONG/SHORT/SIN_SENAL), 'vol_spike',
+              'atr_ok', 'fuerza' (ruptura en unidades de ATR), 'umbral_long'/'umbral_short'
+              (precio de ruptura) e indicadores
+    """
+    if indicadores is None:
+        indicadores = calcular_indicadores_matriz(velas)
+    close = velas[:, :, COL_CLOSE]
+    volume = velas[:, :, COL_VOLUME]
+    atr = indicadores['atr']
+
+    breakout_mult = np.asarray(breakout_mult, dtype=np.float64)[:, None]
+    vol_mult = np.asarray(vol_mult, dtype=np.float64)[:, None]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Las comparaciones con NaN son False, igual que en pandas
+        vol_spike = volume > indicadores['vol_rolling'] * vol_mult
+        atr_ok = ~(atr < UMBRAL_ATR_MEDIA * indicadores['atr_media'])
+
+        umbral_long = indicadores['prev_max'] + breakout_mult * atr
+        umbral_short = indicadores['prev_min'] - breakout_mult * atr
+        long_signal = atr_ok & vol_spike & (close > umbral_long) & (close > indicadores['ema30'])
+        short_signal = atr_ok & vol_spike & (close < umbral_short) & (close < indicadores['ema30'])
+
+        fuerza = np.where(long_signal, (close - umbral_long) / atr,
+                          np.where(short_signal, (umbral_short - close) / atr, 0.0))
+
+    accion = np.where(long_signal, LONG, np.where(short_signal, SHORT, SIN_SENAL)).astype(np.int8)
+    # Sin suficientes velas previas no hay señal
+    accion[:, :MIN_VELAS - 1] = SIN_SENAL
+
+    resultado = dict(indicadores)
+    resultado.update({
+        'accion': accion,
+        'vol_spike': vol_spike,
+        'atr_ok': atr_ok,
+        'fuerza': fuerza,
+        'umbral_long': umbral_long,
+        'umbral_short': umbral_short,
+    })
+    return resultado
+
+
+def evaluar_senales_lote(velas, simbolos, breakout_por_simbolo, vol_por_simbolo,
+                         breakout_defecto=0.1, vol_defecto=1.0):
+    """
+    Evalúa la última vela de todos los símbolos en una sola pasada vectorizada
+
+    Args:
+        velas (np.ndarray): Matriz (símbolos, velas, 5) con open, high, low, close, volume
+        simbolos (list): Símbolos en el orden de las filas de 'velas'
+        breakout_por_simbolo (dict): BREAKOUT_ATR_MULT_POR_SIMBOLO
+        vol_por_simbolo (dict): MULTIPLICADOR_VOL_POR_SIMBOLO
+
+    Returns:
+        dict: Vectores por símbolo: 'accion', 'atr', 'atr_media', 'close', 'ema30',
+              'vol_spike', 'atr_ok', 'fuerza', 'umbral_long', 'umbral_short'
+    """
+    breakout_mult = vector_parametros(simbolos, breakout_por_simbolo, breakout_defecto)
+    vol_mult = vector_parametros(simbolos, vol_por_simbolo, vol_defecto)
+
+    if velas.shape[1] < MIN_VELAS:
+        vacio = np.zeros(len(simbolos))
+        return {'accion': vacio.astype(np.int8), 'atr': vacio, 'atr_media': vacio, 'close': vacio,
+                'ema30': vacio, 'vol_spike': vacio.astype(bool), 'atr_ok': vacio.astype(bool), 'fuerza': vacio,
+                'umbral_long': np.full(len(simbolos), np.nan), 'umbral_short': np.full(len(simbolos), np.nan)}
+
+    senales = calcular_senales(velas, breakout_mult, vol_mult)
+    return {
+        'accion': senales['accion'][:, -1],
+        'atr': senales['atr'][:, -1],
+        'atr_media': senales['atr_media'][:, -1],
+        'close': velas[:, -1, COL_CLOSE],
+        'ema30': senales['ema30'][:, -1],
+        'vol_spike': senales['vol_spike'][:, -1],
+        'atr_ok': senales['atr_ok'][:, -1],
+        'fuerza': senales['fuerza'][:, -1],
+        'umbral_long': senales['umbral_long'][:, -1],
+        'umbral_short': senales['umbral_short'][:, -1],
+    }
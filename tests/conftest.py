@@ -0,0 +1,44 @@
+import os
+import sys
+
+# Los módulos del bot están en la raíz del repositorio (sin paquete)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import types
+
+import pytest
+
+import config
+import exchange_simulado
+
+# secret.py (credenciales) no se versiona: en las pruebas basta una cartera desechable
+if "secret" not in sys.modules:
+    try:
+        import secret  # noqa: F401
+    except ImportError:
+        from eth_account import Account
+        cuenta = Account.create()
+        sys.modules["secret"] = types.SimpleNamespace(WALLET_PRIVATE_KEY=cuenta.key.hex(),
+                                                      WALLET_ADDRESS=cuenta.address)
+
+
+@pytest.fixture
+def servidor_simulado():
+    """Exchange simulado en un puerto libre de localhost (HTTP y WebSocket)"""
+    servidor = exchange_simulado.arrancar(num_simbolos=5, puerto=0, paso=0.2, semilla=1)
+    host, puerto = servidor.server_address
+    servidor.url = f"http://{host}:{puerto}"
+    servidor.url_ws = f"ws://{host}:{puerto}/ws"
+    yield servidor
+    servidor.exchange.detener()
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def cliente_simulado(servidor_simulado, monkeypatch):
+    """HyperliquidClient contra el exchange simulado (sin streaming)"""
+    monkeypatch.setattr(config, "API_URL", servidor_simulado.url)
+    monkeypatch.setattr(config, "WS_ENABLED", False)
+    from hyperliquid_client import HyperliquidClient
+    return HyperliquidClient()
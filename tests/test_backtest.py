@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import estrategia
+from backtest import (
+    PARAMETROS_DEFECTO, _formatear_duracion, _simular_simbolo, ejecutar_backtest, resumir_resultados
+)
+from indicadores import COL_OPEN, COL_HIGH, COL_LOW, COL_CLOSE
+from optimizacion import ejecutar_busqueda, generar_grid, parametros_backtest
+from senales import LONG, SHORT, SIN_SENAL
+from test_indicadores import velas_sinteticas
+
+
+def simular_vela_a_vela(symbol, velas, timestamps, accion, atr, p, paso_ms):
+    """Las mismas reglas que _simular_simbolo recorriendo todas las velas una a una"""
+    apertura, high, low, close = velas[:, COL_OPEN], velas[:, COL_HIGH], velas[:, COL_LOW], velas[:, COL_CLOSE]
+    n = len(close)
+    separacion_dca = int(np.ceil(p["dca_min_time_between"] * 60000 / paso_ms))
+    nocional = p["leverage"] * p["margin_per_trade"]
+    operaciones = []
+    posicion = None
+    for i in range(n):
+        if posicion is None:
+            if accion[i] != SIN_SENAL and i < n - 1:
+                es_long = accion[i] == LONG
+                direccion = "BUY" if es_long else "SELL"
+                posicion = {"t": i, "es_long": es_long, "direccion": direccion, "promedio": close[i],
+                            "original": nocional / close[i], "total": nocional / close[i], "operado": nocional,
+                            "num_dca": 0, "ultimo_dca": None,
+                            "tp": estrategia.calcular_tp_atr(close[i], atr[i], direccion,
+                                                             atr_tp_mult=p["atr_tp_mult"],
+                                                             max_tp_pct=p["max_tp_pct"])}
+            continue
+
+        es_long, direccion = posicion["es_long"], posicion["direccion"]
+        umbral_dca = posicion["promedio"] * (1 - p["dca_max_loss_pct"] if es_long else 1 + p["dca_max_loss_pct"])
+        puede_dca = (p["dca_enabled"] and posicion["num_dca"] < p["dca_max_entries"] and
+                     (posicion["ultimo_dca"] is None or i >= posicion["ultimo_dca"] + separacion_dca))
+        if puede_dca and (low[i] <= umbral_dca if es_long else high[i] >= umbral_dca):
+            precio_dca = min(apertura[i], umbral_dca) if es_long else max(apertura[i], umbral_dca)
+            tamano_dca = posicion["original"] * p["dca_size_multiplier"]
+            posicion["promedio"] = ((posicion["promedio"] * posicion["total"] + precio_dca * tamano_dca) /
+                                    (posicion["total"] + tamano_dca))
+            posicion["total"] += tamano_dca
+            posicion["operado"] += precio_dca * tamano_dca
+            posicion["tp"] = estrategia.calcular_tp_atr(posicion["promedio"], atr[i], direccion,
+                                                        atr_tp_mult=p["atr_tp_mult"], max_tp_pct=p["max_tp_pct"])
+            posicion["num_dca"] += 1
+            posicion["ultimo_dca"] = i
+            continue
+
+        tp = posicion["tp"]
+        if (high[i] >= tp) if es_long else (low[i] <= tp):
+            salida, razon = (max(apertura[i], tp) if es_long else min(apertura[i], tp)), "tp_alcanzado"
+        elif i == n - 1:
+            salida, razon = close[i], "fin_datos"
+        else:
+            continue
+        signo = 1 if es_long else -1
+        pnl = (salida - posicion["promedio"]) * posicion["total"] * signo
+        pnl -= p["comision"] * (posicion["operado"] + salida * posicion["total"])
+        operaciones.append((
+            datetime.fromtimestamp(timestamps[i] / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+            symbol, direccion, posicion["promedio"], salida, tp, pnl,
+            _formatear_duracion(timestamps[i] - timestamps[posicion["t"]]), razon, posicion["num_dca"]
+        ))
+        posicion = None
+    return operaciones
+
+
+@pytest.mark.parametrize("semilla,dca_enabled", [(1, True), (2, True), (3, False)])
+def test_saltos_de_evento_igual_que_vela_a_vela(semilla, dca_enabled):
+    velas = velas_sinteticas(4000, semilla=semilla)[0]
+    timestamps = np.arange(len(velas), dtype=np.int64) * 60000 + 1_700_000_000_000
+    rng = np.random.default_rng(semilla)
+    accion = rng.choice([SIN_SENAL, LONG, SHORT], size=len(velas), p=[0.97, 0.015, 0.015])
+    atr = velas[:, COL_CLOSE] * rng.uniform(0.0005, 0.003, len(velas))
+    p = dict(PARAMETROS_DEFECTO, dca_enabled=dca_enabled, dca_max_loss_pct=0.004, dca_max_entries=3,
+             dca_min_time_between=5, comision=0.0002)
+
+    eventos = _simular_simbolo("AAA", velas, timestamps, accion, atr, p, 60000)
+    naive = simular_vela_a_vela("AAA", velas, timestamps, accion, atr, p, 60000)
+
+    assert len(eventos) > 10
+    assert any(operacion[-1] > 0 for operacion in eventos) == dca_enabled
+    assert eventos == naive
+
+
+def test_busqueda_en_paralelo_igual_que_backtest_directo(tmp_path):
+    velas = velas_sinteticas(1500, semilla=5, simbolos=2)
+    timestamps = np.arange(velas.shape[1], dtype=np.int64) * 60000
+    simbolos = ["AAA", "BBB"]
+    combinaciones = generar_grid({"atr_tp_mult": [1.0, 2.0], "breakout_mult": [0.05, 0.2], "vol_mult.AAA": [1.2]})
+
+    ranking = ejecutar_busqueda(simbolos, timestamps, velas, combinaciones, procesos=2,
+                                archivo=str(tmp_path / "resultados.csv"))
+
+    assert len(ranking) == len(combinaciones) and ranking["operaciones"].sum() > 0
+    for combinacion in combinaciones:
+        fila = ranking[(ranking["atr_tp_mult"] == combinacion["atr_tp_mult"]) &
+                       (ranking["breakout_mult"] == combinacion["breakout_mult"])].iloc[0]
+        directo = resumir_resultados(ejecutar_backtest(velas, timestamps, simbolos,
+                                                       parametros_backtest(combinacion, simbolos)))
+        assert fila["operaciones"] == directo["operaciones"]
+        assert fila["pnl_total"] == pytest.approx(directo["pnl_total"])
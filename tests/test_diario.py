@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from diario import CABECERA, DiarioEventos, VistaCSV
+
+COLUMNAS_PNL = ["timestamp", "symbol", "direccion", "pnl_real"]
+
+
+def nuevo_diario(directorio, cada_snapshot=500):
+    vista = VistaCSV(str(directorio / "pnl.csv"), "cerrada", COLUMNAS_PNL)
+    return DiarioEventos(str(directorio / "eventos.journal"), vistas=[vista], cada_snapshot=cada_snapshot)
+
+
+def registrar_operaciones(diario, n):
+    for i in range(n):
+        diario.registrar("abierta", symbol=f"S{i}", direccion="BUY", precio=100.0 + i, tamano=1.0, tp=101.0 + i)
+        diario.registrar("cerrada", symbol=f"S{i}", direccion="BUY", pnl_real=1.5)
+
+
+def simular_corte(diario):
+    """Cierra el archivo sin el snapshot final, como un proceso que muere"""
+    diario._archivo.close()
+
+
+def test_recuperar_reproduce_la_cola_tras_el_snapshot(tmp_path):
+    diario = nuevo_diario(tmp_path, cada_snapshot=3)
+    diario.recuperar()
+    registrar_operaciones(diario, 4)
+    esperado = diario.estado
+    simular_corte(diario)
+
+    recuperado = nuevo_diario(tmp_path, cada_snapshot=3)
+    # 8 eventos con snapshot cada 3: solo se reproducen los 2 posteriores al último
+    assert recuperado.recuperar() == 2
+    assert recuperado.estado == esperado
+    assert recuperado.estado["trades_cerrados"] == 4 and recuperado.estado["pnl_total"] == pytest.approx(6.0)
+    recuperado.cerrar()
+
+    # Tras un cierre ordenado no queda nada que reproducir
+    assert nuevo_diario(tmp_path).recuperar() == 0
+
+
+def test_trama_con_crc_incorrecto_termina_el_diario(tmp_path):
+    diario = nuevo_diario(tmp_path)
+    diario.recuperar()
+    registrar_operaciones(diario, 2)
+    simular_corte(diario)
+    ruta = str(tmp_path / "eventos.journal")
+    offsets = [offset for offset, _ in diario.leer()]
+
+    # Se altera un byte del contenido de la última trama
+    with open(ruta, "r+b") as f:
+        f.seek(offsets[-2] + CABECERA.size + 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    recuperado = nuevo_diario(tmp_path)
+    assert recuperado.recuperar() == 3
+    assert os.path.getsize(ruta) == offsets[-2]
+    assert recuperado.estado["trades_cerrados"] == 1 and "S1" in recuperado.estado["abiertas"]
+    recuperado.cerrar()
+
+
+def test_trama_incompleta_se_trunca_y_se_sigue_escribiendo(tmp_path):
+    diario = nuevo_diario(tmp_path)
+    diario.recuperar()
+    registrar_operaciones(diario, 2)
+    simular_corte(diario)
+    ruta = str(tmp_path / "eventos.journal")
+    with open(ruta, "r+b") as f:
+        f.truncate(os.path.getsize(ruta) - 5)
+
+    recuperado = nuevo_diario(tmp_path)
+    assert recuperado.recuperar() == 3
+    recuperado.registrar("cerrada", symbol="S1", direccion="BUY", pnl_real=2.0)
+    recuperado.cerrar()
+
+    eventos = [evento for _, evento in nuevo_diario(tmp_path).leer()]
+    assert [evento["tipo"] for evento in eventos] == ["abierta", "cerrada", "abierta", "cerrada"]
+    assert eventos[-1]["datos"]["pnl_real"] == 2.0
+
+
+def test_vista_csv_se_completa_desde_el_diario(tmp_path):
+    diario = nuevo_diario(tmp_path)
+    diario.recuperar()
+    registrar_operaciones(diario, 3)
+    simular_corte(diario)
+    ruta_csv = tmp_path / "pnl.csv"
+    completo = ruta_csv.read_text()
+
+    # Corte entre la escritura del diario y la de la vista: falta la última fila
+    ruta_csv.write_text("".join(completo.splitlines(keepends=True)[:-1]))
+    recuperado = nuevo_diario(tmp_path)
+    recuperado.recuperar()
+    assert ruta_csv.read_text() == completo
+    recuperado.cerrar()
+
+    # Una vista que no cuadra con el diario (más filas que eventos) se regenera entera
+    ruta_csv.write_text(completo + completo.splitlines(keepends=True)[-1])
+    nuevo_diario(tmp_path).recuperar()
+    assert ruta_csv.read_text() == completo
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from estado_bot import AlmacenEstado, EstadoMemoria
+
+DCA = {"num_entradas": 1, "ultima_entrada": "2024-01-01T00:05:00", "precio_promedio": 95.0,
+       "total_size": 3.0, "original_size": 1.0}
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = AlmacenEstado(str(tmp_path / "estado.db"))
+    yield almacen
+    almacen.cerrar()
+
+
+def test_transaccion_confirma_o_deshace_todo(almacen):
+    with almacen.transaccion():
+        almacen.guardar_nivel("BTC", 101.0, DCA)
+        almacen.agregar_entrada_dca("BTC", 90.0, 2.0, "2024-01-01T00:05:00")
+        almacen.guardar_orden_tp("BTC", {"order_id": 7, "price": 101.0, "side": "sell", "cloid": "0xab"})
+
+    with pytest.raises(RuntimeError):
+        with almacen.transaccion():
+            almacen.guardar_nivel("BTC", 120.0)
+            # Anidada: el error de dentro deshace también los cambios de fuera
+            with almacen.transaccion():
+                almacen.borrar_orden_tp("BTC")
+                raise RuntimeError("corte")
+
+    nivel = almacen.nivel("BTC")
+    assert nivel["tp_fijo"] == 101.0
+    assert nivel["dca_info"]["entradas"] == [{"precio": 90.0, "tamano": 2.0, "fecha": "2024-01-01T00:05:00"}]
+    # Los ids se guardan como texto y las claves desconocidas en 'extra'
+    assert almacen.orden_tp("BTC") == {"order_id": "7", "price": 101.0, "side": "sell", "cloid": "0xab"}
+
+
+def test_estado_en_memoria_vuelca_en_un_lote(tmp_path, almacen):
+    estado = EstadoMemoria(almacen, intervalo=3600)
+    with estado.transaccion():
+        estado.guardar_nivel("ETH", 2000.0, DCA)
+        estado.agregar_entrada_dca("ETH", 1900.0, 2.0, "2024-01-01T00:05:00")
+        estado.guardar_orden_tp("ETH", {"order_id": "9", "price": 2000.0})
+    estado.guardar_orden_tp("SOL", {"order_id": "10", "price": 150.0})
+    estado.borrar_orden_tp("SOL")
+
+    # Hasta el volcado los cambios solo están en memoria
+    assert almacen.niveles() == {} and almacen.ordenes_tp() == {}
+    estado.volcar()
+    assert almacen.niveles() == estado.niveles()
+    assert almacen.ordenes_tp() == {"ETH": {"order_id": "9", "price": 2000.0}}
+
+    estado.iniciar()
+    estado.borrar_nivel("ETH")
+    estado.detener()
+    releido = AlmacenEstado(str(tmp_path / "estado.db"), solo_lectura=True)
+    assert releido.niveles() == {}
+    releido.cerrar()
+
+
+def test_migracion_json_una_sola_vez(tmp_path, almacen):
+    ruta_niveles, ruta_ordenes = tmp_path / "niveles.json", tmp_path / "ordenes.json"
+    ruta_niveles.write_text(json.dumps({"BTC": {"tp_fijo": 101.0, "dca_info": dict(
+        DCA, entradas=[{"precio": 90.0, "tamano": 2.0, "fecha": "2024-01-01T00:05:00"}])}}))
+    ruta_ordenes.write_text(json.dumps({"BTC": {"order_id": 7, "price": 101.0}}))
+
+    assert almacen.migrar_json(str(ruta_niveles), str(ruta_ordenes))
+    assert almacen.nivel("BTC")["dca_info"]["entradas"][0]["precio"] == 90.0
+    assert almacen.orden_tp("BTC") == {"order_id": "7", "price": 101.0}
+    assert not ruta_niveles.exists() and (tmp_path / "niveles.json.migrado").exists()
+
+    # Un JSON que reaparece después no se vuelve a importar
+    ruta_ordenes.write_text(json.dumps({"ETH": {"order_id": 8}}))
+    assert not almacen.migrar_json(str(ruta_niveles), str(ruta_ordenes))
+    assert almacen.orden_tp("ETH") is None
+
+
+def test_migracion_pendiente_mientras_haya_corrupto(tmp_path, almacen):
+    ruta_niveles, ruta_ordenes = tmp_path / "niveles.json", tmp_path / "ordenes.json"
+    ruta_niveles.write_text('{"BTC": {"tp_fijo": 1')
+    ruta_ordenes.write_text(json.dumps({"BTC": {"order_id": 7}}))
+    avisos = []
+
+    almacen.migrar_json(str(ruta_niveles), str(ruta_ordenes), avisar=avisos.append)
+    assert (tmp_path / "niveles.json.corrupto").exists() and len(avisos) == 1
+    assert almacen.orden_tp("BTC") == {"order_id": "7"}
+
+    # Cada arranque vuelve a avisar mientras el corrupto siga ahí
+    for _ in range(2):
+        assert not almacen.migrar_json(str(ruta_niveles), str(ruta_ordenes), avisar=avisos.append)
+    assert len(avisos) == 3 and almacen.nivel("BTC") is None
+
+    # Reparado y con su nombre original se importa, y la migración queda hecha
+    (tmp_path / "niveles.json.corrupto").unlink()
+    ruta_niveles.write_text(json.dumps({"BTC": {"tp_fijo": 101.0}}))
+    assert almacen.migrar_json(str(ruta_niveles), str(ruta_ordenes), avisar=avisos.append)
+    assert almacen.nivel("BTC") == {"tp_fijo": 101.0}
+    ruta_niveles.write_text(json.dumps({"ETH": {"tp_fijo": 5.0}}))
+    assert not almacen.migrar_json(str(ruta_niveles), str(ruta_ordenes), avisar=avisos.append)
+    assert len(avisos) == 3
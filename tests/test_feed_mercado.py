@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import config
+from feed_mercado import FeedMercadoWS
+
+
+def esperar(condicion, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        resultado = condicion()
+        if resultado:
+            return resultado
+        time.sleep(0.02)
+    raise AssertionError("condición no cumplida a tiempo")
+
+
+def conexion_suscrita(servidor, coin, distinta_de=None):
+    """Conexión WebSocket del servidor con l2Book de la moneda y allMids ya suscritos"""
+    for conexion in list(servidor.conexiones_ws):
+        if conexion is not distinta_de and coin in conexion.monedas_l2 and conexion.all_mids:
+            return conexion
+    return None
+
+
+@pytest.fixture
+def feed_simulado(servidor_simulado):
+    """Feed conectado al exchange simulado, con el mercado parado para difundir a mano"""
+    servidor_simulado.exchange.detener()
+    time.sleep(2 * servidor_simulado.exchange.paso)
+    feed = FeedMercadoWS(servidor_simulado.url_ws, espera_reconexion=0.1)
+    feed.suscribir_all_mids()
+    feed.iniciar()
+    assert feed.esperar_conexion(5)
+    yield feed
+    feed.detener()
+
+
+def test_feed_mantiene_mejor_bid_ask(servidor_simulado, feed_simulado):
+    mercado = servidor_simulado.exchange.mercado
+    coin = mercado.simbolos[0]
+    feed_simulado.suscribir_l2([coin])
+    esperar(lambda: conexion_suscrita(servidor_simulado, coin))
+    assert feed_simulado.obtener_libro(coin, 5) is None
+
+    servidor_simulado.difundir_mercado()
+    libro = esperar(lambda: feed_simulado.obtener_libro(coin, 5))
+    niveles = mercado.libro(coin)
+    assert float(libro["bids"][0][0]) == float(niveles[0][0]["px"])
+    assert float(libro["asks"][0][0]) == float(niveles[1][0]["px"])
+    assert float(libro["bids"][0][0]) < float(libro["asks"][0][0])
+    assert feed_simulado.obtener_mid(coin, 5) == pytest.approx(float(servidor_simulado.exchange.mids()[coin]))
+    # Solo se reciben libros de las monedas suscritas
+    assert feed_simulado.obtener_libro(mercado.simbolos[1], 5) is None
+
+
+def test_libro_obsoleto_vuelve_a_rest(servidor_simulado, feed_simulado, cliente_simulado, monkeypatch):
+    coin = servidor_simulado.exchange.mercado.simbolos[0]
+    contadores = servidor_simulado.exchange.contadores
+    cliente_simulado.feed = feed_simulado
+    feed_simulado.suscribir_l2([coin])
+    esperar(lambda: conexion_suscrita(servidor_simulado, coin))
+    servidor_simulado.difundir_mercado()
+    esperar(lambda: feed_simulado.obtener_libro(coin, 5))
+
+    monkeypatch.setattr(config, "WS_MAX_STALENESS_SEC", 5)
+    libro_ws = cliente_simulado.get_order_book(coin)
+    assert contadores["info.l2Book"] == 0
+
+    # Sin actualizaciones del WebSocket el libro caduca y se pide por REST
+    monkeypatch.setattr(config, "WS_MAX_STALENESS_SEC", 0.05)
+    time.sleep(0.1)
+    libro_rest = cliente_simulado.get_order_book(coin)
+    assert contadores["info.l2Book"] == 1
+    assert libro_rest["bids"][0] == libro_ws["bids"][0] and libro_rest["asks"][0] == libro_ws["asks"][0]
+
+
+def test_reconecta_y_vuelve_a_suscribir(servidor_simulado, feed_simulado):
+    coin = servidor_simulado.exchange.mercado.simbolos[2]
+    feed_simulado.suscribir_l2([coin])
+    anterior = esperar(lambda: conexion_suscrita(servidor_simulado, coin))
+
+    # El servidor cierra la conexión: el feed reconecta y repite sus suscripciones
+    anterior.enviar_trama(0x8, b"")
+    esperar(lambda: not feed_simulado.conectado or anterior not in servidor_simulado.conexiones_ws)
+    nueva = esperar(lambda: conexion_suscrita(servidor_simulado, coin, distinta_de=anterior))
+    assert feed_simulado.esperar_conexion(5)
+    assert nueva.monedas_l2 == {coin}
+
+    servidor_simulado.difundir_mercado()
+    esperar(lambda: feed_simulado.obtener_libro(coin, 5))
+    assert feed_simulado.obtener_mid(coin, 5) is not None
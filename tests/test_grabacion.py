@@ -0,0 +1,41 @@
+import gzip
+
+import pytest
+
+from grabacion import GrabadorSesion, ReproductorSesion
+
+
+def grabar(ruta, n):
+    grabador = GrabadorSesion(str(ruta))
+    for i in range(n):
+        grabador.registrar_http("/info", {"type": "l2Book", "coin": f"C{i % 5}"},
+                                {"coin": f"C{i % 5}", "levels": [[{"px": str(100 + i), "sz": "1.5", "n": 1}], []]})
+        grabador.registrar_ws(f'{{"channel":"allMids","data":{{"mids":{{"C0":"{100 + i}"}}}}}}')
+    return grabador
+
+
+@pytest.mark.parametrize("cerrar", [True, False])
+def test_sesion_comprimida_se_reproduce_completa(tmp_path, cerrar):
+    ruta = tmp_path / "sesion.jsonl.gz"
+    grabador = grabar(ruta, 200)
+    if cerrar:
+        grabador.cerrar()
+    else:
+        # Proceso que muere: el flujo gzip queda sin terminar, pero cada línea ya se volcó
+        grabador._archivo.close()
+
+    reproductor = ReproductorSesion(str(ruta))
+    assert len(reproductor._http) == 200 and len(reproductor._ws) == 200
+    assert reproductor.responder("/info", {"type": "l2Book", "coin": "C0"})["levels"][0][0]["px"] == "100"
+
+
+def test_sesion_comprimida_ocupa_menos_que_un_miembro_por_linea(tmp_path):
+    ruta_gz, ruta_plana = tmp_path / "sesion.jsonl.gz", tmp_path / "sesion.jsonl"
+    grabar(ruta_gz, 300).cerrar()
+    grabar(ruta_plana, 300).cerrar()
+
+    with open(ruta_plana, "rb") as f:
+        un_miembro_por_linea = sum(len(gzip.compress(linea)) for linea in f)
+    assert ruta_gz.stat().st_size < un_miembro_por_linea / 2
+    with gzip.open(ruta_gz, "rb") as f:
+        assert f.read().count(b"\n") == ruta_plana.read_bytes().count(b"\n") == 600
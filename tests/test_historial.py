@@ -0,0 +1,101 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from diario import DiarioEventos
+from historial import HistorialColumnar, LectorCSVIncremental, LectorParquetIncremental
+
+
+class LectorContado(LectorCSVIncremental):
+    """Cuenta las filas que se parsean en cada lectura"""
+
+    def __init__(self, ruta):
+        super().__init__(ruta, self._contar)
+        self.parseadas = []
+
+    def _contar(self, df):
+        self.parseadas.append(len(df))
+        return df
+
+
+def test_lector_csv_solo_parsea_las_filas_nuevas(tmp_path):
+    ruta = tmp_path / "pnl.csv"
+    ruta.write_text("timestamp,symbol,pnl_real\n2024-01-01 00:00:00,BTC,1.5\n2024-01-01 00:01:00,ETH,-0.5\n")
+    lector = LectorContado(str(ruta))
+
+    assert lector.leer()["symbol"].tolist() == ["BTC", "ETH"]
+    assert lector.leer() is lector.leer() and lector.parseadas == [2]
+
+    with open(ruta, "a") as f:
+        f.write("2024-01-01 00:02:00,SOL,2.0\n2024-01-01 00:03:00,DO")
+    df = lector.leer()
+    # La última línea sin salto (escritura en curso) espera a estar completa
+    assert df["symbol"].tolist() == ["BTC", "ETH", "SOL"] and lector.parseadas == [2, 1]
+    assert df["pnl_real"].tolist() == [1.5, -0.5, 2.0]
+
+    with open(ruta, "a") as f:
+        f.write("GE,0.25\n")
+    assert lector.leer()["symbol"].tolist() == ["BTC", "ETH", "SOL", "DOGE"]
+    assert lector.parseadas == [2, 1, 1]
+
+
+def test_lector_csv_relee_si_el_archivo_se_sustituye_o_trunca(tmp_path):
+    ruta = tmp_path / "pnl.csv"
+    ruta.write_text("timestamp,symbol,pnl_real\n2024-01-01 00:00:00,BTC,1.5\n2024-01-01 00:01:00,ETH,-0.5\n")
+    lector = LectorContado(str(ruta))
+    lector.leer()
+
+    # Vista regenerada desde el diario: archivo nuevo (otro inodo) con el mismo tamaño
+    temporal = tmp_path / "pnl.csv.tmp"
+    temporal.write_text("timestamp,symbol,pnl_real\n2024-01-01 00:00:00,XRP,9.5\n2024-01-01 00:01:00,ADA,-9.5\n")
+    os.replace(temporal, ruta)
+    assert lector.leer()["symbol"].tolist() == ["XRP", "ADA"]
+
+    ruta.write_text("timestamp,symbol,pnl_real\n2024-01-01 00:00:00,BTC,1.5\n")
+    assert lector.leer()["symbol"].tolist() == ["BTC"]
+
+    ruta.unlink()
+    assert lector.leer().empty
+    assert lector.parseadas == [2, 2, 1]
+
+
+def escribir_cierres(diario, symbol_fechas):
+    with open(diario.ruta, "ab") as f:
+        for symbol, fecha in symbol_fechas:
+            datos = {"symbol": symbol, "direccion": "BUY", "pnl_real": 1.0, "tiempo_abierto": "0:01:00"}
+            f.write(diario._codificar("cerrada", datos, fecha.timestamp()))
+
+
+def test_lector_parquet_solo_lee_los_archivos_nuevos(tmp_path, monkeypatch):
+    leidos = []
+    leer_archivo = HistorialColumnar._leer_archivo
+    monkeypatch.setattr(HistorialColumnar, "_leer_archivo",
+                        staticmethod(lambda tabla, archivo, *args: leidos.append(archivo) or
+                                     leer_archivo(tabla, archivo, *args)))
+    almacen = HistorialColumnar(str(tmp_path / "historial"))
+    diario = DiarioEventos(str(tmp_path / "eventos.journal"), vistas=[])
+    ayer = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    hoy = ayer + timedelta(days=1)
+    lector = LectorParquetIncremental(almacen, "pnl")
+    assert lector.leer().empty
+
+    escribir_cierres(diario, [("BTC", ayer), ("ETH", ayer + timedelta(minutes=1))])
+    almacen.sincronizar(diario)
+    escribir_cierres(diario, [("SOL", ayer + timedelta(minutes=2)), ("BTC", hoy)])
+    almacen.sincronizar(diario)
+    assert lector.leer()["symbol"].tolist() == ["BTC", "ETH", "SOL", "BTC"]
+    assert len(leidos) == 3
+
+    # Sin cambios no se abre ningún archivo; una parte nueva de hoy es lo único que se lee
+    lector.leer()
+    escribir_cierres(diario, [("ETH", hoy)])
+    almacen.sincronizar(diario)
+    df = lector.leer()
+    assert len(leidos) == 4 and df["symbol"].tolist()[-1] == "ETH"
+
+    # La compactación de ayer sustituye sus partes: solo esa partición se vuelve a leer
+    assert almacen.compactar() == 1
+    df = lector.leer()
+    assert len(leidos) == 5 and "compacto-" in leidos[-1]
+    pd.testing.assert_frame_equal(df, almacen.leer("pnl"))
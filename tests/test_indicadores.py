@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from almacen_velas import AlmacenVelas
+from backtest import ejecutar_backtest
+from indicadores import (
+    calcular_indicadores_incrementales, calcular_indicadores_matriz, comparar_con_pandas
+)
+
+
+def velas_sinteticas(n, semilla=42, simbolos=1):
+    """Paseo aleatorio (símbolos, n, 5) con open, high, low, close, volume"""
+    rng = np.random.default_rng(semilla)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, (simbolos, n)), axis=1))
+    apertura = np.concatenate([close[:, :1], close[:, :-1]], axis=1)
+    high = np.maximum(apertura, close) * (1 + rng.uniform(0, 0.002, (simbolos, n)))
+    low = np.minimum(apertura, close) * (1 - rng.uniform(0, 0.002, (simbolos, n)))
+    volume = rng.lognormal(3, 1, (simbolos, n))
+    return np.stack([apertura, high, low, close, volume], axis=2)
+
+
+def test_motor_coincide_con_pandas():
+    velas = velas_sinteticas(3000)[0]
+    df = pd.DataFrame(velas, columns=['open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = np.arange(len(df)) * 60000
+    for columna, diferencia in comparar_con_pandas(df, vol_mult=1.5).items():
+        assert diferencia < 1e-9, columna
+
+
+def test_motor_coincide_con_matriz():
+    velas = velas_sinteticas(600, simbolos=3)
+    matriz = calcular_indicadores_matriz(velas)
+    incremental = calcular_indicadores_incrementales(velas)
+    for columna, valores in matriz.items():
+        np.testing.assert_allclose(incremental[columna], valores, rtol=0, atol=1e-9, equal_nan=True)
+
+
+def test_backtest_incremental_igual_que_matricial():
+    velas = velas_sinteticas(2000, semilla=7, simbolos=2)
+    timestamps = np.arange(velas.shape[1], dtype=np.int64) * 60000
+    simbolos = ["AAA", "BBB"]
+    parametros = {"breakout_mult": {}, "vol_mult": {}}
+    matricial = ejecutar_backtest(velas, timestamps, simbolos, parametros)
+    incremental = ejecutar_backtest(velas, timestamps, simbolos, parametros, incremental=True)
+    pd.testing.assert_frame_equal(matricial, incremental)
+
+
+class ClienteVelas:
+    """Sirve velas sintéticas de 1m hasta 'cursor' (la última es la vela en formación)"""
+
+    def __init__(self, velas, fin_ms):
+        self.velas = velas
+        self.timestamps = fin_ms - (len(velas) - 1 - np.arange(len(velas))) * 60000
+        self.cursor = len(velas) // 2
+
+    def get_ohlcv(self, symbol, interval, limit=None, start_time=None):
+        hasta = self.cursor + 1
+        desde = max(0, hasta - limit) if start_time is None else int(np.searchsorted(self.timestamps, start_time))
+        return [{"timestamp": int(self.timestamps[i]), "open": v[0], "high": v[1], "low": v[2],
+                 "close": v[3], "volume": v[4]} for i, v in zip(range(desde, hasta), self.velas[desde:hasta])]
+
+
+def test_almacen_alimenta_el_motor_al_cerrar_vela():
+    velas = velas_sinteticas(300)[0]
+    ahora = int(time.time() * 1000) // 60000 * 60000
+    # La vela 156 (la última que se llega a servir) es la del minuto actual
+    cliente = ClienteVelas(velas, ahora + (300 - 1 - 156) * 60000)
+    cliente.cursor = 150
+    almacen = AlmacenVelas(cliente, capacidad=100)
+    cierres = []
+    almacen.agregar_oyente_cierre(lambda symbol, interval: cierres.append(symbol))
+
+    assert almacen.actualizar("BTC")
+    for paso in (1, 3, 0, 2):
+        cliente.cursor += paso
+        assert almacen.actualizar("BTC")
+        array = almacen.obtener_array("BTC")
+        esperado = calcular_indicadores_matriz(array[None, :, 1:])
+        obtenido = almacen.indicadores("BTC")
+        for columna in ('atr', 'prev_max', 'prev_min', 'vol_rolling', 'atr_media'):
+            assert obtenido[columna] == pytest.approx(esperado[columna][0, -1], abs=1e-9), columna
+    # Descarga inicial y tres actualizaciones con velas nuevas (la de paso 0 no cierra ninguna)
+    assert cierres == ["BTC"] * 4
@@ -0,0 +1,32 @@
+import pytest
+
+
+
+def test_tp_agrupado_se_identifica_y_cancela_por_cloid(servidor_simulado, cliente_simulado):
+    exchange = servidor_simulado.exchange
+    coin = exchange.mercado.simbolos[0]
+    reglas = exchange.mercado.reglas[coin]
+    mid = exchange.mercado.precios[coin]
+    tamano = reglas.redondear_tamano(200 / mid)
+    tp = reglas.redondear_precio(mid * 1.5)
+
+    resultado = cliente_simulado.abrir_con_tp(coin, "buy", tamano, tp, precio_referencia=mid)
+
+    assert resultado["entrada"]["estado"] == "filled"
+    # El exchange responde el TP hijo sin oid; el cliente lo recupera por su cloid
+    assert resultado["tp"]["estado"] == "waitingForTrigger"
+    assert resultado["tp"]["cloid"].startswith("0x")
+    orden_tp = exchange.ordenes[resultado["tp"]["oid"]]
+    assert orden_tp["cloid"] == resultado["tp"]["cloid"] and orden_tp["estado"] == "triggerPending"
+
+    respuesta = cliente_simulado.cancel_order(coin, cloid=resultado["tp"]["cloid"])
+    assert respuesta["response"]["data"]["statuses"] == ["success"]
+    assert orden_tp["estado"] == "canceled"
+
+
+def test_precio_agresivo_usa_las_reglas_del_activo(servidor_simulado, cliente_simulado):
+    coin = servidor_simulado.exchange.mercado.simbolos[1]
+    reglas = servidor_simulado.exchange.mercado.reglas[coin]
+    mid = 123.456789
+    assert cliente_simulado.precio_agresivo(coin, True, 0.05, mid) == reglas.redondear_precio(mid * 1.05)
+    assert cliente_simulado.precio_agresivo(coin, False, 0.05, mid) == pytest.approx(reglas.redondear_precio(mid * 0.95))
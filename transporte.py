@@ -0,0 +1,115 @@
+# transporte.py
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+
+class Transporte:
+    """
+    Sesión HTTP compartida (keep-alive) para el SDK de Hyperliquid y Telegram.
+
+    Un único requests.Session con pool de conexiones por host y timeouts de
+    conexión/lectura: tras la primera petición a cada host las siguientes
+    reutilizan la conexión TLS abierta. 'estadisticas' indica por host cuántas
+    peticiones se han hecho y cuántas conexiones nuevas han hecho falta.
+    """
+
+    def __init__(self, tamano_pool=None, hosts_pool=None, timeout_conexion=None, timeout_lectura=None):
+        self.timeout = (timeout_conexion or config.HTTP_TIMEOUT_CONEXION,
+                        timeout_lectura or config.HTTP_TIMEOUT_LECTURA)
+        self.adapter = HTTPAdapter(pool_connections=hosts_pool or config.HTTP_POOL_HOSTS,
+                                   pool_maxsize=tamano_pool or config.HTTP_POOL_SIZE)
+        # Sin cabecera Content-Type fija: json= y data= ponen la suya
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.hooks["response"].append(self._registrar)
+
+        self._lock = threading.Lock()
+        self._tiempos = {}   # host -> [peticiones, segundos acumulados]
+        self._rutas = {}     # (host, ruta) -> [peticiones, segundos acumulados, máximo]
+
+    def _registrar(self, respuesta, *args, **kwargs):
+        url = urlsplit(respuesta.url)
+        segundos = respuesta.elapsed.total_seconds()
+        with self._lock:
+            registro = self._tiempos.setdefault(url.hostname, [0, 0.0])
+            registro[0] += 1
+            registro[1] += segundos
+            ruta = self._rutas.setdefault((url.hostname, url.path), [0, 0.0, 0.0])
+            ruta[0] += 1
+            ruta[1] += segundos
+            ruta[2] = max(ruta[2], segundos)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def adoptar(self, api):
+        """Hace que un objeto API del SDK (Info, Exchange) use la sesión y los timeouts compartidos"""
+        api.session = self.session
+        api.timeout = self.timeout
+        return api
+
+    def estadisticas(self):
+        """
+        Reutilización de conexiones por host
+
+        Returns:
+            dict: host -> {'peticiones', 'conexiones_nuevas', 'reutilizadas', 'latencia_media_ms'}
+        """
+        # urllib3 cuenta en cada pool las conexiones abiertas (num_connections) y las peticiones (num_requests)
+        conexiones = {}
+        pools = self.adapter.poolmanager.pools
+        for clave in list(pools.keys()):
+            pool = pools.get(clave)
+            if pool is not None:
+                conexiones[pool.host] = conexiones.get(pool.host, 0) + pool.num_connections
+
+        with self._lock:
+            tiempos = {host: list(registro) for host, registro in self._tiempos.items()}
+
+        resultado = {}
+        for host, (peticiones, segundos) in tiempos.items():
+            nuevas = conexiones.get(host, 0)
+            resultado[host] = {
+                "peticiones": peticiones,
+                "conexiones_nuevas": nuevas,
+                "reutilizadas": max(peticiones - nuevas, 0),
+                "latencia_media_ms": 1000 * segundos / peticiones if peticiones else 0.0,
+            }
+        return resultado
+
+    def latencias_por_ruta(self):
+        """
+        Latencia por endpoint (p.ej. /info frente a /exchange, la latencia de las órdenes)
+
+        Returns:
+            dict: 'host/ruta' -> {'peticiones', 'latencia_media_ms', 'latencia_max_ms'}
+        """
+        with self._lock:
+            rutas = {clave: list(registro) for clave, registro in self._rutas.items()}
+        return {f"{host}{ruta}": {"peticiones": n, "latencia_media_ms": 1000 * s / n if n else 0.0,
+                                  "latencia_max_ms": 1000 * m}
+                for (host, ruta), (n, s, m) in rutas.items()}
+
+
+_transporte = None
+_lock_transporte = threading.Lock()
+
+
+def obtener_transporte():
+    """Transporte compartido por todo el proceso"""
+    global _transporte
+    with _lock_transporte:
+        if _transporte is None:
+            _transporte = Transporte()
+        return _transporte
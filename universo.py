@@ -0,0 +1,89 @@
+# universo.py
+import json
+import os
+import time
+import logging
+
+ARCHIVO_UNIVERSO = "universo.json"
+
+
+def descubrir_universo(client):
+    """
+    Enumera todos los perpetuos listados con una llamada metaAndAssetCtxs y otra allMids
+
+    Returns:
+        list: Diccionarios {'symbol', 'indice', 'sz_decimals', 'max_leverage', 'volumen_24h',
+              'open_interest', 'mid'} ordenados por volumen diario (mayor liquidez primero)
+    """
+    meta, contextos = client.get_meta_y_contextos()
+    mids = client.get_all_mids()
+
+    activos = []
+    for indice, (activo, ctx) in enumerate(zip(meta["universe"], contextos)):
+        if activo.get("isDelisted"):
+            continue
+        symbol = activo["name"]
+        mid = mids.get(symbol)
+        if mid is None and ctx.get("midPx") is not None:
+            mid = float(ctx["midPx"])
+        precio_marca = float(ctx.get("markPx") or mid or 0)
+        activos.append({
+            "symbol": symbol,
+            "indice": indice,
+            "sz_decimals": int(activo["szDecimals"]),
+            "max_leverage": int(activo.get("maxLeverage", 0)),
+            "volumen_24h": float(ctx.get("dayNtlVlm") or 0),
+            # openInterest viene en unidades del activo: se pasa a USD para poder comparar
+            "open_interest": float(ctx.get("openInterest") or 0) * precio_marca,
+            "mid": mid,
+        })
+
+    activos.sort(key=lambda a: (a["volumen_24h"], a["open_interest"]), reverse=True)
+    return activos
+
+
+def guardar_universo(activos, ruta=ARCHIVO_UNIVERSO):
+    try:
+        with open(ruta, "w") as f:
+            json.dump({"timestamp": time.time(), "activos": activos}, f, indent=2)
+    except Exception as e:
+        logging.error(f"Error guardando {ruta}: {e}")
+
+
+def cargar_universo(ruta=ARCHIVO_UNIVERSO, max_antiguedad=None):
+    """Devuelve los activos guardados en disco, o None si no existen o superan 'max_antiguedad' segundos"""
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, "r") as f:
+            datos = json.load(f)
+    except Exception as e:
+        logging.error(f"Error leyendo {ruta}: {e}")
+        return None
+    if max_antiguedad is not None and time.time() - datos.get("timestamp", 0) > max_antiguedad:
+        return None
+    return datos.get("activos")
+
+
+def seleccionar_simbolos(activos, max_simbolos, min_volumen=0.0):
+    """Los 'max_simbolos' perpetuos más líquidos con precio y volumen diario mínimo"""
+    return [a["symbol"] for a in activos
+            if a["mid"] is not None and a["volumen_24h"] >= min_volumen][:max_simbolos]
+
+
+def obtener_universo(client, max_antiguedad, ruta=ARCHIVO_UNIVERSO):
+    """
+    Universo de perpetuos desde la caché en disco si es reciente; si no, lo descubre y lo guarda.
+    Si la API falla se recurre a la última caché aunque esté caducada.
+    """
+    activos = cargar_universo(ruta, max_antiguedad)
+    if activos is not None:
+        return activos
+    try:
+        activos = descubrir_universo(client)
+        guardar_universo(activos, ruta)
+        return activos
+    except Exception as e:
+        print(f"Error descubriendo el universo de perpetuos: {e}")
+        logging.error(f"Error descubriendo el universo de perpetuos: {e}", exc_info=True)
+        return cargar_universo(ruta) or []